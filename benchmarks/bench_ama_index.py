@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+"""
+Compares the time taken to save a large synthetic `ama_index` via the original path and via `bulk_save_ama_index`.
+- legacy_save: The original path. A Python loop swaps each `url` for its `url_id`, then `executemany` runs with default pragmas.
+- bulk_save: Streams records, swapping in url_ids on the fly, into `bulk_save_ama_index`.
+
+Usage: python benchmarks/bench_ama_index.py [num_records]
+"""
+
+from ama_archiver import indexer
+
+from pathlib import Path
+import sqlite3
+import sys
+import tempfile
+import time
+
+def make_records(num_records: int) -> list:
+    """
+    Returns `num_records` synthetic compendium records, with full URLs, spread over 4 cc_names.
+    """
+    url_prefix = "https://www.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/star_vs_the_forces_of_evil_ask_me_anything/"
+    return [
+        {"cc_name": "cc_name%d" % (recordno % 4), "fan_name": "fan_name%d" % recordno, "url": url_prefix + "e%06x/" % recordno}
+        for recordno in range(num_records)
+    ]
+
+def legacy_save(records: list, full_dbpath: Path) -> None:
+    """
+    Saves `records` the way `make_ama_index` and `save_ama_index` originally did.
+    """
+    for ama_record in records:
+        url_id = indexer.get_urlid(ama_record.pop("url"))
+        ama_record["url_id"] = url_id
+    with sqlite3.connect(full_dbpath) as cnxn:
+        crs = cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_index(
+                cc_name TEXT NOT NULL,
+                fan_name TEXT NOT NULL,
+                url_id TEXT NOT NULL
+            );
+            """)
+        crs.executemany("INSERT INTO ama_index VALUES(:cc_name, :fan_name, :url_id);", records)
+        cnxn.execute("CREATE INDEX IF NOT EXISTS ama_index_url_id ON ama_index(url_id);")
+
+def bulk_save(records: list, full_dbpath: Path) -> None:
+    """
+    Saves `records` by streaming them into `bulk_save_ama_index`.
+    """
+    def iter_records():
+        for ama_record in records:
+            ama_record["url_id"] = indexer.get_urlid(ama_record.pop("url"))
+            yield ama_record
+    indexer.bulk_save_ama_index(iter_records(), full_dbpath)
+
+def main(num_records: int) -> None:
+    """
+    Times each path on a fresh database, best of three, and prints the results.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, save in (("legacy_save", legacy_save), ("bulk_save", bulk_save)):
+            timings = []
+            for runno in range(3):
+                full_dbpath = Path(tmp_dir, "%s-%d.db" % (name, runno))
+                records = make_records(num_records)
+                start = time.perf_counter()
+                save(records, full_dbpath)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            print("%-12s %8d records  %7.3fs  %10.0f records/s" % (name, num_records, best, num_records / best))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
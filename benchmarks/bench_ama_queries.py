@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""
+Compares the file size and full-scan read throughput of `ama_queries` stored as plain TEXT and compressed by `codec`.
+- make_ama_queries: Returns a synthetic corpus of Q&A records, with the vocabulary and phrasing repeats of a real AMA.
+- time_full_scan: Times `scraper.load_ama_queries_from_db`, which decodes every value.
+- time_length_scan: Times a scan of url_ids and text lengths via `codec.text_length_sql`, which decodes nothing.
+
+Usage: python benchmarks/bench_ama_queries.py [num_records]
+"""
+
+from ama_archiver import codec, scraper
+
+from pathlib import Path
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+PHRASES = (
+    "What was your favourite episode to work on", "Star vs. the Forces of Evil", "Thank you so much for", "the Blood Moon Ball",
+    "I always wondered why", "when you were writing", "Marco and Star", "Glossaryck", "Mewni", "the Butterfly family",
+    "Honestly, I think", "that's a great question!", "we talked about it in the writers' room", "season four", "Eclipsa",
+    "it was never planned", "the storyboard artists", "Ludo", "Tom", "Moon the Undaunted", "the wand", "Earth",
+    )
+
+def make_ama_queries(num_records: int) -> list:
+    """
+    Returns `num_records` synthetic ama_query records, generated from a fixed seed.
+    """
+    rng = random.Random(0)
+    def make_text(min_phrases: int, max_phrases: int) -> str:
+        return " ".join(rng.choice(PHRASES) for _ in range(rng.randint(min_phrases, max_phrases))) + rng.choice("?.!")
+    return [
+        {"url_id": "e%06x" % recordno, "question_text": make_text(4, 20), "answer_text": make_text(2, 40)}
+        for recordno in range(num_records)
+    ]
+
+def time_full_scan(full_dbpath: Path) -> float:
+    """
+    Returns the time taken by the fastest of three full scans of `full_dbpath`.
+    """
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        scraper.load_ama_queries_from_db(full_dbpath)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def time_length_scan(full_dbpath: Path) -> float:
+    """
+    Returns the time taken by the fastest of three scans of the url_id and text lengths of every record.
+    """
+    query = "SELECT url_id, %s, %s FROM ama_queries;" % (codec.text_length_sql("question_text"), codec.text_length_sql("answer_text"))
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        with sqlite3.connect(full_dbpath) as cnxn:
+            cnxn.execute(query).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main(num_records: int) -> None:
+    """
+    Saves the same corpus twice, compresses one copy, and prints the size and scan time of each.
+    """
+    ama_queries = make_ama_queries(num_records)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        plain_dbpath = Path(tmp_dir, "plain.db")
+        compressed_dbpath = Path(tmp_dir, "compressed.db")
+        for full_dbpath in (plain_dbpath, compressed_dbpath):
+            scraper.save_ama_queries_to_db(ama_queries, full_dbpath)
+        start = time.perf_counter()
+        codec.compress_ama_queries(compressed_dbpath)
+        print("compressing took %.3fs" % (time.perf_counter() - start))
+        for name, full_dbpath in (("plain", plain_dbpath), ("compressed", compressed_dbpath)):
+            size = full_dbpath.stat().st_size
+            best = time_full_scan(full_dbpath)
+            print("%-12s %8d records  %10d bytes  %7.3fs  %10.0f records/s" % (name, num_records, size, best, num_records / best))
+            print("%-12s lengths only                      %7.3fs" % (name, time_length_scan(full_dbpath)))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -14,3 +14,5 @@ except PackageNotFoundError:  # pragma: no cover
     __version__ = "unknown"
 finally:
     del version, PackageNotFoundError
+
+from ama_archiver.lookup import lookup_url_id, lookup_ama_records, lookup_ama_query, clear_lookup_cache, get_url  # noqa: E402, F401
@@ -2,13 +2,32 @@
 """
 Defines functions to compile the Reddit SVTFOE AMA session.
 - make_ama_index: Scrapes index from web, reports duplicates, and saves to database.
+- refresh_ama_index: Re-scrapes the index from web, and applies only what changed to the database.
 - validate_urls: Checks database for duplicates in `url_id` column.
+- audit_ama_queries: Flags empty and misattributed records in `ama_queries`.
+- requeue_flagged_queries: Removes the records that the last audit flagged as misparsed, so they are fetched again.
+- plan_ama_queries: Collapses the index to the unique `url_id`s that have yet to be fetched.
 - make_ama_queries: Scrapes web for `question_text` and `answer_text`
+- make_ama_queries_json: Fetches `question_text` and `answer_text` in batches from Reddit's JSON endpoints.
+- make_ama_queries_snapshot: Resolves `question_text` and `answer_text` from one snapshot of the whole AMA thread.
+- make_ama_queries_pipelined: Scrapes `question_text` and `answer_text` with overlapping fetch, parse and save stages.
+- recheck_ama_queries: Re-polls stale records, and records revisions of those that were edited.
+- make_ama_stats: Creates the `ama_stats` summary table, which triggers keep current from then on.
+- make_ama_search: Creates the `ama_search` full-text index, which triggers keep current from then on.
+- make_ama_names: Creates the `ama_names` trigram index of fan and creator names, which triggers keep current from then on.
+- find_near_duplicates: Signs new questions, and reports the questions that were asked again under another url_id.
+- compress_ama_queries: Compresses `question_text` and `answer_text` in place, against a dictionary trained on them.
+- serve_archive: Serves the database as read-only JSON over HTTP.
+- snapshot_archive: Takes a consistent copy of the database, even mid-crawl, and a compacted read-only copy for serving.
+- make_metadata: Generates the '{METADATA_DIRNAME}' directory from `ama_index`.
+- verify_metadata: Reports where the '{METADATA_DIRNAME}' directory has drifted from `ama_index`.
 """
 
 # TODO: Implement dataclasses where applicable.
 
-from ama_archiver import indexer, scraper, constants
+from ama_archiver import indexer, scraper, snapshot, recheck, pipeline, exporter, stats, search, server, codec, neardup, backup, audit, constants
+
+import requests as r
 
 from pathlib import Path
 import logging
@@ -16,6 +35,7 @@ from typing import List
 import sqlite3
 
 FULL_DBPATH = Path(constants.ODIR_NAME, constants.AMA_DBNAME + ".db")
+RAW_PACKPATH = Path(constants.ODIR_NAME, constants.RAW_PACK_FNAME + ".pack")
 
 def make_ama_index() -> None:
     """
@@ -23,9 +43,10 @@ def make_ama_index() -> None:
 
     1. Checks if '{ODIR_NAME}/{LC_FNAME}.html' exists.
     -  If not, it scrapes it off the web, and saves it.
-    2. Compiles `ama_index` from output.
+    2. Streams the records of the compendium, with the url_id corrections in URL_REMAPS applied, into `ama_index`
+       in '{ODIR_NAME}/{LC_DBNAME}.db', unless it already exists.
     3. Reports the number of duplicate records.
-    4. Saves `ama_index` to '{ODIR_NAME}/{LC_DBNAME}.db'
+    4. Saves `ama_remaps` to '{ODIR_NAME}/{LC_DBNAME}.db'
     """
     lc_dirpath = Path(constants.ODIR_NAME)
     lc_filepath = lc_dirpath.joinpath(constants.LC_FNAME + ".html")
@@ -34,12 +55,32 @@ def make_ama_index() -> None:
         raw_index = indexer.fetch_raw_index(constants.LC_URL)
         indexer.save_raw_index(raw_index, lc_dirpath, constants.LC_FNAME + ".html")
     raw_index = lc_filepath.read_text()
+    url_remaps = [dict(zip(("cc_name", "fan_name", "url_id", "new_url_id"), remap)) for remap in constants.URL_REMAPS]
+    # parse -> normalize -> remap -> insert, one record at a time
+    ama_records = indexer.iter_ama_records(raw_index, constants.FIRST_CC_NAME + ":", constants.THREAD_ID)
+    indexer.save_ama_index(indexer.iter_url_remaps(ama_records, url_remaps), FULL_DBPATH)
+    indexer.identify_duplicates(indexer.load_ama_index(FULL_DBPATH))
+    indexer.save_url_remaps(constants.URL_REMAPS, FULL_DBPATH)
+
+def refresh_ama_index() -> None:
+    """
+    Refreshes `ama_index` in '{ODIR_NAME}/{LC_DBNAME}.db' without discarding `ama_queries`.
+
+    1. Scrapes the raw index off the web, and saves it over '{ODIR_NAME}/{LC_FNAME}.html'.
+    2. Compiles `ama_index` from output, and applies the url_id corrections in `ama_remaps`.
+    3. Diffs it against the stored `ama_index`, and applies the difference.
+    4. Reports the new `url_id`s; `make_ama_queries` will fetch only these.
+    """
+    lc_dirpath = Path(constants.ODIR_NAME)
+    raw_index = indexer.fetch_raw_index(constants.LC_URL)
+    indexer.save_raw_index(raw_index, lc_dirpath, constants.LC_FNAME + ".html")
     ama_index = indexer.compile_ama_index(raw_index, constants.FIRST_CC_NAME + ":")
-    for ama_record in ama_index:
-        url_id = indexer.get_urlid(ama_record.pop("url"))
-        ama_record["url_id"] = url_id
-    indexer.identify_duplicates(ama_index)
-    indexer.save_ama_index(ama_index, FULL_DBPATH)
+    malformed_records = indexer.normalize_ama_index(ama_index, constants.THREAD_ID)
+    logging.info("%d record(s) with malformed URLs left out of `ama_index`.", len(malformed_records))
+    indexer.save_url_remaps(constants.URL_REMAPS, FULL_DBPATH)
+    indexer.apply_url_remaps(ama_index, indexer.load_url_remaps(FULL_DBPATH))
+    new_urls = indexer.refresh_ama_index(ama_index, FULL_DBPATH)
+    logging.info("%d new url_id(s) to scrape: %r", len(new_urls), new_urls)
 
 def validate_urls() -> None:
     """
@@ -57,42 +98,223 @@ def validate_urls() -> None:
     else:
         logging.info("No duplicates found!")
 
-def make_ama_queries() -> None:
+def audit_ama_queries() -> None:
     """
-    Pings Reddit, and scrapes for `question_text` and `answer_text`
+    Audits every record in '{ODIR_NAME}/{LC_DBNAME}.db' against its page in '{ODIR_NAME}/{RAW_PACK_FNAME}.pack'.
 
-    1. Fetches list of `ama_queries` records fetched so far.
-    2. Fetches list of `ama_index` records to iterate over.
-    3. For each `ama_record`, fetch and save.
+    1. Checks for empty texts, answers not written by the cc_name's account, and texts that do not match the cached page.
+    2. Saves the flags to `ama_flags`, and logs each one. No record is changed; see `requeue_flagged_queries`.
     """
+    pack_path = RAW_PACKPATH if RAW_PACKPATH.exists() else None
+    for ama_flag in audit.audit_ama_queries(FULL_DBPATH, pack_path):
+        logging.info("Flagged %r: %s %s", ama_flag["url_id"], ama_flag["flag"], ama_flag["detail"] or "")
+
+def requeue_flagged_queries() -> None:
+    """
+    Removes the records that `audit_ama_queries` flagged with one of audit.REQUEUE_FLAGS from '{ODIR_NAME}/{LC_DBNAME}.db',
+    so that `plan_ama_queries` schedules them again.
+    """
+    audit.requeue_flagged_queries(FULL_DBPATH)
+
+def plan_ama_queries() -> dict:
+    """
+    Returns {url_id: [ama_record, ...]} for every `url_id` in `ama_index` that has yet to be fetched.
+
+    1. Applies the url_id corrections in `ama_remaps` to the stored `ama_index`.
+    2. Collapses `ama_index` to unique `url_id`s, skipping those already in `ama_queries`.
+    """
+    indexer.remap_ama_index(FULL_DBPATH)
     ama_index = indexer.load_ama_index(FULL_DBPATH)
     ama_queries = scraper.load_ama_queries_from_db(FULL_DBPATH)
     queried_urls = set(row["url_id"] for row in ama_queries)
-    num_records = len(ama_index)
+    return indexer.plan_ama_queries(ama_index, queried_urls)
+
+def make_ama_queries() -> None:
+    """
+    Pings Reddit, and scrapes for `question_text` and `answer_text`
+
+    1. Fetches list of `ama_queries` records fetched so far.
+    2. Collapses `ama_index` to the unique `url_id`s that have yet to be fetched.
+    3. For each `url_id`, fetch once and save; the saved record serves every `ama_record` that references it.
+    -  The details of both comments (`ama_details`) come from the same parse, and are saved alongside.
+    """
+    fetch_plan = plan_ama_queries()
+    num_urls = len(fetch_plan)
     num_pings = 0
-    for recordno, ama_record in enumerate(ama_index, start=1):
-        url_id = ama_record["url_id"]
-        if url_id in queried_urls:
-            continue
+    for urlno, (url_id, ama_records) in enumerate(fetch_plan.items(), start=1):
         ama_query = {}
+        ama_details = {}
         url = indexer.get_url(url_id)
-        cc_name = ama_record["cc_name"]
-        fan_name = ama_record["fan_name"]
-        logging.info("Fetching record %d/%d: {cc_name: %s, fan_name: %s}", recordno, num_records, cc_name, fan_name)
+        fan_names = [(ama_record["cc_name"], ama_record["fan_name"]) for ama_record in ama_records]
+        logging.info("Fetching url_id %d/%d: %s, for (cc_name, fan_name): %r", urlno, num_urls, url_id, fan_names)
         attempt_no = 1
         while set(ama_query) != {"question_text", "answer_text"}:
             try:
-                scraper.fetch_ama_query(url, ama_query)
+                scraper.fetch_ama_query(url, ama_query, ama_details)
             except r.exceptions.ConnectionError:
                 logging.info("Max number of Reddit pings reached for today. Number of pings: %d. Terminating...", num_pings)
             logging.info("Tried to fetch record. Attempt: %d", attempt_no)
             attempt_no += 1
             num_pings += 1
         ama_query["url_id"] = url_id
+        ama_details["url_id"] = url_id
         scraper.save_ama_query_to_db(ama_query, FULL_DBPATH)
-        queried_urls.add(url_id)
+        scraper.save_ama_details_to_db([ama_details], FULL_DBPATH)
     logging.info("All Q&A records successfully scraped. Find output in %r", FULL_DBPATH)
 
+def make_ama_queries_json() -> None:
+    """
+    Fetches `question_text` and `answer_text` from Reddit's JSON endpoints, API_BATCH_SIZE records per request.
+
+    1. Fetches list of `ama_queries` records fetched so far.
+    2. Collects the unique `url_id`s in `ama_index` that have yet to be fetched.
+    3. For each batch of `url_id`s, fetch and save, along with `ama_details`.
+    """
+    pending_urls = list(plan_ama_queries())
+    batch_size = constants.API_BATCH_SIZE
+    for start in range(0, len(pending_urls), batch_size):
+        batch = pending_urls[start:start + batch_size]
+        logging.info("Fetching records %d-%d/%d", start + 1, start + len(batch), len(pending_urls))
+        ama_details = []
+        ama_queries = scraper.fetch_ama_queries_json(batch, ama_details)
+        scraper.save_ama_queries_to_db(ama_queries, FULL_DBPATH)
+        scraper.save_ama_details_to_db(ama_details, FULL_DBPATH)
+    logging.info("All Q&A records successfully fetched. Find output in %r", FULL_DBPATH)
+
+def make_ama_queries_snapshot() -> None:
+    """
+    Resolves `question_text` and `answer_text` for every record from a snapshot of the AMA thread.
+
+    1. Checks if '{ODIR_NAME}/{SNAPSHOT_FNAME}.json' exists.
+    -  If not, it fetches the full comment tree of OG_URL, and saves it.
+    2. Collects the unique `url_id`s in `ama_index` that have yet to be fetched.
+    3. Resolves them from the snapshot, and saves them along with `ama_details`.
+    """
+    snapshot_path = Path(constants.ODIR_NAME, constants.SNAPSHOT_FNAME + ".json")
+    if not snapshot_path.exists():
+        logging.info("%s does not exist. Fetching comment tree from web.", snapshot_path)
+        comments = snapshot.fetch_thread_snapshot(constants.OG_URL)
+        snapshot.save_snapshot(comments, snapshot_path)
+    comments = snapshot.load_snapshot(snapshot_path)
+    pending_urls = list(plan_ama_queries())
+    ama_details = []
+    ama_queries = snapshot.resolve_ama_queries(comments, pending_urls, ama_details)
+    scraper.save_ama_queries_to_db(ama_queries, FULL_DBPATH)
+    scraper.save_ama_details_to_db(ama_details, FULL_DBPATH)
+    logging.info("%d/%d Q&A record(s) resolved from snapshot. Find output in %r", len(ama_queries), len(pending_urls), FULL_DBPATH)
+
+def make_ama_queries_pipelined() -> None:
+    """
+    Scrapes `question_text` and `answer_text` like `make_ama_queries`, but fetches, parses and saves concurrently.
+
+    1. Collects the unique `url_id`s in `ama_index` that have yet to be fetched.
+    2. Runs them through the pipeline. Ctrl-C stops fetching, and saves what was already fetched.
+    3. Keeps the raw HTML of every saved record in '{ODIR_NAME}/{RAW_PACK_FNAME}.pack'.
+    """
+    pending_urls = list(plan_ama_queries())
+    pipeline.make_ama_queries_pipeline(pending_urls, FULL_DBPATH, RAW_PACKPATH)
+
+def recheck_ama_queries() -> None:
+    """
+    Re-polls records last fetched more than RECHECK_INTERVAL seconds ago, and records revisions for any that changed.
+
+    1. Registers `ama_queries` records that have never been checked.
+    2. Selects up to RECHECK_LIMIT stale `url_id`s, previously edited ones first.
+    3. Fetches them in batches from Reddit's JSON endpoints, and compares content hashes.
+    4. Refreshes their `ama_details`, e.g. scores, from the same responses.
+    """
+    recheck.init_ama_checks(FULL_DBPATH)
+    stale_urls = recheck.select_stale_urls(FULL_DBPATH, constants.RECHECK_INTERVAL, constants.RECHECK_LIMIT)
+    logging.info("%d record(s) due for a recheck.", len(stale_urls))
+    num_changed = 0
+    ama_details = []
+    for ama_query in scraper.fetch_ama_queries_json(stale_urls, ama_details):
+        num_changed += recheck.record_ama_check(ama_query, FULL_DBPATH)
+    scraper.save_ama_details_to_db(ama_details, FULL_DBPATH)
+    logging.info("%d/%d rechecked record(s) changed.", num_changed, len(stale_urls))
+
+def make_ama_stats() -> None:
+    """
+    Creates `ama_stats` in '{ODIR_NAME}/{LC_DBNAME}.db', and logs it. Print it any time with `python -m ama_archiver.stats`.
+    """
+    stats.create_ama_stats(FULL_DBPATH)
+    for cc_stats in stats.load_ama_stats(FULL_DBPATH):
+        logging.info("%r", cc_stats)
+
+def make_ama_search() -> None:
+    """
+    Creates `ama_search` in '{ODIR_NAME}/{LC_DBNAME}.db', for the query server's /search route.
+    """
+    search.create_ama_search(FULL_DBPATH)
+
+def find_near_duplicates() -> None:
+    """
+    Reports pairs of near-identical questions in '{ODIR_NAME}/{LC_DBNAME}.db', with the records that reference them.
+
+    1. Creates `ama_minhash` on first use; afterwards, only signs questions that are new or were edited.
+    2. Logs each pair whose similarity reaches NEARDUP_THRESHOLD, most similar first.
+    """
+    with sqlite3.connect(FULL_DBPATH) as cnxn:
+        has_minhash = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_minhash';").fetchone()
+    if has_minhash:
+        neardup.update_ama_minhash(FULL_DBPATH)
+    else:
+        neardup.create_ama_minhash(FULL_DBPATH)
+    ama_index = indexer.load_ama_index(FULL_DBPATH)
+    fan_names = {}
+    for ama_record in ama_index:
+        fan_names.setdefault(ama_record["url_id"], []).append((ama_record["cc_name"], ama_record["fan_name"]))
+    for indexno, near_duplicate in enumerate(neardup.find_near_duplicates(FULL_DBPATH), start=1):
+        logging.info(
+            "near-duplicate %d found (%.2f): %r %r ~ %r %r", indexno, near_duplicate["similarity"],
+            near_duplicate["url_id"], fan_names.get(near_duplicate["url_id"]),
+            near_duplicate["other_url_id"], fan_names.get(near_duplicate["other_url_id"]),
+            )
+
+def compress_ama_queries() -> None:
+    """
+    Compresses `ama_queries` in '{ODIR_NAME}/{LC_DBNAME}.db' in place, to save space at the cost of slower reads.
+    Loaders decompress transparently; undo with `codec.decompress_ama_queries`.
+    """
+    text_size, stored_size = codec.compress_ama_queries(FULL_DBPATH)
+    logging.info("`ama_queries` text stored in %.1f%% of its size.", 100 * stored_size / text_size if text_size else 100)
+
+def make_ama_names() -> None:
+    """
+    Creates `ama_names` in '{ODIR_NAME}/{LC_DBNAME}.db', for fuzzy name lookups and the query server's /names and /fans routes.
+    """
+    search.create_ama_names(FULL_DBPATH)
+
+def serve_archive() -> None:
+    """
+    Serves '{ODIR_NAME}/{LC_DBNAME}.db' on http://{SERVER_HOST}:{SERVER_PORT}/ until interrupted.
+    """
+    server.serve(FULL_DBPATH)
+
+def snapshot_archive() -> None:
+    """
+    Backs up '{ODIR_NAME}/{LC_DBNAME}.db' into '{ODIR_NAME}/{BACKUP_DIRNAME}/', and compacts the backup into a
+    read-only copy. Safe to run while a crawl writes to the database; see `python -m ama_archiver.backup`.
+    """
+    backup_path = Path(constants.ODIR_NAME, constants.BACKUP_DIRNAME, constants.AMA_DBNAME + ".db")
+    compact_path = backup_path.with_name(constants.AMA_DBNAME + "-compact.db")
+    backup.snapshot_database(FULL_DBPATH, backup_path, compact_path)
+
+def make_metadata() -> None:
+    """
+    Generates '{METADATA_DIRNAME}/{cc_name}.txt' for every content-creator, plus 'filenames.txt' and the 'filenames/' copy.
+    """
+    exporter.export_metadata(FULL_DBPATH, Path(constants.METADATA_DIRNAME))
+
+def verify_metadata() -> None:
+    """
+    Compares the '{METADATA_DIRNAME}' directory against `ama_index`, and reports whether they differ.
+    """
+    diff_lines = exporter.verify_metadata(FULL_DBPATH, Path(constants.METADATA_DIRNAME))
+    if diff_lines:
+        raise Exception("%r is out of sync with %r" % (constants.METADATA_DIRNAME, FULL_DBPATH))
+    logging.info("%r is in sync with %r", constants.METADATA_DIRNAME, FULL_DBPATH)
+
 def make_filetree() -> None:
     """
     Creates file tree of the form: output/ama_text/{cc_name}/{fan_name}/{question,answer,url_id}.txt
@@ -107,7 +329,9 @@ def make_filetree() -> None:
     value_fields = ("url_id", "question_text", "answer_text")
     with sqlite3.connect(FULL_DBPATH) as cnxn:
         cnxn.row_factory = sqlite3.Row
+        zdict = codec.load_zdict(cnxn)
         for row in cnxn.execute(select_all):
+            row = codec.decode_ama_query(dict(row), zdict)
             cc_path = root_path.joinpath(row['cc_name'])
             cc_path.mkdir(exist_ok=True)
             fan_path = cc_path.joinpath(row['fan_name'])
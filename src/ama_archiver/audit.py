@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+"""
+This module audits scraped Q&A records, and flags those that look empty or misattributed for re-fetching.
+- audit_ama_queries: Checks every `ama_queries` record, and saves what it finds to `ama_flags`.
+- load_ama_flags: Loads the `ama_flags` table.
+- requeue_flagged_queries: Removes records with page-verifiable flags from `ama_queries`, so the next fetch plans them again.
+- _audit_page: Checks one record against its cached page. Runs in a worker process.
+- _audit_pages: Checks a chunk of records against the pack file. Runs in a worker process.
+
+Flags, one row per (url_id, flag):
+- empty_question, empty_answer: The stored text is empty.
+- missing_page: No page is cached in the pack file for the url_id, e.g. it was not fetched by the pipeline. Never requeued.
+- answer_not_on_page: The cached page has no comment with the url_id.
+- answer_mismatch: The stored answer is not the text of the comment with the url_id.
+- question_mismatch: The stored question is not the text of that comment's parent.
+- question_after_answer: The stored question appears after the stored answer on the page.
+- author_mismatch: The answer was not written by the account that wrote most answers for the same cc_name.
+  A guess, which refetching cannot settle, so not requeued by default.
+
+Auditing only writes `ama_flags`; requeuing is a separate step.
+"""
+
+from ama_archiver.constants import AUDIT_WORKERS, AUDIT_CHUNK_SIZE
+from ama_archiver.scraper import load_ama_queries_from_db, load_ama_details_from_db
+from ama_archiver.rawstore import iter_raw_pages
+
+from bs4 import BeautifulSoup
+
+from pathlib import Path
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import logging
+import sqlite3
+import time
+
+# how much of a mismatching text to keep in `ama_flags.detail`
+DETAIL_LENGTH = 200
+# flags that a fresh fetch and parse of the page can clear
+REQUEUE_FLAGS = ("empty_question", "empty_answer", "answer_not_on_page", "answer_mismatch", "question_mismatch")
+
+def _audit_page(raw_page: str, url_id: str, question_text: str, answer_text: str) -> Tuple[List[Tuple[str, Optional[str]]], Optional[str]]:
+    """
+    Checks a stored record against the comment page it was parsed from, and returns ([(flag, detail), ...], answer_author).
+
+    - raw_page: HTML of the comment page.
+    - url_id: url_id of the answer.
+    - question_text: Stored `question_text`.
+    - answer_text: Stored `answer_text`.
+    """
+    soup = BeautifulSoup(raw_page, "html.parser")
+    flags = []
+    page_texts = [body.text.strip() for body in soup.find_all(class_="usertext-body")]
+    if question_text and answer_text and question_text in page_texts and answer_text in page_texts:
+        if page_texts.index(question_text) > page_texts.index(answer_text):
+            flags.append(("question_after_answer", None))
+    answer_thing = soup.find(attrs={"data-fullname": "t1_" + url_id})
+    if answer_thing is None:
+        flags.append(("answer_not_on_page", None))
+        return flags, None
+    # a comment's own body comes before the bodies of its replies
+    answer_body = answer_thing.find(class_="usertext-body")
+    if answer_body is None or answer_body.text.strip() != answer_text:
+        flags.append(("answer_mismatch", answer_body.text.strip()[:DETAIL_LENGTH] if answer_body else None))
+    question_thing = answer_thing.find_parent(class_="thing")
+    question_body = question_thing.find(class_="usertext-body") if question_thing is not None else None
+    if question_body is None or question_body.text.strip() != question_text:
+        flags.append(("question_mismatch", question_body.text.strip()[:DETAIL_LENGTH] if question_body else None))
+    return flags, answer_thing.get("data-author")
+
+def _audit_pages(pack_path: Path, ama_queries: List[dict]) -> Dict[str, Tuple[List[Tuple[str, Optional[str]]], Optional[str]]]:
+    """
+    Runs `_audit_page` for each of `ama_queries` whose page is in `pack_path`, and returns the results by url_id.
+    Records without a page are flagged 'missing_page'.
+
+    - pack_path: Pack file of raw pages, as written by the pipeline.
+    - ama_queries: Chunk of records to check.
+    """
+    # each worker maps the pack once per chunk, and reads only the pages it checks
+    queries = {ama_query["url_id"]: ama_query for ama_query in ama_queries}
+    results = {}
+    for url_id, raw_page in iter_raw_pages(pack_path, list(queries)):
+        results[url_id] = _audit_page(raw_page, url_id, queries[url_id]["question_text"], queries[url_id]["answer_text"])
+    for url_id in queries:
+        if url_id not in results:
+            results[url_id] = ([("missing_page", None)], None)
+    return results
+
+def audit_ama_queries(
+        full_dbpath: Path,
+        pack_path: Optional[Path] = None,
+        max_workers: int = AUDIT_WORKERS,
+        executor: Optional[Executor] = None,
+        ) -> List[dict]:
+    """
+    Checks every record in `ama_queries`, replaces `ama_flags` with the flags found, and returns them as
+    [{'url_id': ..., 'flag': ..., 'detail': ...}, ...].
+
+    Text checks run in this process. If `pack_path` is given, the cached pages are checked in chunks of
+    AUDIT_CHUNK_SIZE records across a process pool. Answer authors come from the pages, or else from `ama_details`.
+
+    - full_dbpath: Tells function where the database file is.
+    - pack_path: Pack file of raw pages; page checks are skipped if None.
+    - max_workers: Number of processes in the pool.
+    - executor: Executor to check pages in; defaults to a pool of `max_workers` processes.
+    """
+    ama_queries = load_ama_queries_from_db(full_dbpath)
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cc_names = {}
+        for cc_name, url_id in cnxn.execute("SELECT cc_name, url_id FROM ama_index;"):
+            cc_names.setdefault(url_id, set()).add(cc_name)
+    authors = {ama_details["url_id"]: ama_details["answer_author"] for ama_details in load_ama_details_from_db(full_dbpath)}
+    flags = []
+    for ama_query in ama_queries:
+        for field, flag in (("question_text", "empty_question"), ("answer_text", "empty_answer")):
+            if not ama_query[field].strip():
+                flags.append((ama_query["url_id"], flag, None))
+    if pack_path is not None:
+        if not pack_path.exists():
+            raise FileNotFoundError("Pack file of raw pages not found: %s" % pack_path)
+        chunks = [ama_queries[start:start + AUDIT_CHUNK_SIZE] for start in range(0, len(ama_queries), AUDIT_CHUNK_SIZE)]
+        owns_executor = executor is None
+        if owns_executor:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            for results in executor.map(_audit_pages, [pack_path] * len(chunks), chunks):
+                for url_id, (page_flags, author) in results.items():
+                    flags.extend((url_id, flag, detail) for flag, detail in page_flags)
+                    if author is not None:
+                        authors[url_id] = author
+        finally:
+            if owns_executor:
+                executor.shutdown()
+    # a creator's account is the one that wrote most of the answers filed under their cc_name
+    author_counts = {}
+    for url_id, author in authors.items():
+        for cc_name in cc_names.get(url_id, ()):
+            author_counts.setdefault(cc_name, Counter())[author] += 1
+    cc_authors = {cc_name: counts.most_common(1)[0][0] for cc_name, counts in author_counts.items()}
+    for url_id, author in sorted(authors.items()):
+        expected_authors = set(cc_authors[cc_name] for cc_name in cc_names.get(url_id, ()))
+        if expected_authors and author not in expected_authors:
+            flags.append((url_id, "author_mismatch", "%s, expected %s" % (author, " or ".join(sorted(expected_authors)))))
+    flagged_at = time.time()
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_flags(
+                url_id TEXT NOT NULL,
+                flag TEXT NOT NULL,
+                detail TEXT,
+                flagged_at REAL NOT NULL,
+                PRIMARY KEY(url_id, flag)
+            );
+            """)
+        cnxn.execute("DELETE FROM ama_flags;")
+        cnxn.executemany("INSERT INTO ama_flags VALUES(?, ?, ?, ?);", [flag + (flagged_at,) for flag in flags])
+    logging.info("Audited %d record(s) in %s: %d flag(s) raised.", len(ama_queries), full_dbpath, len(flags))
+    return [dict(zip(("url_id", "flag", "detail"), flag)) for flag in sorted(flags)]
+
+def load_ama_flags(full_dbpath: Path) -> List[dict]:
+    """
+    Loads 'ama_flags' table from `full_dbpath` into List[dict]; empty if no audit was run.
+
+    - full_dbpath: Tells function where to find `ama_flags`
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        has_flags = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_flags';").fetchone()
+        if not has_flags:
+            return []
+        cnxn.row_factory = sqlite3.Row
+        res = cnxn.execute("SELECT url_id, flag, detail, flagged_at FROM ama_flags ORDER BY url_id, flag;")
+        ama_flags = [dict(row) for row in res.fetchall()]
+    return ama_flags
+
+def requeue_flagged_queries(full_dbpath: Path, flags: Tuple[str, ...] = REQUEUE_FLAGS) -> List[str]:
+    """
+    Removes the records flagged with any of `flags` from `ama_queries` (and their `ama_details` and `ama_checks`),
+    so that the next fetch plans them again, and returns their url_ids. Their flags stay in `ama_flags` until the next audit.
+
+    - full_dbpath: Tells function where the database file is.
+    - flags: Only requeue records with one of these flags; 'missing_page' is refused, as refetching records from
+      other backends would not add their pages to the pack.
+    """
+    if "missing_page" in flags:
+        raise ValueError("Records flagged 'missing_page' are not requeued.")
+    with sqlite3.connect(full_dbpath) as cnxn:
+        has_flags = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_flags';").fetchone()
+        if not has_flags or not flags:
+            return []
+        res = cnxn.execute(
+            "SELECT DISTINCT url_id FROM ama_flags WHERE flag IN (%s) ORDER BY url_id;" % ", ".join("?" * len(flags)),
+            flags,
+            )
+        url_ids = [row[0] for row in res.fetchall()]
+        tables = [row[0] for row in cnxn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('ama_details', 'ama_checks');")]
+        for table in ["ama_queries"] + tables:
+            cnxn.executemany("DELETE FROM %s WHERE url_id = ?;" % table, [(url_id,) for url_id in url_ids])
+    logging.info("Requeued %d flagged record(s) in %s", len(url_ids), full_dbpath)
+    return url_ids
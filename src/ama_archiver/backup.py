@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+"""
+This module takes consistent copies of the database while a crawl is still writing to it.
+- backup_database: Copies a database with SQLite's online backup API, a few pages at a time, and reports throughput.
+- compact_database: Writes a vacuumed, read-only copy of a database, for serving.
+- snapshot_database: Backs up a database, and optionally compacts the backup.
+- main: Snapshots '{ODIR_NAME}/{AMA_DBNAME}.db' into '{ODIR_NAME}/{BACKUP_DIRNAME}/'.
+
+Copying the file itself can catch a transaction half-written. The backup API copies pages under a read lock,
+which it releases between steps of BACKUP_PAGE_STEP pages, so the crawl's writer waits for one step at most.
+If the writer changes the database mid-backup, SQLite restarts the copy, so the result is always consistent.
+"""
+
+from ama_archiver import constants
+from ama_archiver.constants import BACKUP_PAGE_STEP
+
+from pathlib import Path
+from contextlib import closing
+from typing import List, Optional
+import logging
+import os
+import sqlite3
+import stat
+import sys
+import time
+
+def backup_database(full_dbpath: Path, backup_path: Path, pages: int = BACKUP_PAGE_STEP) -> dict:
+    """
+    Copies `full_dbpath` to `backup_path` with the online backup API, and returns
+    {'pages': ..., 'size': ..., 'seconds': ..., 'bytes_per_second': ...}.
+
+    The copy is written next to `backup_path` and renamed into place once complete, so `backup_path` is never torn.
+
+    - full_dbpath: Tells function where the database file is; it may be written to meanwhile.
+    - backup_path: Where to write the copy; replaced if it exists.
+    - pages: Number of pages copied per step; the source is only locked during a step.
+    """
+    partial_path = backup_path.with_name(backup_path.name + ".partial")
+    partial_path.unlink(missing_ok=True)
+    backup_path.parent.mkdir(parents=True, exist_ok=True)
+    progress = {"total": 0, "num_steps": 0}
+    def report_progress(status: int, remaining: int, total: int) -> None:
+        progress["total"] = total
+        progress["num_steps"] += 1
+        logging.debug("Backed up %d/%d page(s) of %s", total - remaining, total, full_dbpath)
+    start = time.perf_counter()
+    with closing(sqlite3.connect(full_dbpath.resolve().as_uri() + "?mode=ro", uri=True)) as source_cnxn:
+        with closing(sqlite3.connect(partial_path)) as backup_cnxn:
+            source_cnxn.backup(backup_cnxn, pages=pages, progress=report_progress)
+            page_size = backup_cnxn.execute("PRAGMA page_size;").fetchone()[0]
+            num_pages = backup_cnxn.execute("PRAGMA page_count;").fetchone()[0]
+    os.replace(partial_path, backup_path)
+    seconds = time.perf_counter() - start
+    size = num_pages * page_size
+    report = {"pages": num_pages, "size": size, "seconds": seconds, "bytes_per_second": size / seconds if seconds else 0.0}
+    logging.info(
+        "Backed up %s to %s: %d page(s), %d byte(s) in %.3fs over %d step(s) (%.1f MB/s)",
+        full_dbpath, backup_path, num_pages, size, seconds, progress["num_steps"], report["bytes_per_second"] / 1e6,
+        )
+    return report
+
+def compact_database(full_dbpath: Path, compact_path: Path) -> int:
+    """
+    Writes a vacuumed copy of `full_dbpath` to `compact_path`, makes it read-only, and returns its size in bytes.
+
+    VACUUM INTO reads the whole source in one transaction; run it on a backup rather than on a database being crawled into.
+
+    - full_dbpath: Tells function where the database file is.
+    - compact_path: Where to write the compacted copy; replaced if it exists.
+    """
+    if compact_path.exists():
+        compact_path.chmod(stat.S_IRUSR | stat.S_IWUSR)
+        compact_path.unlink()
+    with closing(sqlite3.connect(full_dbpath)) as cnxn:
+        cnxn.execute("VACUUM INTO ?;", (str(compact_path),))
+    compact_path.chmod(stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    size = compact_path.stat().st_size
+    logging.info("Compacted %s into %s: %d -> %d byte(s)", full_dbpath, compact_path, full_dbpath.stat().st_size, size)
+    return size
+
+def snapshot_database(full_dbpath: Path, backup_path: Path, compact_path: Optional[Path] = None) -> dict:
+    """
+    Backs up `full_dbpath` to `backup_path`, then, if `compact_path` is given, compacts the backup into it.
+    Returns the report of `backup_database`, with `compact_size` added if compacted.
+
+    - full_dbpath: Tells function where the database file is; it may be written to meanwhile.
+    - backup_path: Where to write the backup.
+    - compact_path: Where to write a vacuumed, read-only copy of the backup, e.g. for `server.serve`.
+    """
+    report = backup_database(full_dbpath, backup_path)
+    if compact_path is not None:
+        report["compact_size"] = compact_database(backup_path, compact_path)
+    return report
+
+def main(argv: List[str]) -> None:
+    """
+    Snapshots '{ODIR_NAME}/{AMA_DBNAME}.db' into '{ODIR_NAME}/{BACKUP_DIRNAME}/{AMA_DBNAME}-{timestamp}.db', and prints the report.
+
+    - argv: ['--compact'] to also write '{AMA_DBNAME}-{timestamp}-compact.db' next to it.
+    """
+    full_dbpath = Path(constants.ODIR_NAME, constants.AMA_DBNAME + ".db")
+    backup_stem = "%s-%s" % (constants.AMA_DBNAME, time.strftime("%Y%m%d-%H%M%S"))
+    backup_dirpath = Path(constants.ODIR_NAME, constants.BACKUP_DIRNAME)
+    compact_path = backup_dirpath.joinpath(backup_stem + "-compact.db") if "--compact" in argv else None
+    report = snapshot_database(full_dbpath, backup_dirpath.joinpath(backup_stem + ".db"), compact_path)
+    for field, value in report.items():
+        print("%s\t%s" % (field, "%.3f" % value if isinstance(value, float) else value))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
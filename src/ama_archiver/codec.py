@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+"""
+This module defines the optional compressed storage of `question_text` and `answer_text` in `ama_queries`.
+Compressed values are stored in place as BLOBs, deflated against a preset dictionary trained on the corpus and kept in `ama_zdict`.
+Uncompressed values stay TEXT, so a table may mix both; `typeof()` tells them apart.
+- train_zdict: Builds a preset dictionary from the substrings that recur most across a corpus.
+- encode_text: Compresses one value, if that makes it smaller.
+- decode_text: Returns the text of a stored value, compressed or not.
+- decode_ama_query: Decodes the text fields of an ama_query in place.
+- load_zdict: Loads the dictionary from `ama_zdict`, if the database has one.
+- compress_ama_queries: Trains a dictionary on `ama_queries`, and compresses every value in place.
+- decompress_ama_queries: Restores every value to TEXT, and drops `ama_zdict`.
+- text_length_sql: Returns an SQL expression for the length in characters of a stored value, compressed or not.
+- _prime: Returns a compressor and a decompressor already loaded with a dictionary, to be copied per value.
+
+A compressed value is b'{length}:' followed by the raw deflate stream, where `length` is the length of the text in characters.
+The prefix lets SQL (e.g. the `ama_stats` triggers) measure a value without decompressing it. Empty strings are never
+compressed, so `answer_text = ''` holds for compressed databases too.
+
+Compression saves space, not time, for anything that reads the text: loaders decompress every value, so a full scan
+that returns texts is about 3x slower than on plain TEXT (see benchmarks/bench_ama_queries.py). Scans that only need
+url_ids and lengths, via `text_length_sql`, decompress nothing, and are no slower.
+"""
+
+from ama_archiver.constants import ZDICT_SIZE
+
+from pathlib import Path
+from collections import Counter
+from typing import Iterable, Optional, Tuple, Union
+import functools
+import logging
+import re
+import sqlite3
+import zlib
+
+COMPRESSION_LEVEL = 9
+# raw deflate: the length prefix already marks a value as compressed, so the zlib header and checksum are dead weight
+WBITS = -15
+
+def train_zdict(texts: Iterable[str], zdict_size: int = ZDICT_SIZE) -> bytes:
+    """
+    Returns a preset dictionary of at most `zdict_size` bytes, made of the runs of one to three words that save the
+    most bytes across `texts`. The most valuable runs come last, where deflate reaches them with the shortest distances.
+
+    - texts: Corpus to train on.
+    - zdict_size: Maximum size of the dictionary; deflate cannot look back further than 32 KiB.
+    """
+    counts = Counter()
+    for text in texts:
+        words = re.findall(r"\S+\s*", text)
+        for num_words in (1, 2, 3):
+            counts.update("".join(words[wordno:wordno + num_words]) for wordno in range(len(words) - num_words + 1))
+    scored = sorted(((count - 1) * len(run.encode("utf-8")), run) for run, count in counts.items() if count > 1)
+    runs = []
+    size = 0
+    for score, run in reversed(scored):
+        encoded = run.encode("utf-8")
+        if size + len(encoded) > zdict_size:
+            continue
+        runs.append(encoded)
+        size += len(encoded)
+    return b"".join(reversed(runs))
+
+@functools.lru_cache(maxsize=4)
+def _prime(zdict: bytes) -> Tuple["zlib._Compress", "zlib._Decompress"]:
+    """
+    Returns (compressor, decompressor) loaded with `zdict`. Copying them is cheaper than loading `zdict` for every value.
+
+    - zdict: Preset dictionary, as returned by `train_zdict`.
+    """
+    return zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, WBITS, zdict=zdict), zlib.decompressobj(WBITS, zdict=zdict)
+
+def encode_text(text: str, zdict: bytes) -> Union[str, bytes]:
+    """
+    Returns `text` compressed against `zdict`, or `text` itself if compressing it would not make it smaller.
+
+    - text: Value of `question_text` or `answer_text`.
+    - zdict: Preset dictionary, as returned by `train_zdict`.
+    """
+    if not text:
+        return text
+    compressor = _prime(zdict)[0].copy()
+    value = b"%d:" % len(text) + compressor.compress(text.encode("utf-8")) + compressor.flush()
+    if len(value) >= len(text.encode("utf-8")):
+        return text
+    return value
+
+def decode_text(value: Union[str, bytes], zdict: Optional[bytes]) -> str:
+    """
+    Returns the text of `value`, decompressing it if it is a BLOB.
+
+    - value: Value of `question_text` or `answer_text` as stored.
+    - zdict: Dictionary the database was compressed with, from `load_zdict`.
+    """
+    if isinstance(value, str):
+        return value
+    if zdict is None:
+        raise ValueError("Compressed value found, but the database has no `ama_zdict`.")
+    _, data = value.split(b":", 1)
+    decompressor = _prime(zdict)[1].copy()
+    return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+
+def decode_ama_query(ama_query: dict, zdict: Optional[bytes]) -> dict:
+    """
+    Decodes `question_text` and `answer_text` of `ama_query` in place, and returns it.
+
+    - ama_query: dict with `question_text` and `answer_text` as stored.
+    - zdict: Dictionary the database was compressed with, from `load_zdict`.
+    """
+    for field in ("question_text", "answer_text"):
+        ama_query[field] = decode_text(ama_query[field], zdict)
+    return ama_query
+
+def load_zdict(cnxn: sqlite3.Connection) -> Optional[bytes]:
+    """
+    Returns the dictionary stored in `ama_zdict`, or None if the database was never compressed.
+
+    - cnxn: Open connection to the database.
+    """
+    has_zdict = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_zdict';").fetchone()
+    if not has_zdict:
+        return None
+    row = cnxn.execute("SELECT zdict FROM ama_zdict WHERE zdict_id = 1;").fetchone()
+    return row[0] if row else None
+
+def _load_texts(cnxn: sqlite3.Connection) -> list:
+    """
+    Returns every row of `ama_queries` as (url_id, question_text, answer_text), decoded.
+
+    - cnxn: Open connection to the database.
+    """
+    zdict = load_zdict(cnxn)
+    res = cnxn.execute("SELECT url_id, question_text, answer_text FROM ama_queries;")
+    return [(url_id, decode_text(question, zdict), decode_text(answer, zdict)) for url_id, question, answer in res]
+
+def compress_ama_queries(full_dbpath: Path, zdict_size: int = ZDICT_SIZE, vacuum: bool = True) -> Tuple[int, int]:
+    """
+    Trains a dictionary on every value in `ama_queries`, compresses the values against it in place, and returns the
+    total size of the values as (text bytes, stored bytes).
+
+    Safe to call again, e.g. after more records were scraped; the dictionary is retrained each time.
+    This shrinks the database, but slows every read that returns the texts, which must be decompressed.
+
+    - full_dbpath: Tells function where the database file is.
+    - zdict_size: Maximum size of the dictionary.
+    - vacuum: Whether to VACUUM afterwards, so the file itself shrinks.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_zdict(
+                zdict_id INTEGER PRIMARY KEY CHECK (zdict_id = 1),
+                zdict BLOB NOT NULL
+            );
+            """)
+        rows = _load_texts(cnxn)
+        zdict = train_zdict((text for _, question, answer in rows for text in (question, answer)), zdict_size)
+        cnxn.execute("INSERT OR REPLACE INTO ama_zdict VALUES(1, ?);", (zdict,))
+        encoded_rows = [(encode_text(question, zdict), encode_text(answer, zdict), url_id) for url_id, question, answer in rows]
+        cnxn.executemany("UPDATE ama_queries SET question_text = ?, answer_text = ? WHERE url_id = ?;", encoded_rows)
+    if vacuum:
+        with sqlite3.connect(full_dbpath, isolation_level=None) as cnxn:
+            cnxn.execute("VACUUM;")
+    text_size = sum(len(text.encode("utf-8")) for _, question, answer in rows for text in (question, answer))
+    stored_size = sum(len(value) if isinstance(value, bytes) else len(value.encode("utf-8")) for row in encoded_rows for value in row[:2])
+    logging.info("Compressed `ama_queries` in %s: %d -> %d byte(s), with a %d-byte dictionary.", full_dbpath, text_size, stored_size, len(zdict))
+    return text_size, stored_size
+
+def decompress_ama_queries(full_dbpath: Path) -> None:
+    """
+    Restores every value in `ama_queries` to TEXT, and drops `ama_zdict`.
+
+    - full_dbpath: Tells function where the database file is.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        rows = _load_texts(cnxn)
+        cnxn.executemany("UPDATE ama_queries SET question_text = ?, answer_text = ? WHERE url_id = ?;", [(question, answer, url_id) for url_id, question, answer in rows])
+        cnxn.execute("DROP TABLE IF EXISTS ama_zdict;")
+    logging.info("Decompressed `ama_queries` in %s", full_dbpath)
+
+def text_length_sql(column: str) -> str:
+    """
+    Returns an SQL expression for the length in characters of `column`, read from the prefix if it is compressed.
+
+    - column: Column expression, e.g. 'NEW.answer_text'.
+    """
+    return (
+        "(CASE typeof({0}) WHEN 'blob' THEN CAST(substr({0}, 1, instr({0}, X'3A') - 1) AS INTEGER) ELSE length({0}) END)"
+        .format(column)
+        )
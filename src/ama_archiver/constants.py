@@ -6,8 +6,43 @@ This module defines constants for web-scraping and saving.
 - LC_FNAME: The filename that will contain the scraped HTML.
 - LC_DBNAME: The database filename that will contain the scraped Q&A data.
 - ODIR_NAME: The name of the directory where all data will be stored.
+- API_INFO_URL: The JSON endpoint that returns comment data for a batch of fullnames.
+- API_BATCH_SIZE: The maximum number of fullnames Reddit accepts per request to API_INFO_URL.
+- USER_AGENT: The User-Agent header sent to Reddit's JSON endpoints.
+- MORECHILDREN_URL: The JSON endpoint that expands "load more comments" stubs.
+- THREAD_ID: The id of the AMA thread at OG_URL.
+- SNAPSHOT_FNAME: The filename that will contain the snapshot of the AMA thread's comment tree.
+- RECHECK_INTERVAL: The number of seconds after which a scraped record is due to be re-polled.
+- RECHECK_LIMIT: The maximum number of records re-polled per run.
+- PIPELINE_FETCHERS: The number of pages fetched concurrently by the pipeline.
+- PIPELINE_PARSERS: The number of processes parsing HTML in the pipeline.
+- PIPELINE_QUEUE_SIZE: The maximum number of items waiting between two pipeline stages.
+- PIPELINE_BATCH_SIZE: The number of records the pipeline writes to the database per transaction.
+- RAW_PACK_FNAME: The filename of the pack file that will contain the raw HTML of each comment page.
+- METADATA_DIRNAME: The name of the directory that lists the fans each content-creator answered.
+- SERVER_HOST: The interface the query server listens on.
+- SERVER_PORT: The port the query server listens on.
+- SERVER_POOL_SIZE: The number of read-only database connections the query server keeps open.
+- SERVER_CACHE_SIZE: The maximum number of responses the query server caches.
+- SERVER_PAGE_SIZE: The maximum number of records the query server returns per page.
+- URL_PREFIX: The part of an old-Reddit comment URL that precedes the url_id; precomputed from URL_TEMPLATE.
+- URL_SUFFIX: The part of an old-Reddit comment URL that follows the url_id; precomputed from URL_TEMPLATE.
+- LOOKUP_CACHE_SIZE: The maximum number of url_ids whose records are kept in the lookup cache.
+- URL_REMAPS: Corrections to compendium links, as (cc_name, fan_name, url_id, new_url_id).
+- URL_PATTERN: Matches a link to a Reddit thread or comment, capturing `thread_id` and `comment_id`.
+- ZDICT_SIZE: The maximum size in bytes of the dictionary that compressed `ama_queries` are deflated against.
+- MINHASH_NUM_PERM: The number of hash permutations in the MinHash signature of a question.
+- LSH_BANDS: The number of bands a MinHash signature is split into for bucketing; must divide MINHASH_NUM_PERM.
+- SHINGLE_SIZE: The number of characters per shingle when comparing questions.
+- NEARDUP_THRESHOLD: The estimated similarity from which two questions count as near-duplicates.
+- BACKUP_DIRNAME: The name of the directory, under ODIR_NAME, that holds snapshots of the database.
+- BACKUP_PAGE_STEP: The number of database pages copied per step of an online backup.
+- AUDIT_WORKERS: The number of processes checking stored records against their cached pages.
+- AUDIT_CHUNK_SIZE: The number of records each audit worker checks per task.
 """
 
+import re
+
 FIRST_CC_NAME = "Daron Nefcy"
 OG_URL = "https://www.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/star_vs_the_forces_of_evil_ask_me_anything/"
 LC_URL = "https://old.reddit.com/r/StarVStheForcesofEvil/comments/clnrdv/link_compendium_of_questions_and_answers_from_the/"
@@ -16,4 +51,46 @@ AMA_DBNAME = "ama_database"
 ODIR_NAME = "output"
 FILETREE_NAME = "ama_text"
 URL_TEMPLATE = tuple("https://www.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/star_vs_the_forces_of_evil_ask_me_anything//?context=3".split("/"))
-
+API_INFO_URL = "https://old.reddit.com/api/info.json"
+API_BATCH_SIZE = 100
+USER_AGENT = "ama_archiver/0.1 (SVTFOE AMA archiver)"
+MORECHILDREN_URL = "https://old.reddit.com/api/morechildren.json"
+THREAD_ID = "cll9u5"
+SNAPSHOT_FNAME = "ama_snapshot"
+RECHECK_INTERVAL = 7 * 24 * 60 * 60
+RECHECK_LIMIT = 500
+PIPELINE_FETCHERS = 4
+PIPELINE_PARSERS = 2
+PIPELINE_QUEUE_SIZE = 64
+PIPELINE_BATCH_SIZE = 50
+RAW_PACK_FNAME = "raw_pages"
+METADATA_DIRNAME = "metadata"
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+SERVER_POOL_SIZE = 4
+SERVER_CACHE_SIZE = 1024
+SERVER_PAGE_SIZE = 50
+URL_PREFIX = "/".join(URL_TEMPLATE[:-2]).replace("www.reddit.com", "old.reddit.com") + "/"
+URL_SUFFIX = "/" + URL_TEMPLATE[-1]
+LOOKUP_CACHE_SIZE = 4096
+# Both pairs pointed at the same comment; see indexer.identify_duplicates.
+URL_REMAPS = (
+    ("Daron Nefcy", "Joe_Zt", "evw8mcl", "evw8g9o"),
+    ("Adam McArthur", "sloppyjeaux", "evwbcnk", "evwbgza"),
+)
+URL_PATTERN = re.compile(
+    r"(?:https?://)?(?:[\w-]+\.)?reddit\.com"
+    r"/r/\w+/comments/(?P<thread_id>[a-z0-9]+)"
+    r"(?:/[^/?#]*(?:/(?P<comment_id>[a-z0-9]+))?)?"
+    r"/?(?:[?#].*)?$",
+    re.IGNORECASE,
+)
+ZDICT_SIZE = 32 * 1024
+MINHASH_NUM_PERM = 128
+LSH_BANDS = 32
+SHINGLE_SIZE = 5
+NEARDUP_THRESHOLD = 0.7
+BACKUP_DIRNAME = "backups"
+BACKUP_PAGE_STEP = 256
+AUDIT_WORKERS = 4
+AUDIT_CHUNK_SIZE = 100
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""
+This module defines functions that generate the metadata directory from `ama_index`.
+Each content-creator gets '{cc_name}.txt', which lists the fans they answered; repeat questions are annotated, e.g. 'Joe_Zt (again again)'.
+'filenames.txt' lists the files in the directory, and 'filenames/' holds a copy of all of them.
+- annotate_repeat: Returns a fan_name annotated with the number of times it was already listed.
+- iter_fan_listings: Streams (cc_name, [fan_name, ...]) listings from `ama_index` in a single query.
+- compile_metadata: Compiles the contents of every metadata file as {filename: text}.
+- export_metadata: Writes the metadata directory.
+- verify_metadata: Compares the metadata directory against the database, and returns the differences.
+- _get_sort_key: Returns the key that orders fan_names as the metadata files list them.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+import difflib
+import itertools
+import logging
+import sqlite3
+
+FILENAMES_FNAME = "filenames"
+
+def _get_sort_key(fan_name: str, repeat: int) -> Tuple[str, int]:
+    """
+    Returns the key that orders fan_names case-insensitively, ignoring leading/trailing underscores, with repeats last.
+
+    - fan_name: fan_name as stored in `ama_index`.
+    - repeat: Number of times `fan_name` was already listed for the same cc_name.
+    """
+    return (fan_name.casefold().strip("_"), repeat)
+
+def annotate_repeat(fan_name: str, repeat: int) -> str:
+    """
+    Returns `fan_name`, annotated with one 'again' per repeat; e.g. ('Joe_Zt', 2) -> 'Joe_Zt (again again)'.
+
+    - fan_name: fan_name as stored in `ama_index`.
+    - repeat: Number of times `fan_name` was already listed for the same cc_name.
+    """
+    if not repeat:
+        return fan_name
+    return "%s (%s)" % (fan_name, " ".join(["again"] * repeat))
+
+def iter_fan_listings(full_dbpath: Path) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Streams (cc_name, fan_names) from `ama_index`, one cc_name at a time, with fan_names sorted and annotated.
+
+    - full_dbpath: Tells function where to find `ama_index`.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("CREATE INDEX IF NOT EXISTS ama_index_cc_name ON ama_index(cc_name, fan_name);")
+        res = cnxn.execute("SELECT cc_name, fan_name FROM ama_index ORDER BY cc_name, fan_name;")
+        for cc_name, rows in itertools.groupby(res, key=lambda row: row[0]):
+            fan_names = []
+            for fan_name, fan_rows in itertools.groupby(fan_name for _, fan_name in rows):
+                for repeat, _ in enumerate(fan_rows):
+                    fan_names.append((_get_sort_key(fan_name, repeat), annotate_repeat(fan_name, repeat)))
+            fan_names.sort()
+            yield cc_name, [fan_name for _, fan_name in fan_names]
+
+def compile_metadata(full_dbpath: Path) -> Dict[str, str]:
+    """
+    Compiles the contents of every file in the metadata directory, and returns them as {filename: text}.
+
+    - full_dbpath: Tells function where to find `ama_index`.
+    """
+    metadata = {}
+    for cc_name, fan_names in iter_fan_listings(full_dbpath):
+        metadata[cc_name + ".txt"] = "\n".join(fan_names) + "\n"
+    filenames = sorted(list(metadata) + [FILENAMES_FNAME + ".txt"])
+    metadata[FILENAMES_FNAME + ".txt"] = "\n".join(filenames) + "\n"
+    return metadata
+
+def export_metadata(full_dbpath: Path, metadata_path: Path) -> None:
+    """
+    Writes every metadata file into `metadata_path`, and a copy into '{metadata_path}/filenames/'.
+
+    - full_dbpath: Tells function where to find `ama_index`.
+    - metadata_path: Path of the metadata directory; created if it does not exist.
+    """
+    metadata = compile_metadata(full_dbpath)
+    for dir_path in (metadata_path, metadata_path.joinpath(FILENAMES_FNAME)):
+        dir_path.mkdir(parents=True, exist_ok=True)
+        for filename, text in metadata.items():
+            dir_path.joinpath(filename).write_text(text)
+    logging.info("Wrote %d metadata file(s) to %s", len(metadata), metadata_path)
+
+def verify_metadata(full_dbpath: Path, metadata_path: Path) -> List[str]:
+    """
+    Compares the files in `metadata_path` (and its 'filenames/' copy) against `ama_index`, and returns the
+    differences as unified-diff lines. An empty list means the directory is in sync with the database.
+
+    - full_dbpath: Tells function where to find `ama_index`.
+    - metadata_path: Path of the metadata directory.
+    """
+    metadata = compile_metadata(full_dbpath)
+    diff_lines = []
+    for dir_path in (metadata_path, metadata_path.joinpath(FILENAMES_FNAME)):
+        stale_files = set(path.name for path in dir_path.glob("*.txt")) - set(metadata)
+        for filename in sorted(stale_files):
+            diff_lines.append("Only in %s: %s\n" % (dir_path, filename))
+        for filename, text in metadata.items():
+            file_path = dir_path.joinpath(filename)
+            actual = file_path.read_text() if file_path.exists() else ""
+            diff_lines.extend(difflib.unified_diff(
+                actual.splitlines(keepends=True),
+                text.splitlines(keepends=True),
+                fromfile=str(file_path),
+                tofile="ama_index:" + filename,
+                ))
+    for line in diff_lines:
+        logging.info(line.rstrip("\n"))
+    return diff_lines
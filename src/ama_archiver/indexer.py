@@ -3,22 +3,38 @@
 This module defines functions that will help compile and validate an index for the Q&A session exchanges.
 - fetch_raw_index: Fetches HTML from the link-compendium URL, and returns it as a str.
 - save_raw_index: Saves the raw index into the specified output file.
+- iter_ama_index: Yields the records of the Q&A index one at a time.
 - compile_ama_index: Compiles the Q&A index into a list of dict objects.
 - save_ama_index: Saves a Q&A index into a database file. 
+- bulk_save_ama_index: Streams Q&A records into a database file in one transaction, with load-time pragmas.
+- iter_ama_records: Yields Q&A records with their url_ids, straight from the compendium.
 - identify_duplicates: Identifies (cc_name, fan_name) pairs whose URLs appear more than once in the index.
 - _identify_url_template: Identifies the shortest substring that is contained in all URLs. For truncating values in URL field. 
 - get_urlid: Returns the url ID for a given URL.
+- _match_url: Returns the lowercased (thread_id, comment_id) of a URL, if it links to a comment in the given thread. Shared by every build path.
+- normalize_urls: Extracts (thread_id, comment_id) from a whole column of URLs, and reports the malformed ones.
+- normalize_ama_index: Swaps each record's URL for its url_id, and removes records whose URL is malformed.
 - get_full_url: Returns full URL for the given url_id (i.e. str that completes the url template, and transforms it into a functioning URL)
+- diff_ama_index: Compares two Q&A indices by url_id, and reports added, removed and moved url_ids.
+- refresh_ama_index: Applies only the difference between a new Q&A index and the stored one.
+- save_url_remaps: Saves corrections to compendium links into the `ama_remaps` table.
+- load_url_remaps: Loads the `ama_remaps` table.
+- apply_url_remaps: Corrects the url_id of every record that has a remap.
+- iter_url_remaps: Yields each record of a stream, with its url_id corrected if it has a remap.
+- remap_ama_index: Applies the `ama_remaps` table to the stored index.
+- plan_ama_queries: Collapses an index into the unique url_ids that have yet to be fetched, each with the records it serves.
 """
 
-from ama_archiver.constants import URL_TEMPLATE
+from ama_archiver.constants import URL_PREFIX, URL_SUFFIX, URL_PATTERN
 
 import requests as r
 from bs4 import BeautifulSoup
 
 from pathlib import Path
 import sqlite3
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from contextlib import closing
+from operator import itemgetter
 import logging
 
 def fetch_raw_index(url: str) -> str:
@@ -54,9 +70,9 @@ def save_raw_index(raw_index: str, odir_path: Path, ofname: str) -> None:
     logging.info("Writing 'raw_index' to %r", full_opath)
     full_opath.write_text(raw_index)
 
-def compile_ama_index(raw_index: str, start_text: str) -> List[dict]:
+def iter_ama_index(raw_index: str, start_text: str) -> Iterator[dict]:
     """
-    Compiles index := {cc_name: [name for name in fan_names]} from HTML of the form: <p><strong>cc_name1</strong></p>
+    Yields the records of index := {cc_name: [name for name in fan_names]} one at a time, from HTML of the form: <p><strong>cc_name1</strong></p>
     <p><a href=url>fan_name1</a></p>
     <p><a href=url>fan_name2</a></p>
     <p><a href=url>fan_name3</a></p>
@@ -78,7 +94,6 @@ def compile_ama_index(raw_index: str, start_text: str) -> List[dict]:
         cc_name = strong.text[:-1]
         logging.info("'start_text' found in tree: %r. Setting as 'cc_name'.", cc_name)
         break
-    ama_index = []
     try:
         current_node
     except UnboundLocalError as ul_err:
@@ -103,11 +118,20 @@ def compile_ama_index(raw_index: str, start_text: str) -> List[dict]:
                 "cc_name": cc_name,
                 "url": url,
             }
-            logging.debug("New fan question found: %r. Appending to index.", ama_record)
-            ama_index.append(ama_record)
+            logging.debug("New fan question found: %r. Yielding to index.", ama_record)
+            yield ama_record
         else:
             raise Exception("Unexpected tag not found. Not strong, a, hr, or NaviString: %r", sibling)
-    logging.info("A total of %d record(s) were found.")
+
+def compile_ama_index(raw_index: str, start_text: str) -> List[dict]:
+    """
+    Compiles index := {cc_name: [name for name in fan_names]} from HTML; see `iter_ama_index` for the expected form.
+
+    - raw_index: Raw HTML as str.
+    - start_text: The text to search <strong> tags for.
+    """
+    ama_index = list(iter_ama_index(raw_index, start_text))
+    logging.info("A total of %d record(s) were found.", len(ama_index))
     return ama_index
 
 def identify_duplicates(ama_index: List[dict]) -> List[dict]:
@@ -141,14 +165,72 @@ def identify_duplicates(ama_index: List[dict]) -> List[dict]:
         logging.info("duplicate %d found: %r", indexno, dup)
     return dup_records
 
-def get_urlid(url: str) -> str:
+def _match_url(url: str, thread_id: Optional[str] = None) -> Optional[Tuple[str, str]]:
+    """
+    Returns (thread_id, comment_id) of `url`, lowercased as Reddit's ids are, or None if it is not a link to a
+    comment in `thread_id`. URL_PATTERN ignores case, so 'EVW3FNE' in a link still maps to the url_id 'evw3fne'.
+
+    - url: Compendium URL.
+    - thread_id: If given, links into any other thread do not match.
+    """
+    url_match = URL_PATTERN.match(url.strip())
+    if url_match is None or url_match["comment_id"] is None:
+        return None
+    ids = (url_match["thread_id"].lower(), url_match["comment_id"].lower())
+    if thread_id is not None and ids[0] != thread_id.lower():
+        return None
+    return ids
+
+def get_urlid(url: str, thread_id: Optional[str] = None) -> str:
     """
-    Extracts the URL id from a given URL string.
+    Extracts the URL id from a given URL string. Raises ValueError if `url` is not a link to a comment in `thread_id`.
 
     - url: URL whose url_id is to be extracted.
+    - thread_id: If given, links into any other thread are rejected.
+    """
+    ids = _match_url(url, thread_id)
+    if ids is None:
+        raise ValueError("Not a link to a Reddit comment%s: %r" % (" in thread %s" % thread_id if thread_id else "", url))
+    return ids[1]
+
+def normalize_urls(urls: Iterable[str], thread_id: Optional[str] = None) -> Tuple[List[Optional[Tuple[str, str]]], List[Tuple[int, str]]]:
+    """
+    Extracts (thread_id, comment_id) from every URL in a column of compendium URLs, in one pass of a compiled regex.
+
+    Returns (url_ids, malformed): `url_ids` has one entry per URL, None where the URL is malformed; `malformed`
+    lists (position, url) for each of those. Accepts any reddit.com subdomain, missing schemes and trailing slashes,
+    and query strings or fragments. Ids are lowercased, as Reddit serves them.
+
+    - urls: Column of compendium URLs.
+    - thread_id: If given, URLs into any other thread are reported as malformed.
+    """
+    url_ids = []
+    malformed = []
+    for position, url in enumerate(urls):
+        ids = _match_url(url, thread_id)
+        if ids is None:
+            url_ids.append(None)
+            malformed.append((position, url))
+            continue
+        url_ids.append(ids)
+    for position, url in malformed:
+        logging.warning("Malformed URL at position %d: %r", position, url)
+    return url_ids, malformed
+
+def normalize_ama_index(ama_index: List[dict], thread_id: Optional[str] = None) -> List[dict]:
     """
-    url_id = url.split("/")[-2]
-    return url_id
+    Replaces the `url` of every record in `ama_index` with its `url_id`, removes the records whose URL is malformed,
+    and returns the removed records.
+
+    - ama_index: List of ama_index records, as compiled by `compile_ama_index`; modified in place.
+    - thread_id: If given, URLs into any other thread are treated as malformed.
+    """
+    url_ids, malformed = normalize_urls([ama_record.pop("url") for ama_record in ama_index], thread_id)
+    for ama_record, ids in zip(ama_index, url_ids):
+        ama_record["url_id"] = ids[1] if ids else None
+    malformed_records = [ama_record for ama_record in ama_index if ama_record["url_id"] is None]
+    ama_index[:] = [ama_record for ama_record in ama_index if ama_record["url_id"] is not None]
+    return malformed_records
 
 def get_url(url_id: str) -> str:
     """
@@ -156,31 +238,82 @@ def get_url(url_id: str) -> str:
 
     - url_id: The part of the URL used to form a complete URL.
     """
-    url_template = list(URL_TEMPLATE)
-    url_template[-2] = url_id
-    url = "/".join(url_template)
+    # URL_PREFIX and URL_SUFFIX are URL_TEMPLATE split around the url_id, with the host already swapped to old.reddit.com
     #url = f"https://www.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/star_vs_the_forces_of_evil_ask_me_anything/{url_id}/?context=3"
-    return url.replace("www.reddit.com", "old.reddit.com")
+    return URL_PREFIX + url_id + URL_SUFFIX
 
-def save_ama_index(ama_index: List[dict], full_dbpath: Path) -> None:
+def save_ama_index(ama_index: Iterable[dict], full_dbpath: Path) -> None:
     """
     Saves ama_index := [{field1: value1, field2: value2, ...}] to full_dbpath in SQL format.
 
-    - ama_index: List of ama_index dict-records.
+    - ama_index: List (or any iterable) of ama_index dict-records.
     - full_dbpath: Tells function where to save `ama_index`
     """
     if full_dbpath.exists():
         logging.info("%r already exists. Skipping.", full_dbpath)
         return None
-    with sqlite3.connect(full_dbpath) as cnxn:
-        crs = cnxn.execute("""
-            CREATE TABLE IF NOT EXISTS ama_index(
-                cc_name TEXT NOT NULL,
-                fan_name TEXT NOT NULL,
-                url_id TEXT NOT NULL
-            );
-            """)
-        crs.executemany("INSERT INTO ama_index VALUES(:cc_name, :fan_name, :url_id);", ama_index)
+    bulk_save_ama_index(ama_index, full_dbpath)
+
+def bulk_save_ama_index(ama_records: Iterable[dict], full_dbpath: Path) -> int:
+    """
+    Streams `ama_records` into the `ama_index` table of `full_dbpath` in one transaction, and returns the number inserted.
+
+    For the duration of the load, the journal is write-ahead and syncs are off; the url_id index is only built
+    after all rows are in. The previous journal mode is restored afterwards. If `ama_index` already exists, nothing
+    is loaded, so that rebuilding does not double every row; use `refresh_ama_index` to update it.
+
+    - ama_records: Iterable of ama_index dict-records; e.g. a generator over `iter_ama_records`, so no list is built.
+    - full_dbpath: Tells function where to save the records.
+    """
+    with closing(sqlite3.connect(full_dbpath, isolation_level=None)) as cnxn:
+        has_index = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_index';").fetchone()
+        if has_index:
+            logging.info("`ama_index` already exists in %r. Skipping.", full_dbpath)
+            return 0
+        journal_mode = cnxn.execute("PRAGMA journal_mode;").fetchone()[0]
+        cnxn.execute("PRAGMA journal_mode = WAL;")
+        cnxn.execute("PRAGMA synchronous = OFF;")
+        cnxn.execute("BEGIN;")
+        try:
+            cnxn.execute("""
+                CREATE TABLE ama_index(
+                    cc_name TEXT NOT NULL,
+                    fan_name TEXT NOT NULL,
+                    url_id TEXT NOT NULL
+                );
+                """)
+            num_before = cnxn.total_changes
+            # positional parameters bind faster than named ones
+            ama_rows = map(itemgetter("cc_name", "fan_name", "url_id"), ama_records)
+            cnxn.executemany("INSERT INTO ama_index VALUES(?, ?, ?);", ama_rows)
+            num_inserted = cnxn.total_changes - num_before
+            cnxn.execute("CREATE INDEX ama_index_url_id ON ama_index(url_id);")
+            cnxn.execute("COMMIT;")
+        except BaseException:
+            cnxn.execute("ROLLBACK;")
+            raise
+        finally:
+            cnxn.execute("PRAGMA journal_mode = %s;" % journal_mode)
+    logging.info("Bulk-loaded %d record(s) into %s", num_inserted, full_dbpath)
+    return num_inserted
+
+def iter_ama_records(raw_index: str, start_text: str, thread_id: Optional[str] = None) -> Iterator[dict]:
+    """
+    Yields the records of `iter_ama_index`, with each `url` replaced by its `url_id`, ready for `bulk_save_ama_index`.
+    Records whose URL is malformed are logged and skipped, by the same rule as `normalize_ama_index`.
+
+    - raw_index: Raw HTML as str.
+    - start_text: The text to search <strong> tags for.
+    - thread_id: If given, records linking into any other thread are skipped.
+    """
+    for ama_record in iter_ama_index(raw_index, start_text):
+        url = ama_record.pop("url")
+        try:
+            ama_record["url_id"] = get_urlid(url, thread_id)
+        except ValueError:
+            logging.warning("Skipping record with malformed URL: %r, %r", ama_record, url)
+            continue
+        yield ama_record
 
 def load_ama_index(full_dbpath: Path) -> List[dict]:
     """
@@ -196,3 +329,167 @@ def load_ama_index(full_dbpath: Path) -> List[dict]:
         ama_index = [dict(row) for row in res.fetchall()]
     return ama_index
 
+def diff_ama_index(old_index: List[dict], new_index: List[dict]) -> Dict[str, List[str]]:
+    """
+    Compares two Q&A indices by url_id, and returns {'added': [...], 'removed': [...], 'moved': [...]}.
+
+    A url_id is 'moved' if it is in both indices, but its (cc_name, fan_name) pairs differ.
+
+    - old_index: List of ama_index records, e.g. as loaded from the database.
+    - new_index: List of ama_index records, e.g. as compiled from a fresh compendium.
+    """
+    def group_by_urlid(ama_index: List[dict]) -> Dict[str, List[tuple]]:
+        """
+        Maps each url_id to the sorted (cc_name, fan_name) pairs that reference it.
+        """
+        url_dict = {}
+        for ama_record in ama_index:
+            url_dict.setdefault(ama_record["url_id"], []).append((ama_record["cc_name"], ama_record["fan_name"]))
+        for url_record in url_dict.values():
+            url_record.sort()
+        return url_dict
+    old_urls = group_by_urlid(old_index)
+    new_urls = group_by_urlid(new_index)
+    index_diff = {
+        "added": [url_id for url_id in new_urls if url_id not in old_urls],
+        "removed": [url_id for url_id in old_urls if url_id not in new_urls],
+        "moved": [url_id for url_id in new_urls if url_id in old_urls and new_urls[url_id] != old_urls[url_id]],
+    }
+    for change, url_ids in index_diff.items():
+        logging.info("%d url_id(s) %s.", len(url_ids), change)
+    return index_diff
+
+def refresh_ama_index(ama_index: List[dict], full_dbpath: Path) -> List[str]:
+    """
+    Diffs `ama_index` against the index stored in `full_dbpath`, applies only the difference in one transaction,
+    and returns the url_ids that have yet to be scraped into `ama_queries`.
+
+    If `full_dbpath` has no `ama_index` yet, e.g. only `ama_remaps` was saved to it, `ama_index` is saved as is.
+
+    - ama_index: List of ama_index dict-records, compiled from a fresh compendium.
+    - full_dbpath: Tells function where `ama_index` is stored.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        has_index = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_index';").fetchone()
+    if not has_index:
+        bulk_save_ama_index(ama_index, full_dbpath)
+        return list(dict.fromkeys(ama_record["url_id"] for ama_record in ama_index))
+    index_diff = diff_ama_index(load_ama_index(full_dbpath), ama_index)
+    stale_urls = set(index_diff["removed"] + index_diff["moved"])
+    fresh_urls = set(index_diff["added"] + index_diff["moved"])
+    fresh_records = [ama_record for ama_record in ama_index if ama_record["url_id"] in fresh_urls]
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.executemany("DELETE FROM ama_index WHERE url_id = ?;", [(url_id,) for url_id in stale_urls])
+        cnxn.executemany("INSERT INTO ama_index VALUES(:cc_name, :fan_name, :url_id);", fresh_records)
+        has_queries = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_queries';").fetchone()
+        queried_urls = set()
+        if has_queries:
+            queried_urls = set(row[0] for row in cnxn.execute("SELECT url_id FROM ama_queries;"))
+    logging.info("Removed %d url_id(s) from, and inserted %d record(s) into %r", len(stale_urls), len(fresh_records), full_dbpath)
+    new_urls = [url_id for url_id in index_diff["added"] if url_id not in queried_urls]
+    return new_urls
+
+def save_url_remaps(url_remaps: Iterable[tuple], full_dbpath: Path) -> None:
+    """
+    Saves url_id corrections to the `ama_remaps` table in `full_dbpath`, replacing any earlier correction of the same record.
+
+    - url_remaps: (cc_name, fan_name, url_id, new_url_id) tuples, e.g. constants.URL_REMAPS.
+    - full_dbpath: Tells function where the database file is.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_remaps(
+                cc_name TEXT NOT NULL,
+                fan_name TEXT NOT NULL,
+                url_id TEXT NOT NULL,
+                new_url_id TEXT NOT NULL,
+                PRIMARY KEY(cc_name, fan_name, url_id)
+            );
+            """)
+        cnxn.executemany("INSERT OR REPLACE INTO ama_remaps VALUES(?, ?, ?, ?);", url_remaps)
+
+def load_url_remaps(full_dbpath: Path) -> List[dict]:
+    """
+    Loads from `full_dbpath` the table `ama_remaps` as List[dict] object. Returns an empty list if there is none.
+
+    - full_dbpath: Tells function where to find `ama_remaps`
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.row_factory = sqlite3.Row
+        has_remaps = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_remaps';").fetchone()
+        if not has_remaps:
+            return []
+        res = cnxn.execute("SELECT cc_name, fan_name, url_id, new_url_id FROM ama_remaps;")
+        url_remaps = [dict(row) for row in res.fetchall()]
+    return url_remaps
+
+def apply_url_remaps(ama_index: List[dict], url_remaps: List[dict]) -> int:
+    """
+    Replaces the url_id of every record in `ama_index` that has a remap, and returns the number of records remapped.
+
+    - ama_index: List of ama_index records; modified in place.
+    - url_remaps: List of {cc_name, fan_name, url_id, new_url_id} dicts, as returned by `load_url_remaps`.
+    """
+    remap_dict = {(remap["cc_name"], remap["fan_name"], remap["url_id"]): remap["new_url_id"] for remap in url_remaps}
+    num_remapped = 0
+    for ama_record in ama_index:
+        new_url_id = remap_dict.get((ama_record["cc_name"], ama_record["fan_name"], ama_record["url_id"]))
+        if new_url_id is None:
+            continue
+        logging.info("Remapping %r -> %r", ama_record, new_url_id)
+        ama_record["url_id"] = new_url_id
+        num_remapped += 1
+    return num_remapped
+
+def iter_url_remaps(ama_records: Iterable[dict], url_remaps: List[dict]) -> Iterator[dict]:
+    """
+    Yields each record of `ama_records`, with its url_id replaced if it has a remap; the streaming counterpart of
+    `apply_url_remaps`, e.g. between `iter_ama_records` and `bulk_save_ama_index`.
+
+    - ama_records: Iterable of ama_index records; each is modified in place as it passes.
+    - url_remaps: List of {cc_name, fan_name, url_id, new_url_id} dicts, as returned by `load_url_remaps`.
+    """
+    remap_dict = {(remap["cc_name"], remap["fan_name"], remap["url_id"]): remap["new_url_id"] for remap in url_remaps}
+    for ama_record in ama_records:
+        new_url_id = remap_dict.get((ama_record["cc_name"], ama_record["fan_name"], ama_record["url_id"]))
+        if new_url_id is not None:
+            logging.info("Remapping %r -> %r", ama_record, new_url_id)
+            ama_record["url_id"] = new_url_id
+        yield ama_record
+
+def remap_ama_index(full_dbpath: Path) -> int:
+    """
+    Applies the `ama_remaps` table to the `ama_index` stored in `full_dbpath`, and returns the number of records corrected.
+
+    - full_dbpath: Tells function where to find `ama_index` and `ama_remaps`.
+    """
+    url_remaps = load_url_remaps(full_dbpath)
+    num_remapped = 0
+    with sqlite3.connect(full_dbpath) as cnxn:
+        for remap in url_remaps:
+            # delete and re-insert, so the triggers on ama_index see the change
+            crs = cnxn.execute("DELETE FROM ama_index WHERE cc_name = :cc_name AND fan_name = :fan_name AND url_id = :url_id;", remap)
+            for _ in range(crs.rowcount):
+                cnxn.execute("INSERT INTO ama_index VALUES(:cc_name, :fan_name, :new_url_id);", remap)
+            num_remapped += crs.rowcount
+    logging.info("Remapped %d record(s) in %s", num_remapped, full_dbpath)
+    return num_remapped
+
+def plan_ama_queries(ama_index: List[dict], queried_urls: Iterable[str]) -> Dict[str, List[dict]]:
+    """
+    Collapses `ama_index` to the unique url_ids that have yet to be fetched, and returns {url_id: [ama_record, ...]}
+    in index order. Each url_id is to be fetched once; the records listed are every record it serves.
+
+    - ama_index: List of ama_index records, with remaps already applied.
+    - queried_urls: url_ids already in `ama_queries`.
+    """
+    queried_urls = set(queried_urls)
+    fetch_plan = {}
+    for ama_record in ama_index:
+        url_id = ama_record["url_id"]
+        if url_id in queried_urls:
+            continue
+        fetch_plan.setdefault(url_id, []).append(ama_record)
+    num_records = sum(len(ama_records) for ama_records in fetch_plan.values())
+    logging.info("%d unfetched record(s) collapse to %d url_id(s).", num_records, len(fetch_plan))
+    return fetch_plan
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""
+This module defines cached lookups by url_id, for services that look up the same records repeatedly.
+- lookup_url_id: Returns the index records and the Q&A for a url_id, from an LRU cache when possible.
+- lookup_ama_records: Returns the index records that reference a url_id.
+- lookup_ama_query: Returns the Q&A for a url_id.
+- clear_lookup_cache: Empties the cache, e.g. after the database was written to.
+- get_url: Re-exported from `indexer`; forms the full URL for a url_id.
+- _fetch_url_id: Reads the entry for a url_id from the database. Cached by `lookup_url_id`.
+"""
+
+from ama_archiver.constants import LOOKUP_CACHE_SIZE
+from ama_archiver.indexer import get_url  # noqa: F401 (re-exported, see module docstring)
+from ama_archiver.codec import load_zdict, decode_text
+
+from pathlib import Path
+from typing import List, Optional, Tuple
+import functools
+import sqlite3
+
+@functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)
+def _fetch_url_id(full_dbpath: Path, url_id: str) -> Tuple[tuple, Optional[tuple]]:
+    """
+    Reads the index records and the Q&A for `url_id` from `full_dbpath`, and returns them as immutable tuples.
+
+    - full_dbpath: Tells function where the database file is.
+    - url_id: url_id to look up.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        records = cnxn.execute("SELECT cc_name, fan_name, url_id FROM ama_index WHERE url_id = ?;", (url_id,)).fetchall()
+        has_queries = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_queries';").fetchone()
+        ama_query = None
+        if has_queries:
+            ama_query = cnxn.execute("SELECT url_id, question_text, answer_text FROM ama_queries WHERE url_id = ?;", (url_id,)).fetchone()
+        if ama_query is not None:
+            zdict = load_zdict(cnxn)
+            ama_query = (ama_query[0],) + tuple(decode_text(value, zdict) for value in ama_query[1:])
+    return tuple(records), ama_query
+
+def lookup_url_id(full_dbpath: Path, url_id: str) -> Tuple[List[dict], Optional[dict]]:
+    """
+    Returns (ama_records, ama_query) for `url_id`: every `ama_index` record that references it, and its `ama_queries` record, if any.
+
+    The LOOKUP_CACHE_SIZE most recently used url_ids are kept in memory; the dicts returned are fresh copies.
+
+    - full_dbpath: Tells function where the database file is.
+    - url_id: url_id to look up.
+    """
+    records, ama_query = _fetch_url_id(Path(full_dbpath), url_id)
+    ama_records = [dict(zip(("cc_name", "fan_name", "url_id"), record)) for record in records]
+    if ama_query is not None:
+        ama_query = dict(zip(("url_id", "question_text", "answer_text"), ama_query))
+    return ama_records, ama_query
+
+def lookup_ama_records(full_dbpath: Path, url_id: str) -> List[dict]:
+    """
+    Returns every `ama_index` record that references `url_id`.
+
+    - full_dbpath: Tells function where the database file is.
+    - url_id: url_id to look up.
+    """
+    return lookup_url_id(full_dbpath, url_id)[0]
+
+def lookup_ama_query(full_dbpath: Path, url_id: str) -> Optional[dict]:
+    """
+    Returns the `ama_queries` record for `url_id`, or None if it has not been scraped.
+
+    - full_dbpath: Tells function where the database file is.
+    - url_id: url_id to look up.
+    """
+    return lookup_url_id(full_dbpath, url_id)[1]
+
+def clear_lookup_cache() -> None:
+    """
+    Empties the lookup cache. Call after writing to a database that is being looked up.
+    """
+    _fetch_url_id.cache_clear()
@@ -0,0 +1,216 @@
+#!/usr/bin/python3
+"""
+This module finds questions that were asked more than once under different url_ids, e.g. reposts, by the similarity of their text.
+Each `question_text` gets a MinHash signature in `ama_minhash`, and the signature is split into bands that are bucketed in `ama_lsh`.
+Only questions that share a bucket are compared, so finding near-duplicates does not compare every pair of questions.
+- shingle: Returns the set of character shingles of a text, after normalizing case, punctuation and spacing.
+- make_signature: Returns the MinHash signature of a set of shingles.
+- estimate_similarity: Estimates the Jaccard similarity of two texts from their signatures.
+- create_ama_minhash: Creates `ama_minhash`, `ama_lsh` and the triggers that invalidate them, and signs every question.
+- update_ama_minhash: Signs the questions in `ama_queries` that have no signature yet.
+- find_near_duplicates: Returns the pairs of url_ids whose questions are near-duplicates.
+- _load_signatures: Loads the signatures of the given url_ids.
+
+Signatures are computed in Python, so they are only as stable as this module's constants; changing them means
+running `create_ama_minhash` again.
+"""
+
+from ama_archiver.constants import MINHASH_NUM_PERM, LSH_BANDS, SHINGLE_SIZE, NEARDUP_THRESHOLD
+from ama_archiver.codec import load_zdict, decode_text
+
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import hashlib
+import logging
+import re
+import sqlite3
+import struct
+
+# one SHAKE-128 digest per shingle yields all MINHASH_NUM_PERM of its 32-bit hash values in a single call
+SIGNATURE_FORMAT = struct.Struct("<%dI" % MINHASH_NUM_PERM)
+ROWS_PER_BAND = MINHASH_NUM_PERM // LSH_BANDS
+# Reddit's placeholders for removed comments; every such question would look like a duplicate of every other
+PLACEHOLDERS = frozenset(("[deleted]", "[removed]"))
+
+MINHASH_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_minhash_delete AFTER DELETE ON ama_queries
+    BEGIN
+        DELETE FROM ama_minhash WHERE url_id = OLD.url_id;
+        DELETE FROM ama_lsh WHERE url_id = OLD.url_id;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_minhash_update AFTER UPDATE OF question_text ON ama_queries
+    WHEN typeof(NEW.question_text) = 'text' AND NEW.question_text IS NOT OLD.question_text
+    BEGIN
+        DELETE FROM ama_minhash WHERE url_id = NEW.url_id;
+        DELETE FROM ama_lsh WHERE url_id = NEW.url_id;
+    END;
+    """,
+    )
+
+def shingle(text: str, shingle_size: int = SHINGLE_SIZE) -> Set[bytes]:
+    """
+    Returns every run of `shingle_size` characters in `text` as UTF-8, once casefolded, stripped of punctuation,
+    and with runs of whitespace collapsed.
+
+    - text: Text to shingle, e.g. a `question_text`.
+    - shingle_size: Number of characters per shingle.
+    """
+    normalized = " ".join(re.sub(r"[^\w\s]", "", text.casefold()).split())
+    if len(normalized) <= shingle_size:
+        return {normalized.encode("utf-8")} if normalized else set()
+    return set(normalized[charno:charno + shingle_size].encode("utf-8") for charno in range(len(normalized) - shingle_size + 1))
+
+def make_signature(shingles: Set[bytes]) -> List[int]:
+    """
+    Returns the MinHash signature of `shingles`: its minimum under each of MINHASH_NUM_PERM hash functions.
+
+    - shingles: Non-empty set, as returned by `shingle`.
+    """
+    # hash values per shingle as rows; zip(*rows) turns them into one column per hash function, and min runs in C
+    rows = [SIGNATURE_FORMAT.unpack(hashlib.shake_128(shingle).digest(SIGNATURE_FORMAT.size)) for shingle in shingles]
+    return list(map(min, zip(*rows)))
+
+def estimate_similarity(signature: List[int], other_signature: List[int]) -> float:
+    """
+    Returns the fraction of positions at which two signatures agree, an estimate of the Jaccard similarity of their shingles.
+
+    - signature: Signature, as returned by `make_signature`.
+    - other_signature: Signature to compare with.
+    """
+    return sum(value == other_value for value, other_value in zip(signature, other_signature)) / len(signature)
+
+def _get_buckets(signature: List[int]) -> List[bytes]:
+    """
+    Returns the bucket of each of the LSH_BANDS bands of `signature`, as an 8-byte digest of the band.
+
+    - signature: Signature, as returned by `make_signature`.
+    """
+    return [
+        hashlib.blake2b(struct.pack("<%dI" % ROWS_PER_BAND, *signature[start:start + ROWS_PER_BAND]), digest_size=8).digest()
+        for start in range(0, ROWS_PER_BAND * LSH_BANDS, ROWS_PER_BAND)
+    ]
+
+def create_ama_minhash(full_dbpath: Path) -> int:
+    """
+    Creates `ama_minhash` and `ama_lsh` in `full_dbpath`, and the triggers that drop the signature of a question
+    when it is edited or deleted, then signs every question. Returns the number of questions signed.
+
+    Safe to call again; the signatures are recomputed each time.
+
+    - full_dbpath: Tells function where the database file is.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_queries(
+                url_id TEXT PRIMARY KEY,
+                question_text TEXT NOT NULL,
+                answer_text TEXT NOT NULL
+            );
+            """)
+        # a NULL signature marks a question that was considered, but has no text worth comparing
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_minhash(
+                url_id TEXT PRIMARY KEY,
+                signature BLOB
+            );
+            """)
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_lsh(
+                band INTEGER NOT NULL,
+                bucket BLOB NOT NULL,
+                url_id TEXT NOT NULL
+            );
+            """)
+        cnxn.execute("CREATE INDEX IF NOT EXISTS ama_lsh_bucket ON ama_lsh(band, bucket);")
+        cnxn.execute("CREATE INDEX IF NOT EXISTS ama_lsh_url_id ON ama_lsh(url_id);")
+        for trigger in MINHASH_TRIGGERS:
+            cnxn.execute(trigger)
+        cnxn.execute("DELETE FROM ama_minhash;")
+        cnxn.execute("DELETE FROM ama_lsh;")
+    logging.info("`ama_minhash` created in %s", full_dbpath)
+    return update_ama_minhash(full_dbpath)
+
+def update_ama_minhash(full_dbpath: Path) -> int:
+    """
+    Signs and buckets every question in `ama_queries` that has no row in `ama_minhash` yet, i.e. new and edited
+    ones, and returns their number. `create_ama_minhash` must have been run once.
+
+    - full_dbpath: Tells function where the database file is.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        zdict = load_zdict(cnxn)
+        res = cnxn.execute("""
+            SELECT url_id, question_text FROM ama_queries
+            WHERE url_id NOT IN (SELECT url_id FROM ama_minhash);
+            """)
+        minhash_rows = []
+        lsh_rows = []
+        for url_id, question_text in res.fetchall():
+            question_text = decode_text(question_text, zdict)
+            shingles = shingle(question_text) if question_text.strip() not in PLACEHOLDERS else set()
+            if not shingles:
+                minhash_rows.append((url_id, None))
+                continue
+            signature = make_signature(shingles)
+            minhash_rows.append((url_id, SIGNATURE_FORMAT.pack(*signature)))
+            lsh_rows.extend((band, bucket, url_id) for band, bucket in enumerate(_get_buckets(signature)))
+        cnxn.executemany("INSERT INTO ama_minhash VALUES(?, ?);", minhash_rows)
+        cnxn.executemany("INSERT INTO ama_lsh VALUES(?, ?, ?);", lsh_rows)
+    logging.info("Signed %d new question(s) in %s", len(minhash_rows), full_dbpath)
+    return len(minhash_rows)
+
+def _load_signatures(cnxn: sqlite3.Connection, url_ids: Set[str]) -> Dict[str, List[int]]:
+    """
+    Returns the signatures of `url_ids` as {url_id: signature}.
+
+    - cnxn: Open connection to a database with `ama_minhash`.
+    - url_ids: url_ids whose signatures to load.
+    """
+    signatures = {}
+    url_ids = list(url_ids)
+    # stay below SQLite's default limit on host parameters
+    for start in range(0, len(url_ids), 500):
+        batch = url_ids[start:start + 500]
+        res = cnxn.execute(
+            "SELECT url_id, signature FROM ama_minhash WHERE signature IS NOT NULL AND url_id IN (%s);" % ", ".join("?" * len(batch)),
+            batch,
+            )
+        for url_id, signature in res:
+            signatures[url_id] = list(SIGNATURE_FORMAT.unpack(signature))
+    return signatures
+
+def find_near_duplicates(full_dbpath: Path, threshold: float = NEARDUP_THRESHOLD, url_id: Optional[str] = None) -> List[dict]:
+    """
+    Returns the pairs of url_ids whose questions have an estimated similarity of at least `threshold`, most similar
+    first, as {'url_id': ..., 'other_url_id': ..., 'similarity': ...}.
+
+    Only pairs that share at least one LSH bucket are compared. With LSH_BANDS bands of MINHASH_NUM_PERM / LSH_BANDS
+    rows, pairs of similarity s become candidates with probability 1 - (1 - s ** rows) ** bands.
+
+    - full_dbpath: Tells function where to find `ama_minhash` and `ama_lsh`.
+    - threshold: Minimum estimated Jaccard similarity of the shingles of two questions.
+    - url_id: Only return pairs that include this url_id.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        query = """
+            SELECT DISTINCT lsh.url_id, other_lsh.url_id FROM ama_lsh AS lsh
+            INNER JOIN ama_lsh AS other_lsh
+            ON other_lsh.band = lsh.band AND other_lsh.bucket = lsh.bucket AND other_lsh.url_id != lsh.url_id
+            """
+        if url_id is None:
+            res = cnxn.execute(query + " WHERE lsh.url_id < other_lsh.url_id;")
+        else:
+            res = cnxn.execute(query + " WHERE lsh.url_id = ?;", (url_id,))
+        candidates = res.fetchall()
+        signatures = _load_signatures(cnxn, set(url_id for pair in candidates for url_id in pair))
+    near_duplicates = []
+    for pair in candidates:
+        similarity = estimate_similarity(signatures[pair[0]], signatures[pair[1]])
+        if similarity >= threshold:
+            near_duplicates.append({"url_id": pair[0], "other_url_id": pair[1], "similarity": similarity})
+    near_duplicates.sort(key=lambda near_duplicate: (-near_duplicate["similarity"], near_duplicate["url_id"], near_duplicate["other_url_id"]))
+    logging.info("%d near-duplicate pair(s) found among %d candidate pair(s).", len(near_duplicates), len(candidates))
+    return near_duplicates
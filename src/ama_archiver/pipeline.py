@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+"""
+This module defines a staged pipeline that overlaps fetching, parsing and saving of Q&A records.
+- run_pipeline: Fetches, parses and saves the given url_ids, with bounded queues between stages.
+- make_ama_queries_pipeline: Runs `run_pipeline` to completion; Ctrl-C stops fetching, and drains what is in flight.
+- _parse_page: Parses one page into a new ama_query dict and its ama_details. Runs in a worker process.
+- _fetch_stage: Fetches pages concurrently, and puts them on the page queue.
+- _parse_stage: Parses pages in a process pool, and puts the results on the query queue.
+- _write_stage: Saves queries and their details to the database, and their pages to the raw-page store, in batches.
+"""
+
+from ama_archiver.constants import PIPELINE_FETCHERS, PIPELINE_PARSERS, PIPELINE_QUEUE_SIZE, PIPELINE_BATCH_SIZE
+from ama_archiver.indexer import get_url
+from ama_archiver.scraper import fetch_raw_page, parse_ama_query, save_ama_queries_to_db, save_ama_details_to_db
+from ama_archiver.rawstore import append_raw_pages
+
+import requests as r
+
+from pathlib import Path
+from concurrent.futures import Executor, ProcessPoolExecutor
+import asyncio
+import signal
+import logging
+from typing import List, Optional, Tuple
+
+def _parse_page(raw_page: str) -> Tuple[dict, dict]:
+    """
+    Parses `question_text` and `answer_text` out of `raw_page`, and returns them as a new dict, with the details
+    of both comments (see `scraper.parse_ama_query`) as a second dict.
+
+    - raw_page: HTML of a comment page.
+    """
+    ama_query = {}
+    ama_details = {}
+    parse_ama_query(raw_page, ama_query, ama_details)
+    return ama_query, ama_details
+
+async def _fetch_stage(url_queue: asyncio.Queue, page_queue: asyncio.Queue, stop: asyncio.Event) -> None:
+    """
+    Takes url_ids off `url_queue` until it is empty or `stop` is set, and puts (url_id, raw_page) on `page_queue`.
+
+    - url_queue: url_ids yet to be fetched.
+    - page_queue: Bounded queue; a full queue makes this stage wait for the parsers.
+    - stop: Set on Ctrl-C, or when a fetch fails, e.g. Reddit refuses further connections.
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set() and not url_queue.empty():
+        url_id = url_queue.get_nowait()
+        try:
+            raw_page = await loop.run_in_executor(None, fetch_raw_page, get_url(url_id))
+        except r.exceptions.ConnectionError:
+            logging.info("Max number of Reddit pings reached for today. Stopping at url_id: %r", url_id)
+            stop.set()
+            break
+        except r.exceptions.RequestException as error:
+            logging.warning("Fetch failed for url_id: %r (%r). Stopping.", url_id, error)
+            stop.set()
+            break
+        await page_queue.put((url_id, raw_page))
+
+async def _parse_stage(page_queue: asyncio.Queue, query_queue: asyncio.Queue, parse_executor: Executor) -> None:
+    """
+    Takes (url_id, raw_page) off `page_queue` until a None sentinel arrives, and puts (ama_query, ama_details, raw_page)
+    on `query_queue` for each complete ama_query.
+
+    - page_queue: Pages waiting to be parsed.
+    - query_queue: Bounded queue; a full queue makes this stage wait for the writer.
+    - parse_executor: Executor that runs `_parse_page`.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await page_queue.get()
+        if item is None:
+            break
+        url_id, raw_page = item
+        try:
+            ama_query, ama_details = await loop.run_in_executor(parse_executor, _parse_page, raw_page)
+        except Exception as error:
+            # one malformed page must not take down the stage, and the batches waiting behind it
+            logging.warning("Unable to parse page for url_id: %r (%r). Leaving it for the next run.", url_id, error)
+            continue
+        if set(ama_query) != {"question_text", "answer_text"}:
+            logging.warning("Incomplete record parsed for url_id: %r. Leaving it for the next run.", url_id)
+            continue
+        ama_query["url_id"] = url_id
+        ama_details["url_id"] = url_id
+        await query_queue.put((ama_query, ama_details, raw_page))
+
+async def _write_stage(query_queue: asyncio.Queue, full_dbpath: Path, batch_size: int, pack_path: Optional[Path]) -> int:
+    """
+    Takes (ama_query, ama_details, raw_page) off `query_queue` until a None sentinel arrives, saves them `batch_size` at a time,
+    and returns the number saved.
+
+    - query_queue: Parsed records waiting to be saved.
+    - full_dbpath: Tells function where the database file is.
+    - batch_size: Number of records saved per transaction.
+    - pack_path: Pack file to append raw pages to; pages are not kept if None.
+    """
+    loop = asyncio.get_running_loop()
+    num_saved = 0
+    batch = []
+    while True:
+        item = await query_queue.get()
+        if item is not None:
+            batch.append(item)
+        if batch and (item is None or len(batch) >= batch_size):
+            ama_queries = [ama_query for ama_query, _, _ in batch]
+            if pack_path is not None:
+                raw_pages = [(ama_query["url_id"], raw_page) for ama_query, _, raw_page in batch]
+                await loop.run_in_executor(None, append_raw_pages, raw_pages, pack_path)
+            await loop.run_in_executor(None, save_ama_queries_to_db, ama_queries, full_dbpath)
+            await loop.run_in_executor(None, save_ama_details_to_db, [ama_details for _, ama_details, _ in batch], full_dbpath)
+            num_saved += len(batch)
+            batch = []
+        if item is None:
+            return num_saved
+
+async def run_pipeline(
+        url_ids: List[str],
+        full_dbpath: Path,
+        num_fetchers: int = PIPELINE_FETCHERS,
+        batch_size: int = PIPELINE_BATCH_SIZE,
+        parse_executor: Optional[Executor] = None,
+        pack_path: Optional[Path] = None,
+        ) -> int:
+    """
+    Fetches, parses and saves the records for `url_ids`, and returns the number of records saved.
+
+    Fetching runs `num_fetchers` requests at a time, parsing runs in a process pool, and a single writer saves
+    batches to SQLite. The queues between stages hold at most PIPELINE_QUEUE_SIZE items, so a slow stage holds
+    back the ones before it. On SIGINT or a failed fetch, no new pages are fetched, but pages in flight are parsed
+    and saved. Pages that fail to parse are skipped. Whatever stops the fetchers, the stages are drained and the
+    last batch is saved before returning or raising. If saving fails, every stage is cancelled, and the error is raised.
+
+    - url_ids: url_ids to fetch; assumed to be unique, and absent from `ama_queries`.
+    - full_dbpath: Tells function where the database file is.
+    - num_fetchers: Number of pages fetched concurrently.
+    - batch_size: Number of records saved per transaction.
+    - parse_executor: Executor to parse pages in; defaults to a pool of PIPELINE_PARSERS processes.
+    - pack_path: Pack file to keep raw pages in (see `rawstore`); pages are not kept if None.
+    """
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    try:
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+    except (NotImplementedError, RuntimeError):
+        # e.g. Windows, or not running in the main thread
+        logging.debug("Unable to install SIGINT handler; Ctrl-C will not drain the pipeline.")
+    url_queue = asyncio.Queue()
+    for url_id in url_ids:
+        url_queue.put_nowait(url_id)
+    page_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    query_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    owns_executor = parse_executor is None
+    if owns_executor:
+        parse_executor = ProcessPoolExecutor(max_workers=PIPELINE_PARSERS)
+    try:
+        fetchers = [asyncio.create_task(_fetch_stage(url_queue, page_queue, stop)) for _ in range(num_fetchers)]
+        parsers = [asyncio.create_task(_parse_stage(page_queue, query_queue, parse_executor)) for _ in range(PIPELINE_PARSERS)]
+        writer = asyncio.create_task(_write_stage(query_queue, full_dbpath, batch_size, pack_path))
+        def stop_on_write_error(task: asyncio.Task) -> None:
+            """
+            Stops every other stage if the writer raised, and empties the queues, so nothing waits on a full queue
+            that no one will take from again.
+            """
+            if task.cancelled() or task.exception() is None:
+                return
+            stop.set()
+            for stage in fetchers + parsers:
+                stage.cancel()
+            for queue in (page_queue, query_queue):
+                while not queue.empty():
+                    queue.get_nowait()
+        writer.add_done_callback(stop_on_write_error)
+        try:
+            await asyncio.gather(*fetchers)
+        finally:
+            # if a fetcher raised, let the others finish their page, then drain every stage into the database
+            stop.set()
+            await asyncio.gather(*fetchers, return_exceptions=True)
+            for _ in parsers:
+                await page_queue.put(None)
+            parse_results = await asyncio.gather(*parsers, return_exceptions=True)
+            await query_queue.put(None)
+            # re-raises the writer's error, if it failed
+            num_saved = await writer
+            for parse_result in parse_results:
+                if isinstance(parse_result, Exception):
+                    raise parse_result
+    finally:
+        if owns_executor:
+            parse_executor.shutdown()
+        try:
+            loop.remove_signal_handler(signal.SIGINT)
+        except (NotImplementedError, RuntimeError):
+            pass
+    if not url_queue.empty():
+        logging.info("Pipeline stopped early. %d url_id(s) left unfetched.", url_queue.qsize())
+    return num_saved
+
+def make_ama_queries_pipeline(url_ids: List[str], full_dbpath: Path, pack_path: Optional[Path] = None) -> int:
+    """
+    Runs the pipeline over `url_ids` to completion, and returns the number of records saved.
+
+    - url_ids: url_ids to fetch; assumed to be unique, and absent from `ama_queries`.
+    - full_dbpath: Tells function where the database file is.
+    - pack_path: Pack file to keep raw pages in; pages are not kept if None.
+    """
+    num_saved = asyncio.run(run_pipeline(url_ids, full_dbpath, pack_path=pack_path))
+    logging.info("Pipeline saved %d/%d record(s) to %s", num_saved, len(url_ids), full_dbpath)
+    return num_saved
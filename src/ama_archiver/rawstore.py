@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+"""
+This module defines a pack-file store for raw HTML pages, keyed by url_id.
+Pages are compressed one frame each, and appended to '{name}.pack'; '{name}.idx' records where each frame is.
+- append_raw_pages: Compresses pages, and appends them to the pack file and its index.
+- load_pack_index: Loads the index of a pack file as {url_id: (offset, length)}.
+- read_raw_page: Reads one page from a pack file.
+- iter_raw_pages: Streams pages from a pack file in the order they were written, via one mmap.
+- _get_index_path: Returns the path of the index file that belongs to a pack file.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+import mmap
+import zlib
+import logging
+
+COMPRESSION_LEVEL = 6
+
+def _get_index_path(pack_path: Path) -> Path:
+    """
+    Returns the path of the index file that belongs to `pack_path`.
+
+    - pack_path: Path of the pack file.
+    """
+    return pack_path.with_suffix(".idx")
+
+def append_raw_pages(raw_pages: List[Tuple[str, str]], pack_path: Path) -> None:
+    """
+    Compresses each page into its own frame, appends the frames to `pack_path`, and records them in its index.
+
+    A url_id appended more than once is resolved to its latest frame.
+
+    - raw_pages: List of (url_id, raw_page) pairs.
+    - pack_path: Path of the pack file; created if it does not exist.
+    """
+    index_lines = []
+    with pack_path.open("ab") as pack_file:
+        offset = pack_file.tell()
+        for url_id, raw_page in raw_pages:
+            frame = zlib.compress(raw_page.encode("utf-8"), COMPRESSION_LEVEL)
+            pack_file.write(frame)
+            index_lines.append("%s\t%d\t%d\n" % (url_id, offset, len(frame)))
+            offset += len(frame)
+    # index is written after the frames, so it never points past the end of the pack
+    with _get_index_path(pack_path).open("a") as index_file:
+        index_file.writelines(index_lines)
+    logging.debug("Appended %d page(s) to %s", len(raw_pages), pack_path)
+
+def load_pack_index(pack_path: Path) -> Dict[str, Tuple[int, int]]:
+    """
+    Loads the index of `pack_path`, and returns it as {url_id: (offset, length)}.
+
+    - pack_path: Path of the pack file.
+    """
+    pack_index = {}
+    index_path = _get_index_path(pack_path)
+    if not index_path.exists():
+        return pack_index
+    with index_path.open() as index_file:
+        for line in index_file:
+            url_id, offset, length = line.rstrip("\n").split("\t")
+            pack_index[url_id] = (int(offset), int(length))
+    return pack_index
+
+def read_raw_page(url_id: str, pack_path: Path, pack_index: Optional[Dict[str, Tuple[int, int]]] = None) -> str:
+    """
+    Reads the page stored for `url_id` from `pack_path`, and returns it as a str-object.
+
+    Opens the pack file on every call; to read more than a few pages, use `iter_raw_pages`, which maps it once.
+
+    - url_id: url_id of the page to read.
+    - pack_path: Path of the pack file.
+    - pack_index: Index as returned by `load_pack_index`; loaded from disk if not given.
+    """
+    if pack_index is None:
+        pack_index = load_pack_index(pack_path)
+    offset, length = pack_index[url_id]
+    # a single frame is cheaper to seek to than to map the whole pack for
+    with pack_path.open("rb") as pack_file:
+        pack_file.seek(offset)
+        frame = pack_file.read(length)
+    return zlib.decompress(frame).decode("utf-8")
+
+def iter_raw_pages(pack_path: Path, url_ids: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (url_id, raw_page) pairs from `pack_path`, in the order they were written.
+
+    The pack file is mapped once, so no file is opened per page.
+
+    - pack_path: Path of the pack file.
+    - url_ids: Only yield these url_ids; defaults to every url_id in the index.
+    """
+    pack_index = load_pack_index(pack_path)
+    if url_ids is not None:
+        pack_index = {url_id: pack_index[url_id] for url_id in url_ids if url_id in pack_index}
+    # mmap refuses to map an empty file, e.g. a pack whose first append was interrupted
+    if not pack_index or pack_path.stat().st_size == 0:
+        return
+    frames = sorted(pack_index.items(), key=lambda item: item[1][0])
+    with pack_path.open("rb") as pack_file, mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ) as pack_map:
+        for url_id, (offset, length) in frames:
+            yield url_id, zlib.decompress(pack_map[offset:offset + length]).decode("utf-8")
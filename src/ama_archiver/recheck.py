@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+"""
+This module defines functions that detect whether scraped answers were edited since they were fetched.
+- hash_ama_query: Returns a content hash for the `question_text` and `answer_text` of an ama_query.
+- init_ama_checks: Creates `ama_checks` and `ama_revisions`, and registers any unchecked `ama_queries` record.
+- select_stale_urls: Returns the url_ids that are due to be re-polled, most-likely-edited first.
+- record_ama_check: Compares a re-polled ama_query with the stored one, and records a revision only if it changed.
+"""
+
+from ama_archiver.codec import load_zdict, decode_ama_query
+from ama_archiver.neardup import PLACEHOLDERS
+
+from pathlib import Path
+import sqlite3
+import hashlib
+import logging
+import time
+from typing import List, Optional
+
+def hash_ama_query(ama_query: dict) -> str:
+    """
+    Returns the SHA-256 hex digest of the `question_text` and `answer_text` of `ama_query`.
+
+    - ama_query: dict with at least `question_text` and `answer_text`.
+    """
+    content = ama_query["question_text"] + "\0" + ama_query["answer_text"]
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def init_ama_checks(full_dbpath: Path) -> None:
+    """
+    Creates the `ama_checks` and `ama_revisions` tables in `full_dbpath`, and registers every `ama_queries` record without a check.
+
+    Newly registered records get a `fetched_at` of 0, so they are the first to be re-polled.
+
+    - full_dbpath: Tells function where to find `ama_queries`.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_queries(
+                url_id TEXT PRIMARY KEY,
+                question_text TEXT NOT NULL,
+                answer_text TEXT NOT NULL
+            );
+            """)
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_checks(
+                url_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            """)
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_revisions(
+                url_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                question_text TEXT NOT NULL,
+                answer_text TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            );
+            """)
+        cnxn.execute("CREATE INDEX IF NOT EXISTS ama_checks_fetched_at ON ama_checks(fetched_at);")
+        cnxn.execute("CREATE INDEX IF NOT EXISTS ama_revisions_url_id ON ama_revisions(url_id);")
+        cnxn.row_factory = sqlite3.Row
+        res = cnxn.execute("""
+            SELECT url_id, question_text, answer_text FROM ama_queries
+            WHERE url_id NOT IN (SELECT url_id FROM ama_checks);
+            """)
+        zdict = load_zdict(cnxn)
+        new_checks = [(row["url_id"], hash_ama_query(decode_ama_query(dict(row), zdict))) for row in res.fetchall()]
+        cnxn.executemany("INSERT INTO ama_checks VALUES(?, ?, 0);", new_checks)
+    logging.info("Registered %d unchecked record(s) in %s", len(new_checks), full_dbpath)
+
+def select_stale_urls(full_dbpath: Path, max_age: float, limit: int, now: Optional[float] = None) -> List[str]:
+    """
+    Returns up to `limit` url_ids last fetched more than `max_age` seconds ago.
+
+    Records that have been edited before come first, then the least recently fetched.
+
+    - full_dbpath: Tells function where to find `ama_checks`.
+    - max_age: Number of seconds after which a record is due to be re-polled.
+    - limit: Maximum number of url_ids to return.
+    - now: Current UNIX time; defaults to `time.time()`.
+    """
+    if now is None:
+        now = time.time()
+    with sqlite3.connect(full_dbpath) as cnxn:
+        res = cnxn.execute("""
+            SELECT ama_checks.url_id FROM ama_checks
+            LEFT JOIN ama_revisions ON ama_revisions.url_id = ama_checks.url_id
+            WHERE ama_checks.fetched_at < ?
+            GROUP BY ama_checks.url_id
+            ORDER BY COUNT(ama_revisions.url_id) DESC, ama_checks.fetched_at ASC
+            LIMIT ?;
+            """, (now - max_age, limit))
+        stale_urls = [row[0] for row in res.fetchall()]
+    return stale_urls
+
+def record_ama_check(ama_query: dict, full_dbpath: Path, fetched_at: Optional[float] = None) -> bool:
+    """
+    Compares a re-polled `ama_query` with the stored one, and returns True if its content changed.
+
+    If unchanged, only `fetched_at` is updated. Otherwise, the superseded text is moved into `ama_revisions`,
+    and `ama_queries` and `ama_checks` are updated to the new content. A text that came back as Reddit's placeholder
+    for a deleted or removed comment is not an edit: the archived text is kept.
+
+    - ama_query: Freshly fetched dict with `url_id`, `question_text` and `answer_text`.
+    - full_dbpath: Tells function where to find `ama_queries` and `ama_checks`.
+    - fetched_at: UNIX time at which `ama_query` was fetched; defaults to `time.time()`.
+    """
+    if fetched_at is None:
+        fetched_at = time.time()
+    url_id = ama_query["url_id"]
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.row_factory = sqlite3.Row
+        stored = cnxn.execute("""
+            SELECT ama_queries.question_text, ama_queries.answer_text, ama_checks.content_hash, ama_checks.fetched_at
+            FROM ama_queries
+            INNER JOIN ama_checks ON ama_checks.url_id = ama_queries.url_id
+            WHERE ama_queries.url_id = ?;
+            """, (url_id,)).fetchone()
+        if stored is None:
+            raise ValueError("url_id has no stored record to compare with: %r" % url_id)
+        stored_query = decode_ama_query(dict(stored), load_zdict(cnxn))
+        ama_query = dict(ama_query)
+        for field in ("question_text", "answer_text"):
+            if ama_query[field].strip() in PLACEHOLDERS and stored_query[field].strip() not in PLACEHOLDERS:
+                logging.info("%s of %r was deleted on Reddit. Keeping the archived text.", field, url_id)
+                ama_query[field] = stored_query[field]
+        content_hash = hash_ama_query(ama_query)
+        if stored["content_hash"] == content_hash:
+            cnxn.execute("UPDATE ama_checks SET fetched_at = ? WHERE url_id = ?;", (fetched_at, url_id))
+            return False
+        logging.info("Content of %r changed. Recording revision.", url_id)
+        cnxn.execute(
+            "INSERT INTO ama_revisions VALUES(?, ?, ?, ?, ?);",
+            (url_id, stored["content_hash"], stored_query["question_text"], stored_query["answer_text"], stored["fetched_at"]),
+            )
+        cnxn.execute("UPDATE ama_queries SET question_text = :question_text, answer_text = :answer_text WHERE url_id = :url_id;", ama_query)
+        cnxn.execute("UPDATE ama_checks SET content_hash = ?, fetched_at = ? WHERE url_id = ?;", (content_hash, fetched_at, url_id))
+    return True
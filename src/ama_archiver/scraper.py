@@ -1,31 +1,103 @@
 #!/usr/bin/python3
 """
 This module contains functions that fetch and store queries from the source.
+- fetch_raw_page: Fetches the old-Reddit HTML of a comment page.
+- parse_ama_query: Parses text Q&A data out of the HTML of a comment page.
 - fetch_ama_query: Fetches text Q&A data from Reddit as text, and returns it as a dict[str, str].
 - fetch_ama_queries: Iterates over index, and fetches Q&A data for each entry in the index.
 - save_ama_query: Saves a given ama_query, provided it's got the right fields.
+- fetch_ama_things: Fetches JSON data for a batch of Reddit fullnames, and returns it keyed by id.
+- get_comment_text: Returns the plain text of a comment fetched as JSON.
+- fetch_ama_queries_json: Fetches Q&A data for many url_ids at once via Reddit's JSON endpoints.
+- save_ama_queries_to_db: Saves a list of ama_query records in a single transaction.
+- get_comment_details: Returns the rich body and the author/score/timestamp metadata of a comment fetched as JSON.
+- make_ama_details: Combines the details of a question and its answer into one `ama_details` record.
+- save_ama_details_to_db: Saves a list of ama_details records, replacing older details of the same url_ids.
+- load_ama_details_from_db: Loads the `ama_details` table.
+- _parse_comment_details: Returns the rich body and the author/score/timestamp metadata of a comment on an HTML page.
+- _normalize_body_html: Returns the inner HTML of a comment body, in the form both backends store it.
+
+`ama_details` keeps what the flattened text loses: each comment's body as HTML (and as Markdown, where Reddit's JSON
+provides it), its author, its score, and its creation time in UNIX seconds.
 """
 
+from ama_archiver.constants import API_INFO_URL, API_BATCH_SIZE, USER_AGENT
+from ama_archiver.codec import load_zdict, decode_ama_query
+
 import requests as r
 from bs4 import BeautifulSoup
 
 from pathlib import Path
 import sqlite3
 import logging
-from typing import List
+import html
+from datetime import datetime
+from typing import Dict, List, Optional
 
-def fetch_ama_query(url: str, ama_query: dict) -> None:
-    """
-    Fetches `question_text` and `answer_text` values for a given URL.
+# fields of a comment kept in `ama_details`, once for the question and once for the answer
+DETAIL_FIELDS = ("author", "score", "created_utc", "body_html", "body_markdown")
 
-    - url: source whence data is to be fetched.
-    - ama_query: dict to store fetched data. Initialize outside function.
+def fetch_raw_page(url: str) -> str:
+    """
+    Fetches the old-Reddit HTML of a given URL, and returns it as a str-object.
 
-    update: {'question_text': ..., 'answer_text': ...}
+    - url: source whence HTML is to be fetched.
     """
     # new version no longer works for scraping
     response = r.get(url.replace("www.reddit.com", "old.reddit.com"))
-    soup = BeautifulSoup(response.text, "html.parser")
+    return response.text
+
+def _normalize_body_html(body) -> str:
+    """
+    Returns the inner HTML of the 'md' element of a comment body, stripped of surrounding whitespace.
+
+    - body: BeautifulSoup element of the comment body, or of its 'md' element.
+    """
+    md = body if "md" in (body.get("class") or []) else body.find(class_="md")
+    return "".join(str(child) for child in (md or body).contents).strip()
+
+def _parse_comment_details(body) -> dict:
+    """
+    Returns the details of the comment whose body is `body`, as {field: value} for each field in DETAIL_FIELDS.
+    Fields the page does not show (e.g. a hidden score, or the Markdown source) are None.
+
+    - body: BeautifulSoup element of class 'usertext-body' on an old-Reddit comment page.
+    """
+    thing = body.find_parent(class_="thing")
+    entry = body.find_parent(class_="entry") or thing
+    author = thing.get("data-author") if thing is not None else None
+    score = None
+    created_utc = None
+    if entry is not None:
+        if author is None:
+            author_tag = entry.find(class_="author")
+            author = author_tag.text if author_tag is not None else None
+        score_tag = entry.select_one("span.score.unvoted")
+        if score_tag is not None and score_tag.get("title", "").lstrip("-").isdigit():
+            score = int(score_tag["title"])
+        time_tag = entry.find("time", class_="live-timestamp")
+        if time_tag is not None and time_tag.get("datetime"):
+            created_utc = datetime.fromisoformat(time_tag["datetime"]).timestamp()
+    return {
+        "author": author,
+        "score": score,
+        "created_utc": created_utc,
+        "body_html": _normalize_body_html(body),
+        "body_markdown": None,
+        }
+
+def parse_ama_query(raw_page: str, ama_query: dict, ama_details: Optional[dict] = None) -> None:
+    """
+    Parses `question_text` and `answer_text` values out of the HTML of a comment page.
+
+    - raw_page: HTML of the comment page, as returned by `fetch_raw_page`.
+    - ama_query: dict to store parsed data. Initialize outside function.
+    - ama_details: dict to store the details of both comments, from the same parse; skipped if None.
+
+    update: {'question_text': ..., 'answer_text': ...}
+    update ama_details: {'question_author': ..., 'question_body_html': ..., 'answer_author': ..., ...}
+    """
+    soup = BeautifulSoup(raw_page, "html.parser")
     # personal observations indicate that comments are contained in HTML tags of this class
     class_ = "usertext-body"
     # Note: assumes that length of query is at least three!
@@ -37,10 +109,122 @@ def fetch_ama_query(url: str, ama_query: dict) -> None:
             question_text = comment.text
             ama_query["question_text"] = question_text.strip()
             #logging.info("`question_text` found.")
+            if ama_details is not None:
+                ama_details.update(("question_" + field, value) for field, value in _parse_comment_details(comment).items())
         elif indexno == 2:
             answer_text = comment.text
             ama_query["answer_text"] = answer_text.strip()
             #logging.info("`answer_text` found.")
+            if ama_details is not None:
+                ama_details.update(("answer_" + field, value) for field, value in _parse_comment_details(comment).items())
+
+def fetch_ama_query(url: str, ama_query: dict, ama_details: Optional[dict] = None) -> None:
+    """
+    Fetches `question_text` and `answer_text` values for a given URL.
+
+    - url: source whence data is to be fetched.
+    - ama_query: dict to store fetched data. Initialize outside function.
+    - ama_details: dict to store the details of both comments; see `parse_ama_query`.
+
+    update: {'question_text': ..., 'answer_text': ...}
+    """
+    raw_page = fetch_raw_page(url)
+    parse_ama_query(raw_page, ama_query, ama_details)
+
+def fetch_ama_things(fullnames: List[str]) -> Dict[str, dict]:
+    """
+    Fetches comment data as JSON for the given fullnames, and returns it keyed by comment id.
+
+    - fullnames: Reddit fullnames of the form 't1_{url_id}'. Sent API_BATCH_SIZE at a time.
+    """
+    things = {}
+    headers = {"User-Agent": USER_AGENT}
+    for start in range(0, len(fullnames), API_BATCH_SIZE):
+        batch = fullnames[start:start + API_BATCH_SIZE]
+        logging.info("Fetching %d thing(s) from %s", len(batch), API_INFO_URL)
+        response = r.get(API_INFO_URL, params={"id": ",".join(batch)}, headers=headers)
+        response.raise_for_status()
+        for child in response.json()["data"]["children"]:
+            thing = child["data"]
+            things[thing["id"]] = thing
+    return things
+
+def get_comment_text(thing: dict) -> str:
+    """
+    Returns the text of a comment fetched as JSON, flattened the same way `fetch_ama_query` flattens HTML.
+
+    - thing: 'data' member of a comment returned by Reddit's JSON endpoints.
+    """
+    # 'body_html' is escaped; unescape and flatten so both backends store identical text
+    body_html = html.unescape(thing.get("body_html") or "")
+    if not body_html:
+        return thing.get("body", "").strip()
+    return BeautifulSoup(body_html, "html.parser").text.strip()
+
+def get_comment_details(thing: dict) -> dict:
+    """
+    Returns the details of a comment fetched as JSON, as {field: value} for each field in DETAIL_FIELDS.
+    `body_html` is normalized the same way `parse_ama_query` normalizes HTML, so both backends store identical markup.
+
+    - thing: 'data' member of a comment returned by Reddit's JSON endpoints.
+    """
+    body_html = html.unescape(thing.get("body_html") or "")
+    created_utc = thing.get("created_utc")
+    return {
+        "author": thing.get("author"),
+        "score": thing.get("score"),
+        "created_utc": float(created_utc) if created_utc is not None else None,
+        "body_html": _normalize_body_html(BeautifulSoup(body_html, "html.parser")) if body_html else None,
+        "body_markdown": thing.get("body"),
+        }
+
+def make_ama_details(url_id: str, question_details: dict, answer_details: dict) -> dict:
+    """
+    Returns one `ama_details` record for `url_id`, with the fields of each comment prefixed 'question_' and 'answer_'.
+
+    - url_id: url_id of the answer.
+    - question_details: Details of the question, as returned by `get_comment_details`.
+    - answer_details: Details of the answer, as returned by `get_comment_details`.
+    """
+    ama_details = {"url_id": url_id}
+    for prefix, details in (("question_", question_details), ("answer_", answer_details)):
+        ama_details.update((prefix + field, details[field]) for field in DETAIL_FIELDS)
+    return ama_details
+
+def fetch_ama_queries_json(url_ids: List[str], ama_details: Optional[List[dict]] = None) -> List[dict]:
+    """
+    Fetches `question_text` and `answer_text` values for many url_ids at once, and returns them as ama_query records.
+
+    Each url_id identifies the answer; its parent comment is the question.
+    Two requests are made per API_BATCH_SIZE url_ids: one for the answers, and one for their parents.
+    url_ids that Reddit does not return (e.g. deleted comments) are logged and left out.
+
+    - url_ids: url_ids of the answers to fetch.
+    - ama_details: list to append an `ama_details` record to for each ama_query returned; skipped if None.
+    """
+    answers = fetch_ama_things(["t1_" + url_id for url_id in url_ids])
+    parent_ids = [answer["parent_id"] for answer in answers.values()]
+    questions = fetch_ama_things(parent_ids)
+    ama_queries = []
+    for url_id in url_ids:
+        if url_id not in answers:
+            logging.warning("No comment returned for url_id: %r", url_id)
+            continue
+        answer = answers[url_id]
+        # parent_id is a fullname, e.g. 't1_evw3fne'
+        question = questions.get(answer["parent_id"].split("_", 1)[-1])
+        if question is None:
+            logging.warning("No parent comment returned for url_id: %r", url_id)
+            continue
+        ama_query = {
+            "url_id": url_id,
+            "question_text": get_comment_text(question),
+            "answer_text": get_comment_text(answer),
+        }
+        ama_queries.append(ama_query)
+        if ama_details is not None:
+            ama_details.append(make_ama_details(url_id, get_comment_details(question), get_comment_details(answer)))
+    return ama_queries
 
 def save_ama_query_to_db(ama_query: dict, full_dbpath: Path) -> None:
     """
@@ -62,9 +246,27 @@ def save_ama_query_to_db(ama_query: dict, full_dbpath: Path) -> None:
         crs.execute("INSERT INTO ama_queries VALUES(:url_id, :question_text, :answer_text);", ama_query)
         logging.info("Successfully saved %s to file: %s", ama_query, full_dbpath)
 
+def save_ama_queries_to_db(ama_queries: List[dict], full_dbpath: Path) -> None:
+    """
+    Creates 'ama_queries' table in `full_dbpath`, and saves all of `ama_queries` in one transaction.
+
+    - ama_queries: list of populated dicts to be loaded into the database.
+    - full_dbpath: tells the function where the database file is.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        crs = cnxn.execute("""
+                CREATE TABLE IF NOT EXISTS ama_queries(
+                    url_id TEXT PRIMARY KEY,
+                    question_text TEXT NOT NULL,
+                    answer_text TEXT NOT NULL
+                );
+                """)
+        crs.executemany("INSERT INTO ama_queries VALUES(:url_id, :question_text, :answer_text);", ama_queries)
+        logging.info("Successfully saved %d record(s) to file: %s", len(ama_queries), full_dbpath)
+
 def load_ama_queries_from_db(full_dbpath: Path) -> List[dict]:
     """
-    Loads 'ama_queries' table from `full_dbpath` into List[dict].
+    Loads 'ama_queries' table from `full_dbpath` into List[dict], decompressing values stored compressed.
 
     - full_dbpath: Tells function where to find `ama_queries`
     """
@@ -80,6 +282,52 @@ def load_ama_queries_from_db(full_dbpath: Path) -> List[dict]:
         res = cnxn.execute("""
             SELECT url_id, question_text, answer_text FROM ama_queries;
             """)
-        ama_queries = [dict(row) for row in res.fetchall()]
+        zdict = load_zdict(cnxn)
+        ama_queries = [decode_ama_query(dict(row), zdict) for row in res.fetchall()]
     return ama_queries
 
+def save_ama_details_to_db(ama_details: List[dict], full_dbpath: Path) -> None:
+    """
+    Creates 'ama_details' table in `full_dbpath`, and saves all of `ama_details` in one transaction.
+    Details already saved for a url_id are replaced, e.g. by a later fetch with a newer score.
+
+    - ama_details: list of records, as returned by `make_ama_details`.
+    - full_dbpath: tells the function where the database file is.
+    """
+    columns = ["url_id"] + [prefix + field for prefix in ("question_", "answer_") for field in DETAIL_FIELDS]
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_details(
+                url_id TEXT PRIMARY KEY,
+                question_author TEXT,
+                question_score INTEGER,
+                question_created_utc REAL,
+                question_body_html TEXT,
+                question_body_markdown TEXT,
+                answer_author TEXT,
+                answer_score INTEGER,
+                answer_created_utc REAL,
+                answer_body_html TEXT,
+                answer_body_markdown TEXT
+            );
+            """)
+        cnxn.executemany(
+            "INSERT OR REPLACE INTO ama_details(%s) VALUES(%s);" % (", ".join(columns), ", ".join(":" + column for column in columns)),
+            ama_details,
+            )
+    logging.info("Successfully saved details of %d record(s) to file: %s", len(ama_details), full_dbpath)
+
+def load_ama_details_from_db(full_dbpath: Path) -> List[dict]:
+    """
+    Loads 'ama_details' table from `full_dbpath` into List[dict]; empty if no details were saved.
+
+    - full_dbpath: Tells function where to find `ama_details`
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        has_details = cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ama_details';").fetchone()
+        if not has_details:
+            return []
+        cnxn.row_factory = sqlite3.Row
+        res = cnxn.execute("SELECT * FROM ama_details;")
+        ama_details = [dict(row) for row in res.fetchall()]
+    return ama_details
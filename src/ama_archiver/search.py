@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+"""
+This module maintains FTS5 indexes over `ama_queries` and the names in `ama_index`, kept current by triggers.
+The text index always holds plain text; compressing `ama_queries` in place (see `codec`) leaves it untouched.
+- create_ama_search: Creates `ama_search` and its triggers, and indexes the current `ama_queries`.
+- search_ama_queries: Returns the records whose question or answer match a full-text query, best match first.
+- create_ama_names: Creates `ama_names` and its trigram index, with their triggers, and indexes the current `ama_index`.
+- search_ama_names: Returns the fan_names and cc_names that best match a (partial, misspelt) name.
+- search_ama_records: Returns the `ama_index` records of the fan_names that best match a name.
+- _get_trigram_query: Returns an FTS5 query that matches any trigram of a name.
+
+`ama_names` holds each distinct (name, kind) with its number of records, where kind is 'fan' or 'cc';
+`ama_names_trigram` indexes its names with the trigram tokenizer, so a lookup never scans `ama_index`.
+"""
+
+from ama_archiver.codec import load_zdict, decode_text
+
+from pathlib import Path
+import sqlite3
+import logging
+from typing import List, Optional
+
+SEARCH_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_search_insert AFTER INSERT ON ama_queries
+    BEGIN
+        INSERT INTO ama_search(url_id, question_text, answer_text) VALUES(NEW.url_id, NEW.question_text, NEW.answer_text);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_search_delete AFTER DELETE ON ama_queries
+    BEGIN
+        DELETE FROM ama_search WHERE url_id = OLD.url_id;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_search_update AFTER UPDATE OF question_text, answer_text ON ama_queries
+    WHEN typeof(NEW.question_text) = 'text' AND typeof(NEW.answer_text) = 'text'
+    BEGIN
+        UPDATE ama_search SET question_text = NEW.question_text, answer_text = NEW.answer_text WHERE url_id = NEW.url_id;
+    END;
+    """,
+    )
+
+# each name is counted once per `ama_index` record, and leaves `ama_names` with its last record
+_NAME_INSERT = """
+        INSERT INTO ama_names(name, kind, num_records) VALUES({record}.fan_name, 'fan', 1)
+        ON CONFLICT(name, kind) DO UPDATE SET num_records = num_records + 1;
+        INSERT INTO ama_names(name, kind, num_records) VALUES({record}.cc_name, 'cc', 1)
+        ON CONFLICT(name, kind) DO UPDATE SET num_records = num_records + 1;
+"""
+_NAME_DELETE = """
+        UPDATE ama_names SET num_records = num_records - 1
+        WHERE (name = {record}.fan_name AND kind = 'fan') OR (name = {record}.cc_name AND kind = 'cc');
+        DELETE FROM ama_names
+        WHERE num_records = 0 AND ((name = {record}.fan_name AND kind = 'fan') OR (name = {record}.cc_name AND kind = 'cc'));
+"""
+
+NAME_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_names_index_insert AFTER INSERT ON ama_index
+    BEGIN%s    END;
+    """ % _NAME_INSERT.format(record="NEW"),
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_names_index_delete AFTER DELETE ON ama_index
+    BEGIN%s    END;
+    """ % _NAME_DELETE.format(record="OLD"),
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_names_index_update AFTER UPDATE OF cc_name, fan_name ON ama_index
+    BEGIN%s%s    END;
+    """ % (_NAME_DELETE.format(record="OLD"), _NAME_INSERT.format(record="NEW")),
+    # `ama_names_trigram` takes its content from `ama_names`, and is told of every change
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_names_trigram_insert AFTER INSERT ON ama_names
+    BEGIN
+        INSERT INTO ama_names_trigram(rowid, name) VALUES(NEW.name_id, NEW.name);
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_names_trigram_delete AFTER DELETE ON ama_names
+    BEGIN
+        INSERT INTO ama_names_trigram(ama_names_trigram, rowid, name) VALUES('delete', OLD.name_id, OLD.name);
+    END;
+    """,
+    )
+
+def create_ama_search(full_dbpath: Path) -> None:
+    """
+    Creates the `ama_search` full-text index over `ama_queries` in `full_dbpath`, and the triggers that keep it current.
+
+    Safe to call again; the index is rebuilt each time.
+
+    - full_dbpath: Tells function where the database file is.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_queries(
+                url_id TEXT PRIMARY KEY,
+                question_text TEXT NOT NULL,
+                answer_text TEXT NOT NULL
+            );
+            """)
+        # url_id is the key, not rowid: VACUUM may renumber the rowids of `ama_queries`
+        cnxn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS ama_search USING fts5(
+                url_id UNINDEXED,
+                question_text,
+                answer_text
+            );
+            """)
+        # recreate the triggers, in case they predate the current definitions
+        res = cnxn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name GLOB 'ama_search_*';")
+        for (trigger_name,) in res.fetchall():
+            cnxn.execute("DROP TRIGGER %s;" % trigger_name)
+        for trigger in SEARCH_TRIGGERS:
+            cnxn.execute(trigger)
+        cnxn.execute("DELETE FROM ama_search;")
+        zdict = load_zdict(cnxn)
+        res = cnxn.execute("SELECT url_id, question_text, answer_text FROM ama_queries;")
+        cnxn.executemany(
+            "INSERT INTO ama_search(url_id, question_text, answer_text) VALUES(?, ?, ?);",
+            [(url_id, decode_text(question, zdict), decode_text(answer, zdict)) for url_id, question, answer in res.fetchall()],
+            )
+    logging.info("`ama_search` created in %s", full_dbpath)
+
+def search_ama_queries(cnxn: sqlite3.Connection, query: str, limit: int) -> List[dict]:
+    """
+    Returns up to `limit` records whose `question_text` or `answer_text` match `query`, best match first.
+
+    Each record has `url_id`, `question_text`, `answer_text`, and `rank` (lower is better).
+
+    - cnxn: Open connection to a database with `ama_search`.
+    - query: FTS5 query string, e.g. 'glossaryck' or '"blood moon"'.
+    - limit: Maximum number of records to return.
+    """
+    cnxn.row_factory = sqlite3.Row
+    res = cnxn.execute("""
+        SELECT url_id, question_text, answer_text, rank
+        FROM ama_search
+        WHERE ama_search MATCH ?
+        ORDER BY rank
+        LIMIT ?;
+        """, (query, limit))
+    return [dict(row) for row in res.fetchall()]
+
+def create_ama_names(full_dbpath: Path) -> None:
+    """
+    Creates the `ama_names` table and its `ama_names_trigram` index in `full_dbpath`, and the triggers that keep
+    them current with `ama_index`.
+
+    Safe to call again; both are rebuilt each time.
+
+    - full_dbpath: Tells function where the database file is.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_index(
+                cc_name TEXT NOT NULL,
+                fan_name TEXT NOT NULL,
+                url_id TEXT NOT NULL
+            );
+            """)
+        # name_id is an alias for rowid, so VACUUM cannot renumber it under `ama_names_trigram`
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_names(
+                name_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                num_records INTEGER NOT NULL,
+                UNIQUE(name, kind)
+            );
+            """)
+        cnxn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS ama_names_trigram USING fts5(
+                name,
+                content = 'ama_names',
+                content_rowid = 'name_id',
+                tokenize = 'trigram'
+            );
+            """)
+        # `search_ama_records` looks up every record of a fan_name
+        cnxn.execute("CREATE INDEX IF NOT EXISTS ama_index_fan_name ON ama_index(fan_name);")
+        for trigger in NAME_TRIGGERS:
+            cnxn.execute(trigger)
+        cnxn.execute("DELETE FROM ama_names;")
+        cnxn.execute("""
+            INSERT INTO ama_names(name, kind, num_records)
+            SELECT fan_name, 'fan', COUNT(*) FROM ama_index GROUP BY fan_name
+            UNION ALL
+            SELECT cc_name, 'cc', COUNT(*) FROM ama_index GROUP BY cc_name;
+            """)
+        cnxn.execute("INSERT INTO ama_names_trigram(ama_names_trigram) VALUES('rebuild');")
+    logging.info("`ama_names` created in %s", full_dbpath)
+
+def _get_trigram_query(name: str) -> str:
+    """
+    Returns an FTS5 query that matches any of the trigrams of `name`, each quoted as a phrase.
+
+    - name: Name to look up; at least three characters long.
+    """
+    trigrams = sorted(set(name[charno:charno + 3] for charno in range(len(name) - 2)))
+    return " OR ".join('"%s"' % trigram.replace('"', '""') for trigram in trigrams)
+
+def search_ama_names(cnxn: sqlite3.Connection, name: str, limit: int, kind: Optional[str] = None) -> List[dict]:
+    """
+    Returns up to `limit` names that share the most trigrams with `name`, best match first, case-insensitively.
+
+    A name that equals `name` (ignoring case) always comes first. Names of fewer than three characters have no
+    trigrams; they are matched as substrings instead, shortest name first.
+    Each record has `name`, `kind` ('fan' or 'cc'), `num_records`, and `rank` (lower is better).
+
+    - cnxn: Open connection to a database with `ama_names`.
+    - name: Name to look up, e.g. 'coralinesparks'.
+    - limit: Maximum number of records to return.
+    - kind: Only return names of this kind, 'fan' or 'cc'.
+    """
+    cnxn.row_factory = sqlite3.Row
+    name = name.strip()
+    kind_filter = "" if kind is None else "AND ama_names.kind = :kind"
+    params = {"name": name, "kind": kind, "limit": limit}
+    if len(name) >= 3:
+        params["query"] = _get_trigram_query(name)
+        res = cnxn.execute("""
+            SELECT ama_names.name, ama_names.kind, ama_names.num_records, ama_names_trigram.rank
+            FROM ama_names_trigram
+            INNER JOIN ama_names ON ama_names.name_id = ama_names_trigram.rowid
+            WHERE ama_names_trigram MATCH :query %s
+            ORDER BY ama_names.name = :name COLLATE NOCASE DESC, ama_names_trigram.rank
+            LIMIT :limit;
+            """ % kind_filter, params)
+    else:
+        # too short for the trigram index; `ama_names` holds one row per distinct name, so this scan stays small
+        res = cnxn.execute("""
+            SELECT name, kind, num_records, length(name) AS rank FROM ama_names
+            WHERE instr(lower(name), lower(:name)) > 0 %s
+            ORDER BY ama_names.name = :name COLLATE NOCASE DESC, rank, name
+            LIMIT :limit;
+            """ % kind_filter, params)
+    return [dict(row) for row in res.fetchall()]
+
+def search_ama_records(cnxn: sqlite3.Connection, fan_name: str, limit: int) -> List[dict]:
+    """
+    Returns every `ama_index` record of the `limit` fan_names that best match `fan_name`, grouped by fan_name in
+    order of match, e.g. all questions by 'CoralineSparkss', however it was spelt.
+
+    - cnxn: Open connection to a database with `ama_names`.
+    - fan_name: fan_name to look up.
+    - limit: Maximum number of fan_names to return the records of.
+    """
+    ama_records = []
+    for match in search_ama_names(cnxn, fan_name, limit, kind="fan"):
+        res = cnxn.execute("SELECT cc_name, fan_name, url_id FROM ama_index WHERE fan_name = ?;", (match["name"],))
+        ama_records.extend(dict(row) for row in res.fetchall())
+    return ama_records
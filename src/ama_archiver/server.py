@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+"""
+This module serves the archive as read-only JSON over HTTP.
+- GET /creators: Lists every cc_name, with its number of records.
+- GET /creators/{cc_name}/queries?after={cursor}&limit={n}: Pages through a creator's Q&As; pass `next` back as `after`.
+- GET /queries/{url_id}: Returns the Q&A for a url_id, its `ama_details` if saved, and every index record that references it.
+- GET /search?q={query}&limit={n}: Full-text search; needs `search.create_ama_search` to have been run.
+- GET /names?q={name}&kind={fan|cc}&limit={n}: Fuzzy name search; needs `search.create_ama_names` to have been run.
+- GET /fans?q={name}&limit={n}: Every record of the `limit` fan_names that best match a name; also needs `ama_names`.
+
+- open_read_pool: Opens a pool of read-only connections to the database.
+- make_server: Makes an HTTP server over the database, with a connection pool and an LRU response cache.
+- serve: Runs `make_server` until interrupted.
+- AmaRequestHandler: Routes requests, and answers them from the response cache.
+- _borrow: Lends a connection from the pool for the duration of a with-block.
+- _has_table: Tells whether the database has a table, e.g. `ama_queries` before anything was scraped.
+- _render: Computes the (status, body) of a request path.
+"""
+
+from ama_archiver.constants import SERVER_HOST, SERVER_PORT, SERVER_POOL_SIZE, SERVER_CACHE_SIZE, SERVER_PAGE_SIZE
+from ama_archiver.search import search_ama_queries, search_ama_names, search_ama_records
+from ama_archiver.codec import load_zdict, decode_ama_query
+
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+import functools
+import json
+import logging
+import queue
+import sqlite3
+
+def open_read_pool(full_dbpath: Path, pool_size: int) -> queue.Queue:
+    """
+    Opens `pool_size` read-only connections to `full_dbpath`, and returns them in a queue.
+
+    - full_dbpath: Tells function where the database file is.
+    - pool_size: Number of connections to open.
+    """
+    db_uri = full_dbpath.resolve().as_uri() + "?mode=ro"
+    pool = queue.Queue()
+    for _ in range(pool_size):
+        cnxn = sqlite3.connect(db_uri, uri=True, check_same_thread=False)
+        cnxn.row_factory = sqlite3.Row
+        pool.put(cnxn)
+    return pool
+
+@contextmanager
+def _borrow(pool: queue.Queue) -> Iterator[sqlite3.Connection]:
+    """
+    Takes a connection from `pool`, waiting for one if all are in use, and returns it when the with-block exits.
+
+    - pool: Queue as returned by `open_read_pool`.
+    """
+    cnxn = pool.get()
+    try:
+        yield cnxn
+    finally:
+        pool.put(cnxn)
+
+def _has_table(cnxn: sqlite3.Connection, name: str) -> bool:
+    """
+    Returns True if the database behind `cnxn` has a table called `name`.
+
+    - cnxn: Open connection.
+    - name: Table name.
+    """
+    return cnxn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;", (name,)).fetchone() is not None
+
+def _render(pool: queue.Queue, path: str) -> Tuple[int, bytes]:
+    """
+    Computes the response to a GET of `path`, and returns it as (status, JSON body).
+
+    - pool: Queue as returned by `open_read_pool`.
+    - path: Request path, including the query string.
+    """
+    url = urlsplit(path)
+    params = parse_qs(url.query)
+    parts = [unquote(part) for part in url.path.strip("/").split("/")]
+    try:
+        limit = max(1, min(int(params.get("limit", [SERVER_PAGE_SIZE])[0]), SERVER_PAGE_SIZE))
+        after = int(params.get("after", [0])[0])
+    except ValueError:
+        return 400, json.dumps({"error": "limit and after must be integers"}).encode("utf-8")
+    with _borrow(pool) as cnxn:
+        if parts == ["creators"]:
+            res = cnxn.execute("SELECT cc_name, COUNT(*) AS num_records FROM ama_index GROUP BY cc_name ORDER BY cc_name;")
+            body = {"creators": [dict(row) for row in res]}
+        elif len(parts) == 3 and parts[0] == "creators" and parts[2] == "queries":
+            # keyset pagination on ama_index.rowid: each page starts where the last ended, instead of skipping OFFSET rows
+            if _has_table(cnxn, "ama_queries"):
+                select_texts = "question_text, answer_text FROM ama_index LEFT JOIN ama_queries ON ama_queries.url_id = ama_index.url_id"
+            else:
+                # nothing scraped yet
+                select_texts = "NULL AS question_text, NULL AS answer_text FROM ama_index"
+            res = cnxn.execute("""
+                SELECT ama_index.rowid AS cursor, fan_name, ama_index.url_id, %s
+                WHERE cc_name = ? AND ama_index.rowid > ?
+                ORDER BY ama_index.rowid
+                LIMIT ?;
+                """ % select_texts, (parts[1], after, limit))
+            zdict = load_zdict(cnxn)
+            records = [dict(row) for row in res]
+            for record in records:
+                if record["question_text"] is not None:
+                    decode_ama_query(record, zdict)
+            next_cursor = records[-1].pop("cursor") if len(records) == limit else None
+            for record in records:
+                record.pop("cursor", None)
+            body = {"cc_name": parts[1], "queries": records, "next": next_cursor}
+        elif len(parts) == 2 and parts[0] == "queries":
+            url_id = parts[1]
+            ama_query = None
+            if _has_table(cnxn, "ama_queries"):
+                ama_query = cnxn.execute("SELECT url_id, question_text, answer_text FROM ama_queries WHERE url_id = ?;", (url_id,)).fetchone()
+            records = cnxn.execute("SELECT cc_name, fan_name FROM ama_index WHERE url_id = ?;", (url_id,)).fetchall()
+            if ama_query is None and not records:
+                return 404, json.dumps({"error": "url_id not found: %s" % url_id}).encode("utf-8")
+            if ama_query is not None:
+                ama_query = decode_ama_query(dict(ama_query), load_zdict(cnxn))
+            ama_details = None
+            if _has_table(cnxn, "ama_details"):
+                ama_details = cnxn.execute("SELECT * FROM ama_details WHERE url_id = ?;", (url_id,)).fetchone()
+            body = {"url_id": url_id, "query": ama_query, "details": dict(ama_details) if ama_details else None, "records": [dict(row) for row in records]}
+        elif parts == ["search"]:
+            query = params.get("q", [""])[0]
+            if not query:
+                return 400, json.dumps({"error": "q is required"}).encode("utf-8")
+            try:
+                body = {"q": query, "queries": search_ama_queries(cnxn, query, limit)}
+            except sqlite3.OperationalError as op_err:
+                # no `ama_search` table, or malformed FTS5 syntax
+                return 400, json.dumps({"error": str(op_err)}).encode("utf-8")
+        elif parts in (["names"], ["fans"]):
+            name = params.get("q", [""])[0]
+            kind = params.get("kind", [None])[0]
+            if not name.strip():
+                return 400, json.dumps({"error": "q is required"}).encode("utf-8")
+            try:
+                if parts == ["names"]:
+                    body = {"q": name, "names": search_ama_names(cnxn, name, limit, kind)}
+                else:
+                    body = {"q": name, "records": search_ama_records(cnxn, name, limit)}
+            except sqlite3.OperationalError as op_err:
+                # no `ama_names` table
+                return 400, json.dumps({"error": str(op_err)}).encode("utf-8")
+        else:
+            return 404, json.dumps({"error": "no route for %s" % url.path}).encode("utf-8")
+    return 200, json.dumps(body).encode("utf-8")
+
+class AmaRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET requests from `self.server.get_response`, an LRU-cached `_render`.
+    """
+
+    def do_GET(self):
+        """
+        Writes the (possibly cached) response for `self.path`. Database errors are answered with a JSON 500, and not cached.
+        """
+        try:
+            status, body = self.server.get_response(self.path)
+        except sqlite3.Error as db_err:
+            logging.exception("Unable to answer %s", self.path)
+            status, body = 500, json.dumps({"error": str(db_err)}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        Sends access logs to `logging` instead of stderr.
+        """
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+def make_server(
+        full_dbpath: Path,
+        host: str = SERVER_HOST,
+        port: int = SERVER_PORT,
+        pool_size: int = SERVER_POOL_SIZE,
+        cache_size: int = SERVER_CACHE_SIZE,
+        ) -> ThreadingHTTPServer:
+    """
+    Makes a threaded HTTP server over `full_dbpath`, and returns it without starting it.
+
+    Responses are cached per request path, least recently used first out. The archive is expected not to change
+    while serving; restart the server (or serve a snapshot) to pick up new records.
+
+    - full_dbpath: Tells function where the database file is.
+    - host: Interface to listen on.
+    - port: Port to listen on; 0 picks a free port.
+    - pool_size: Number of read-only connections shared by the request threads.
+    - cache_size: Maximum number of responses kept in the cache.
+    """
+    server = ThreadingHTTPServer((host, port), AmaRequestHandler)
+    server.daemon_threads = True
+    server.pool = open_read_pool(full_dbpath, pool_size)
+    server.get_response = functools.lru_cache(maxsize=cache_size)(functools.partial(_render, server.pool))
+    return server
+
+def serve(full_dbpath: Path, host: str = SERVER_HOST, port: int = SERVER_PORT) -> None:
+    """
+    Serves `full_dbpath` on http://{host}:{port}/ until interrupted.
+
+    - full_dbpath: Tells function where the database file is.
+    - host: Interface to listen on.
+    - port: Port to listen on.
+    """
+    server = make_server(full_dbpath, host, port)
+    logging.info("Serving %s on http://%s:%d/", full_dbpath, host, server.server_address[1])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down.")
+    finally:
+        server.server_close()
+        while not server.pool.empty():
+            server.pool.get_nowait().close()
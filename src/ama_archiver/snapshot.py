@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+"""
+This module defines functions that snapshot the whole AMA thread once, and resolve Q&A records from the snapshot.
+- fetch_thread_snapshot: Fetches every comment in the AMA thread, expanding "load more comments" stubs.
+- save_snapshot: Saves a snapshot as JSON.
+- load_snapshot: Loads a snapshot saved by `save_snapshot`.
+- resolve_ama_queries: Resolves `question_text` and `answer_text` for a list of url_ids from a snapshot.
+- _walk_comments: Collects comments from a (nested) JSON listing, and notes the stubs that still need expanding.
+"""
+
+from ama_archiver.constants import OG_URL, MORECHILDREN_URL, THREAD_ID, API_BATCH_SIZE, USER_AGENT
+from ama_archiver.scraper import get_comment_text, get_comment_details, make_ama_details
+
+import requests as r
+
+from pathlib import Path
+import json
+import logging
+from typing import Dict, List, Optional
+
+# Only these fields are kept per comment, to keep the snapshot small.
+SNAPSHOT_FIELDS = ("id", "parent_id", "author", "body", "body_html", "score", "created_utc")
+
+def _walk_comments(things: List[dict], comments: Dict[str, dict], more_ids: List[str]) -> None:
+    """
+    Collects every comment in `things` (and their replies) into `comments`, and appends unexpanded ids to `more_ids`.
+
+    - things: 'children' of a JSON listing, or the flat 'things' returned by MORECHILDREN_URL.
+    - comments: id -> comment dict to store comments in.
+    - more_ids: list to store the ids of comments hidden behind "load more comments" stubs.
+    """
+    for thing in things:
+        kind = thing["kind"]
+        data = thing["data"]
+        if kind == "more":
+            # "continue this thread" stubs (no children) only appear past depth 10, well below any Q&A pair
+            more_ids.extend(data["children"])
+            continue
+        elif kind != "t1":
+            continue
+        comments[data["id"]] = {field: data.get(field) for field in SNAPSHOT_FIELDS}
+        replies = data.get("replies")
+        if replies:
+            _walk_comments(replies["data"]["children"], comments, more_ids)
+
+def fetch_thread_snapshot(thread_url: str = OG_URL) -> Dict[str, dict]:
+    """
+    Fetches the full comment tree of the thread at `thread_url`, and returns it as an id -> comment dict.
+
+    One request fetches the tree as far as Reddit renders it; the remaining comments are fetched
+    API_BATCH_SIZE at a time from MORECHILDREN_URL.
+
+    - thread_url: URL of the thread to snapshot.
+    """
+    headers = {"User-Agent": USER_AGENT}
+    logging.info("Fetching comment tree from %r", thread_url)
+    response = r.get(thread_url.rstrip("/") + ".json", params={"limit": 500}, headers=headers)
+    response.raise_for_status()
+    # [submission listing, comment listing]
+    comment_listing = response.json()[1]
+    comments = {}
+    more_ids = []
+    _walk_comments(comment_listing["data"]["children"], comments, more_ids)
+    num_requests = 1
+    while more_ids:
+        batch = [more_id for more_id in more_ids[:API_BATCH_SIZE] if more_id not in comments]
+        del more_ids[:API_BATCH_SIZE]
+        if not batch:
+            continue
+        params = {
+            "api_type": "json",
+            "link_id": "t3_" + THREAD_ID,
+            "children": ",".join(batch),
+        }
+        response = r.get(MORECHILDREN_URL, params=params, headers=headers)
+        response.raise_for_status()
+        num_requests += 1
+        num_comments = len(comments)
+        _walk_comments(response.json()["json"]["data"]["things"], comments, more_ids)
+        logging.info("Request %d: %d new comment(s); %d stub(s) left.", num_requests, len(comments) - num_comments, len(more_ids))
+    logging.info("Snapshot of %d comment(s) fetched in %d request(s).", len(comments), num_requests)
+    return comments
+
+def save_snapshot(comments: Dict[str, dict], full_path: Path) -> None:
+    """
+    Saves a snapshot to `full_path` as JSON.
+
+    - comments: id -> comment dict, as returned by `fetch_thread_snapshot`.
+    - full_path: Tells function where to save the snapshot.
+    """
+    logging.info("Writing snapshot of %d comment(s) to %r", len(comments), full_path)
+    full_path.write_text(json.dumps(comments))
+
+def load_snapshot(full_path: Path) -> Dict[str, dict]:
+    """
+    Loads a snapshot saved by `save_snapshot`.
+
+    - full_path: Tells function where to find the snapshot.
+    """
+    return json.loads(full_path.read_text())
+
+def resolve_ama_queries(comments: Dict[str, dict], url_ids: List[str], ama_details: Optional[List[dict]] = None) -> List[dict]:
+    """
+    Resolves `question_text` and `answer_text` for each url_id from a snapshot, and returns them as ama_query records.
+
+    Each url_id identifies the answer; its parent comment is the question.
+    url_ids missing from the snapshot are logged and left out.
+
+    - comments: id -> comment dict, as returned by `fetch_thread_snapshot`.
+    - url_ids: url_ids of the answers to resolve.
+    - ama_details: list to append an `ama_details` record to for each ama_query returned; skipped if None.
+    """
+    ama_queries = []
+    for url_id in url_ids:
+        answer = comments.get(url_id)
+        if answer is None:
+            logging.warning("url_id not found in snapshot: %r", url_id)
+            continue
+        question = comments.get(answer["parent_id"].split("_", 1)[-1])
+        if question is None:
+            logging.warning("Parent comment not found in snapshot for url_id: %r", url_id)
+            continue
+        ama_query = {
+            "url_id": url_id,
+            "question_text": get_comment_text(question),
+            "answer_text": get_comment_text(answer),
+        }
+        ama_queries.append(ama_query)
+        if ama_details is not None:
+            ama_details.append(make_ama_details(url_id, get_comment_details(question), get_comment_details(answer)))
+    return ama_queries
@@ -0,0 +1,242 @@
+#!/usr/bin/python3
+"""
+This module maintains per-creator statistics in an `ama_stats` table, kept current by triggers on `ama_index` and `ama_queries`.
+- create_ama_stats: Creates `ama_stats` and its triggers, and fills it from the current tables.
+- rebuild_ama_stats: Recomputes `ama_stats` from scratch.
+- load_ama_stats: Loads `ama_stats`, with averages and missing-answer counts derived per row.
+- main: Prints `ama_stats` for every content-creator, or for those named on the command line.
+
+Counts are per `ama_index` record: a url_id shared by two fans counts once for each.
+A record is a duplicate if its url_id is shared by any other record, as in `indexer.identify_duplicates`.
+"""
+
+from ama_archiver import constants
+from ama_archiver.codec import text_length_sql
+
+from pathlib import Path
+import sqlite3
+import logging
+import sys
+from typing import List, Optional
+
+# lengths are read through `text_length_sql`, so compressed values (see `codec`) count as the text they hold
+_LENGTHS = {
+    "question_length": text_length_sql("question_text"),
+    "answer_length": text_length_sql("answer_text"),
+    "new_question_length": text_length_sql("NEW.question_text"),
+    "new_answer_length": text_length_sql("NEW.answer_text"),
+    "old_question_length": text_length_sql("OLD.question_text"),
+    "old_answer_length": text_length_sql("OLD.answer_text"),
+    }
+
+STATS_TRIGGERS = tuple(trigger.format(**_LENGTHS) for trigger in (
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_stats_index_insert AFTER INSERT ON ama_index
+    BEGIN
+        INSERT OR IGNORE INTO ama_stats(cc_name) VALUES(NEW.cc_name);
+        UPDATE ama_stats SET
+            num_questions = num_questions + 1,
+            num_answered = num_answered + (SELECT COUNT(*) FROM ama_queries WHERE url_id = NEW.url_id),
+            num_empty_answers = num_empty_answers + (SELECT COUNT(*) FROM ama_queries WHERE url_id = NEW.url_id AND answer_text = ''),
+            total_question_length = total_question_length + COALESCE((SELECT {question_length} FROM ama_queries WHERE url_id = NEW.url_id), 0),
+            total_answer_length = total_answer_length + COALESCE((SELECT {answer_length} FROM ama_queries WHERE url_id = NEW.url_id), 0),
+            num_duplicates = num_duplicates + ((SELECT COUNT(*) FROM ama_index WHERE url_id = NEW.url_id) > 1)
+        WHERE cc_name = NEW.cc_name;
+        -- the first record to share its url_id becomes a duplicate too
+        UPDATE ama_stats SET num_duplicates = num_duplicates + 1
+        WHERE cc_name = (SELECT cc_name FROM ama_index WHERE url_id = NEW.url_id AND rowid != NEW.rowid)
+        AND (SELECT COUNT(*) FROM ama_index WHERE url_id = NEW.url_id) = 2;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_stats_index_delete AFTER DELETE ON ama_index
+    BEGIN
+        UPDATE ama_stats SET
+            num_questions = num_questions - 1,
+            num_answered = num_answered - (SELECT COUNT(*) FROM ama_queries WHERE url_id = OLD.url_id),
+            num_empty_answers = num_empty_answers - (SELECT COUNT(*) FROM ama_queries WHERE url_id = OLD.url_id AND answer_text = ''),
+            total_question_length = total_question_length - COALESCE((SELECT {question_length} FROM ama_queries WHERE url_id = OLD.url_id), 0),
+            total_answer_length = total_answer_length - COALESCE((SELECT {answer_length} FROM ama_queries WHERE url_id = OLD.url_id), 0),
+            num_duplicates = num_duplicates - ((SELECT COUNT(*) FROM ama_index WHERE url_id = OLD.url_id) > 0)
+        WHERE cc_name = OLD.cc_name;
+        -- the last record left with this url_id is no longer a duplicate
+        UPDATE ama_stats SET num_duplicates = num_duplicates - 1
+        WHERE cc_name = (SELECT cc_name FROM ama_index WHERE url_id = OLD.url_id)
+        AND (SELECT COUNT(*) FROM ama_index WHERE url_id = OLD.url_id) = 1;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_stats_index_update AFTER UPDATE OF cc_name, url_id ON ama_index
+    BEGIN
+        -- as ama_stats_index_delete for OLD, then ama_stats_index_insert for NEW; counts of the url_ids exclude this
+        -- row, so both halves hold whether or not the url_id changed
+        UPDATE ama_stats SET
+            num_questions = num_questions - 1,
+            num_answered = num_answered - (SELECT COUNT(*) FROM ama_queries WHERE url_id = OLD.url_id),
+            num_empty_answers = num_empty_answers - (SELECT COUNT(*) FROM ama_queries WHERE url_id = OLD.url_id AND answer_text = ''),
+            total_question_length = total_question_length - COALESCE((SELECT {question_length} FROM ama_queries WHERE url_id = OLD.url_id), 0),
+            total_answer_length = total_answer_length - COALESCE((SELECT {answer_length} FROM ama_queries WHERE url_id = OLD.url_id), 0),
+            num_duplicates = num_duplicates - ((SELECT COUNT(*) FROM ama_index WHERE url_id = OLD.url_id AND rowid != NEW.rowid) > 0)
+        WHERE cc_name = OLD.cc_name;
+        UPDATE ama_stats SET num_duplicates = num_duplicates - 1
+        WHERE cc_name = (SELECT cc_name FROM ama_index WHERE url_id = OLD.url_id AND rowid != NEW.rowid)
+        AND (SELECT COUNT(*) FROM ama_index WHERE url_id = OLD.url_id AND rowid != NEW.rowid) = 1;
+        INSERT OR IGNORE INTO ama_stats(cc_name) VALUES(NEW.cc_name);
+        UPDATE ama_stats SET
+            num_questions = num_questions + 1,
+            num_answered = num_answered + (SELECT COUNT(*) FROM ama_queries WHERE url_id = NEW.url_id),
+            num_empty_answers = num_empty_answers + (SELECT COUNT(*) FROM ama_queries WHERE url_id = NEW.url_id AND answer_text = ''),
+            total_question_length = total_question_length + COALESCE((SELECT {question_length} FROM ama_queries WHERE url_id = NEW.url_id), 0),
+            total_answer_length = total_answer_length + COALESCE((SELECT {answer_length} FROM ama_queries WHERE url_id = NEW.url_id), 0),
+            num_duplicates = num_duplicates + ((SELECT COUNT(*) FROM ama_index WHERE url_id = NEW.url_id AND rowid != NEW.rowid) > 0)
+        WHERE cc_name = NEW.cc_name;
+        UPDATE ama_stats SET num_duplicates = num_duplicates + 1
+        WHERE cc_name = (SELECT cc_name FROM ama_index WHERE url_id = NEW.url_id AND rowid != NEW.rowid)
+        AND (SELECT COUNT(*) FROM ama_index WHERE url_id = NEW.url_id AND rowid != NEW.rowid) = 1;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_stats_queries_insert AFTER INSERT ON ama_queries
+    BEGIN
+        UPDATE ama_stats SET
+            num_answered = num_answered + matches.num_records,
+            num_empty_answers = num_empty_answers + matches.num_records * (NEW.answer_text = ''),
+            total_question_length = total_question_length + matches.num_records * {new_question_length},
+            total_answer_length = total_answer_length + matches.num_records * {new_answer_length}
+        FROM (SELECT cc_name, COUNT(*) AS num_records FROM ama_index WHERE url_id = NEW.url_id GROUP BY cc_name) AS matches
+        WHERE ama_stats.cc_name = matches.cc_name;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_stats_queries_delete AFTER DELETE ON ama_queries
+    BEGIN
+        UPDATE ama_stats SET
+            num_answered = num_answered - matches.num_records,
+            num_empty_answers = num_empty_answers - matches.num_records * (OLD.answer_text = ''),
+            total_question_length = total_question_length - matches.num_records * {old_question_length},
+            total_answer_length = total_answer_length - matches.num_records * {old_answer_length}
+        FROM (SELECT cc_name, COUNT(*) AS num_records FROM ama_index WHERE url_id = OLD.url_id GROUP BY cc_name) AS matches
+        WHERE ama_stats.cc_name = matches.cc_name;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS ama_stats_queries_update AFTER UPDATE OF question_text, answer_text ON ama_queries
+    BEGIN
+        UPDATE ama_stats SET
+            num_empty_answers = num_empty_answers + matches.num_records * ((NEW.answer_text = '') - (OLD.answer_text = '')),
+            total_question_length = total_question_length + matches.num_records * ({new_question_length} - {old_question_length}),
+            total_answer_length = total_answer_length + matches.num_records * ({new_answer_length} - {old_answer_length})
+        FROM (SELECT cc_name, COUNT(*) AS num_records FROM ama_index WHERE url_id = NEW.url_id GROUP BY cc_name) AS matches
+        WHERE ama_stats.cc_name = matches.cc_name;
+    END;
+    """,
+    ))
+
+def rebuild_ama_stats(cnxn: sqlite3.Connection) -> None:
+    """
+    Recomputes every row of `ama_stats` from `ama_index` and `ama_queries`.
+
+    - cnxn: Open connection to the database; the caller commits.
+    """
+    cnxn.execute("DELETE FROM ama_stats;")
+    cnxn.execute("""
+        INSERT INTO ama_stats
+        SELECT
+            ama_index.cc_name,
+            COUNT(*),
+            COUNT(ama_queries.url_id),
+            COUNT(CASE WHEN ama_queries.answer_text = '' THEN 1 END),
+            COALESCE(SUM(%s), 0),
+            COALESCE(SUM(%s), 0),
+            COUNT(CASE WHEN shared.url_id IS NOT NULL THEN 1 END)
+        FROM ama_index
+        LEFT JOIN ama_queries ON ama_queries.url_id = ama_index.url_id
+        LEFT JOIN (SELECT url_id FROM ama_index GROUP BY url_id HAVING COUNT(*) > 1) AS shared ON shared.url_id = ama_index.url_id
+        GROUP BY ama_index.cc_name;
+        """ % (text_length_sql("ama_queries.question_text"), text_length_sql("ama_queries.answer_text")))
+
+def create_ama_stats(full_dbpath: Path) -> None:
+    """
+    Creates the `ama_stats` table and the triggers that maintain it in `full_dbpath`, and fills it from the current tables.
+
+    Safe to call again; the table is recomputed each time.
+
+    - full_dbpath: Tells function where the database file is.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_index(
+                cc_name TEXT NOT NULL,
+                fan_name TEXT NOT NULL,
+                url_id TEXT NOT NULL
+            );
+            """)
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_queries(
+                url_id TEXT PRIMARY KEY,
+                question_text TEXT NOT NULL,
+                answer_text TEXT NOT NULL
+            );
+            """)
+        cnxn.execute("""
+            CREATE TABLE IF NOT EXISTS ama_stats(
+                cc_name TEXT PRIMARY KEY,
+                num_questions INTEGER NOT NULL DEFAULT 0,
+                num_answered INTEGER NOT NULL DEFAULT 0,
+                num_empty_answers INTEGER NOT NULL DEFAULT 0,
+                total_question_length INTEGER NOT NULL DEFAULT 0,
+                total_answer_length INTEGER NOT NULL DEFAULT 0,
+                num_duplicates INTEGER NOT NULL DEFAULT 0
+            );
+            """)
+        # the triggers look up records by url_id on every insert
+        cnxn.execute("CREATE INDEX IF NOT EXISTS ama_index_url_id ON ama_index(url_id);")
+        # recreate the triggers, in case they predate the current definitions
+        res = cnxn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name GLOB 'ama_stats_*';")
+        for (trigger_name,) in res.fetchall():
+            cnxn.execute("DROP TRIGGER %s;" % trigger_name)
+        for trigger in STATS_TRIGGERS:
+            cnxn.execute(trigger)
+        rebuild_ama_stats(cnxn)
+    logging.info("`ama_stats` created in %s", full_dbpath)
+
+def load_ama_stats(full_dbpath: Path, cc_name: Optional[str] = None) -> List[dict]:
+    """
+    Loads `ama_stats` as List[dict], adding `num_missing_answers`, `avg_question_length` and `avg_answer_length` to each row.
+
+    - full_dbpath: Tells function where to find `ama_stats`.
+    - cc_name: Only load the row for this content-creator.
+    """
+    with sqlite3.connect(full_dbpath) as cnxn:
+        cnxn.row_factory = sqlite3.Row
+        if cc_name is None:
+            res = cnxn.execute("SELECT * FROM ama_stats ORDER BY cc_name;")
+        else:
+            res = cnxn.execute("SELECT * FROM ama_stats WHERE cc_name = ?;", (cc_name,))
+        ama_stats = [dict(row) for row in res.fetchall()]
+    for cc_stats in ama_stats:
+        num_answered = cc_stats["num_answered"]
+        cc_stats["num_missing_answers"] = cc_stats["num_questions"] - num_answered + cc_stats["num_empty_answers"]
+        cc_stats["avg_question_length"] = cc_stats["total_question_length"] / num_answered if num_answered else 0.0
+        cc_stats["avg_answer_length"] = cc_stats["total_answer_length"] / num_answered if num_answered else 0.0
+    return ama_stats
+
+def main(argv: List[str]) -> None:
+    """
+    Prints `ama_stats` from '{ODIR_NAME}/{AMA_DBNAME}.db', one content-creator per line.
+
+    - argv: cc_names to print; prints every content-creator if empty.
+    """
+    full_dbpath = Path(constants.ODIR_NAME, constants.AMA_DBNAME + ".db")
+    if argv:
+        ama_stats = [cc_stats for cc_name in argv for cc_stats in load_ama_stats(full_dbpath, cc_name)]
+    else:
+        ama_stats = load_ama_stats(full_dbpath)
+    fields = ("num_questions", "num_answered", "num_missing_answers", "num_duplicates", "avg_question_length", "avg_answer_length")
+    print("\t".join(("cc_name",) + fields))
+    for cc_stats in ama_stats:
+        values = ["%.1f" % cc_stats[field] if field.startswith("avg") else str(cc_stats[field]) for field in fields]
+        print("\t".join([cc_stats["cc_name"]] + values))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
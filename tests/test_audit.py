@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'audit' module.
+- audit_ama_queries
+- load_ama_flags
+- requeue_flagged_queries
+"""
+
+from ama_archiver import audit, indexer, rawstore, scraper
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+class AmaAuditTest(unittest.TestCase):
+    """
+    Contains tests to see that 'audit' module works as intended.
+    """
+
+    @staticmethod
+    def make_page(url_id: str, question_text: str, answer_text: str, author: str) -> str:
+        """
+        Returns a comment page in which the fan's question is answered by `author` in comment `url_id`.
+        """
+        return f"""
+            <div class="thing link" data-author="thread_op" data-fullname="t3_cll9u5">
+                <div class="entry"><div class="usertext-body"><p>Skipped.</p></div></div>
+            </div>
+            <div class="thing comment" data-author="fan" data-fullname="t1_q{url_id}">
+                <div class="entry"><div class="usertext-body"><p>{question_text}</p></div></div>
+                <div class="child">
+                    <div class="thing comment" data-author="{author}" data-fullname="t1_{url_id}">
+                        <div class="entry"><div class="usertext-body"><p>{answer_text}</p></div></div>
+                    </div>
+                </div>
+            </div>
+            """
+
+    def setUp(self):
+        """
+        Creates a database and a pack file of the records' pages.
+
+        ama_queries: 'a1' and 'a2' are sound; 'a3' was answered by another account; 'a4' has an empty answer;
+        'a5' has its question and answer swapped; 'a6' has no cached page.
+        """
+        self.ama_queries = [
+            {"url_id": "a%d" % recordno, "question_text": "Question %d?" % recordno, "answer_text": "Answer %d." % recordno}
+            for recordno in range(1, 7)
+        ]
+        self.ama_queries[3]["answer_text"] = ""
+        self.ama_queries[4]["question_text"], self.ama_queries[4]["answer_text"] = "Answer 5.", "Question 5?"
+        self.ama_index = [{"cc_name": "Daron Nefcy", "fan_name": "fan", "url_id": ama_query["url_id"]} for ama_query in self.ama_queries]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_audit-test.db")
+        self.pack_path = self.odir_path.joinpath("ama_audit-test.pack")
+        self.tearDown()
+        indexer.bulk_save_ama_index(self.ama_index, self.full_dbpath)
+        scraper.save_ama_queries_to_db(self.ama_queries, self.full_dbpath)
+        raw_pages = [
+            ("a1", self.make_page("a1", "Question 1?", "Answer 1.", "dnefcy")),
+            ("a2", self.make_page("a2", "Question 2?", "Answer 2.", "dnefcy")),
+            ("a3", self.make_page("a3", "Question 3?", "Answer 3.", "not_dnefcy")),
+            ("a4", self.make_page("a4", "Question 4?", "", "dnefcy")),
+            ("a5", self.make_page("a5", "Question 5?", "Answer 5.", "dnefcy")),
+        ]
+        rawstore.append_raw_pages(raw_pages, self.pack_path)
+
+    def tearDown(self):
+        """
+        Removes the test database and pack file.
+        """
+        for path in (self.full_dbpath, self.pack_path, rawstore._get_index_path(self.pack_path)):
+            path.unlink(missing_ok=True)
+
+    def test_audit_ama_queries(self):
+        """
+        Tests that each faulty record is flagged for what is wrong with it, and sound records are not.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            ama_flags = audit.audit_ama_queries(self.full_dbpath, self.pack_path, executor=executor)
+        self.assertEqual([(ama_flag["url_id"], ama_flag["flag"]) for ama_flag in ama_flags], [
+            ("a3", "author_mismatch"),
+            ("a4", "empty_answer"),
+            ("a5", "answer_mismatch"),
+            ("a5", "question_after_answer"),
+            ("a5", "question_mismatch"),
+            ("a6", "missing_page"),
+        ])
+        self.assertEqual(ama_flags[0]["detail"], "not_dnefcy, expected dnefcy")
+        self.assertEqual(ama_flags[2]["detail"], "Answer 5.")
+        self.assertEqual([ama_flag["flag"] for ama_flag in audit.load_ama_flags(self.full_dbpath)], [ama_flag["flag"] for ama_flag in ama_flags])
+
+    def test_audit_in_processes(self):
+        """
+        Tests that the default process pool gives the same flags, and that text checks run without a pack file.
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            expected_flags = audit.audit_ama_queries(self.full_dbpath, self.pack_path, executor=executor)
+        self.assertEqual(audit.audit_ama_queries(self.full_dbpath, self.pack_path, max_workers=2), expected_flags)
+        self.assertEqual(audit.audit_ama_queries(self.full_dbpath), [{"url_id": "a4", "flag": "empty_answer", "detail": None}])
+
+    def test_requeue_flagged_queries(self):
+        """
+        Tests that auditing leaves `ama_queries` alone, and that only page-verifiable flags are requeued: not the
+        record fetched by another backend, which has no page, nor the guessed author mismatch.
+        """
+        self.assertEqual(audit.requeue_flagged_queries(self.full_dbpath), [])
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            audit.audit_ama_queries(self.full_dbpath, self.pack_path, executor=executor)
+        self.assertEqual(scraper.load_ama_queries_from_db(self.full_dbpath), self.ama_queries)
+        with self.assertRaises(ValueError):
+            audit.requeue_flagged_queries(self.full_dbpath, ("empty_answer", "missing_page"))
+        self.assertEqual(audit.requeue_flagged_queries(self.full_dbpath, ("empty_answer",)), ["a4"])
+        self.assertEqual(audit.requeue_flagged_queries(self.full_dbpath), ["a4", "a5"])
+        queried_urls = set(ama_query["url_id"] for ama_query in scraper.load_ama_queries_from_db(self.full_dbpath))
+        self.assertEqual(queried_urls, {"a1", "a2", "a3", "a6"})
+        self.assertEqual(sorted(indexer.plan_ama_queries(self.ama_index, queried_urls)), ["a4", "a5"])
+        self.assertEqual(audit.requeue_flagged_queries(self.full_dbpath, ("author_mismatch",)), ["a3"])
@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'backup' module.
+- backup_database
+- compact_database
+- snapshot_database
+"""
+
+from ama_archiver import backup, scraper
+
+from pathlib import Path
+import sqlite3
+import threading
+import unittest
+
+class AmaBackupTest(unittest.TestCase):
+    """
+    Contains tests to see that 'backup' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Creates a database of a few hundred pages, and the paths to back it up to.
+        """
+        self.ama_queries = [
+            {"url_id": "e%05d" % recordno, "question_text": "Question %d? " % recordno * 10, "answer_text": "Answer %d. " % recordno * 20}
+            for recordno in range(2000)
+        ]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_backup-test.db")
+        self.backup_path = self.odir_path.joinpath("ama_backup-test-backup.db")
+        self.compact_path = self.odir_path.joinpath("ama_backup-test-compact.db")
+        self.tearDown()
+        scraper.save_ama_queries_to_db(self.ama_queries, self.full_dbpath)
+
+    def tearDown(self):
+        """
+        Removes the test databases.
+        """
+        for full_dbpath in (self.full_dbpath, self.backup_path, self.compact_path):
+            if full_dbpath.exists():
+                full_dbpath.chmod(0o644)
+                full_dbpath.unlink()
+
+    def test_backup_database(self):
+        """
+        Tests that the backup holds every record, and that its report adds up.
+        """
+        report = backup.backup_database(self.full_dbpath, self.backup_path, pages=16)
+        self.assertEqual(scraper.load_ama_queries_from_db(self.backup_path), self.ama_queries)
+        self.assertEqual(report["size"], self.full_dbpath.stat().st_size)
+        self.assertGreater(report["pages"], 16)
+        self.assertGreater(report["bytes_per_second"], 0)
+        self.assertFalse(self.backup_path.with_name(self.backup_path.name + ".partial").exists())
+
+    def test_backup_during_writes(self):
+        """
+        Tests that a backup taken while another connection writes holds whole transactions only.
+        """
+        stop = threading.Event()
+        def write():
+            with sqlite3.connect(self.full_dbpath, timeout=30) as cnxn:
+                batchno = 0
+                while not stop.is_set():
+                    # each transaction renames one record; a torn copy could hold it twice, or not at all
+                    cnxn.execute("INSERT INTO ama_queries SELECT url_id || 'x', question_text, answer_text FROM ama_queries WHERE url_id = ?;", ("e%05d" % batchno,))
+                    cnxn.execute("DELETE FROM ama_queries WHERE url_id = ?;", ("e%05d" % batchno,))
+                    cnxn.commit()
+                    batchno += 1
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            backup.backup_database(self.full_dbpath, self.backup_path, pages=4)
+        finally:
+            stop.set()
+            writer.join()
+        with sqlite3.connect(self.backup_path) as cnxn:
+            self.assertEqual(cnxn.execute("PRAGMA integrity_check;").fetchone()[0], "ok")
+            self.assertEqual(cnxn.execute("SELECT COUNT(*) FROM ama_queries;").fetchone()[0], len(self.ama_queries))
+
+    def test_snapshot_database(self):
+        """
+        Tests that the compacted copy is read-only, no larger than the backup, and holds every record.
+        """
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("DELETE FROM ama_queries WHERE url_id > 'e01000';")
+        report = backup.snapshot_database(self.full_dbpath, self.backup_path, self.compact_path)
+        self.assertLess(report["compact_size"], report["size"])
+        self.assertEqual(scraper.load_ama_queries_from_db(self.compact_path), self.ama_queries[:1001])
+        self.assertFalse(self.compact_path.stat().st_mode & 0o222)
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'codec' module.
+- train_zdict
+- encode_text
+- decode_text
+- compress_ama_queries
+- decompress_ama_queries
+"""
+
+from ama_archiver import codec, scraper, indexer, stats, search, lookup
+
+from pathlib import Path
+import sqlite3
+import unittest
+
+class AmaCodecTest(unittest.TestCase):
+    """
+    Contains tests to see that 'codec' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Creates a database with `ama_stats` and `ama_search` enabled over a small, repetitive corpus.
+
+        ama_queries: Records to compress; url_id '3' has an empty answer, and url_id '4' a short, non-ASCII one.
+        """
+        self.ama_index = [
+            {"cc_name": "cc_name1", "fan_name": "fan_name%d" % recordno, "url_id": str(recordno)}
+            for recordno in range(1, 5)
+        ]
+        self.ama_queries = [
+            {"url_id": "1", "question_text": "What is your favourite episode of Star vs. the Forces of Evil?", "answer_text": "My favourite episode of Star vs. the Forces of Evil is the one with the Blood Moon."},
+            {"url_id": "2", "question_text": "What is your favourite song of Star vs. the Forces of Evil?", "answer_text": "My favourite song of Star vs. the Forces of Evil is the one at the Blood Moon Ball."},
+            {"url_id": "3", "question_text": "What is your favourite character of Star vs. the Forces of Evil?", "answer_text": ""},
+            {"url_id": "4", "question_text": "Glossaryck?", "answer_text": "Oui, très."},
+        ]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_codec-test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+        indexer.save_ama_index(self.ama_index, self.full_dbpath)
+        scraper.save_ama_queries_to_db(self.ama_queries, self.full_dbpath)
+        stats.create_ama_stats(self.full_dbpath)
+        search.create_ama_search(self.full_dbpath)
+        lookup.clear_lookup_cache()
+
+    def tearDown(self):
+        """
+        Removes the test database.
+        """
+        self.full_dbpath.unlink()
+
+    def load_typeofs(self) -> list:
+        """
+        Returns the storage class of each (question_text, answer_text), by url_id.
+        """
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            res = cnxn.execute("SELECT typeof(question_text), typeof(answer_text) FROM ama_queries ORDER BY url_id;")
+            return res.fetchall()
+
+    def test_train_zdict(self):
+        """
+        Tests that the dictionary holds recurring runs, and respects its size limit.
+        """
+        texts = [text for ama_query in self.ama_queries for text in (ama_query["question_text"], ama_query["answer_text"])]
+        zdict = codec.train_zdict(texts)
+        self.assertIn(b"Forces of Evil", zdict)
+        self.assertNotIn(b"Glossaryck", zdict)
+        self.assertLessEqual(len(codec.train_zdict(texts, 64)), 64)
+
+    def test_encode_text(self):
+        """
+        Tests that values round-trip, and that empty or incompressible values stay text.
+        """
+        zdict = codec.train_zdict(ama_query["answer_text"] for ama_query in self.ama_queries)
+        for ama_query in self.ama_queries:
+            for field in ("question_text", "answer_text"):
+                text = ama_query[field]
+                self.assertEqual(codec.decode_text(codec.encode_text(text, zdict), zdict), text)
+        value = codec.encode_text(self.ama_queries[0]["answer_text"], zdict)
+        self.assertIsInstance(value, bytes)
+        self.assertTrue(value.startswith(b"%d:" % len(self.ama_queries[0]["answer_text"])))
+        self.assertEqual(codec.encode_text("", zdict), "")
+        self.assertEqual(codec.encode_text("Oui, très.", zdict), "Oui, très.")
+        with self.assertRaises(ValueError):
+            codec.decode_text(value, None)
+
+    def test_compress_ama_queries(self):
+        """
+        Tests that values are compressed in place, and that loaders, `ama_stats` and `ama_search` are unaffected.
+        """
+        expected_stats = stats.load_ama_stats(self.full_dbpath)
+        text_size, stored_size = codec.compress_ama_queries(self.full_dbpath)
+        self.assertLess(stored_size, text_size)
+        self.assertEqual(self.load_typeofs(), [("blob", "blob"), ("blob", "blob"), ("blob", "text"), ("text", "text")])
+        self.assertEqual(scraper.load_ama_queries_from_db(self.full_dbpath), self.ama_queries)
+        self.assertEqual(lookup.lookup_ama_query(self.full_dbpath, "2"), self.ama_queries[1])
+        self.assertEqual(stats.load_ama_stats(self.full_dbpath), expected_stats)
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            stats.rebuild_ama_stats(cnxn)
+            self.assertEqual([record["url_id"] for record in search.search_ama_queries(cnxn, '"blood moon ball"', 10)], ["2"])
+        self.assertEqual(stats.load_ama_stats(self.full_dbpath), expected_stats)
+        # the triggers keep counting text lengths when compressed records are removed
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("DELETE FROM ama_queries WHERE url_id = '1';")
+        triggered_stats = stats.load_ama_stats(self.full_dbpath)
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            stats.rebuild_ama_stats(cnxn)
+        self.assertEqual(triggered_stats, stats.load_ama_stats(self.full_dbpath))
+
+    def test_decompress_ama_queries(self):
+        """
+        Tests that decompressing restores every value to text, and drops the dictionary.
+        """
+        codec.compress_ama_queries(self.full_dbpath, vacuum=False)
+        codec.compress_ama_queries(self.full_dbpath, vacuum=False)
+        self.assertEqual(scraper.load_ama_queries_from_db(self.full_dbpath), self.ama_queries)
+        codec.decompress_ama_queries(self.full_dbpath)
+        self.assertEqual(self.load_typeofs(), [("text", "text")] * 4)
+        self.assertEqual(scraper.load_ama_queries_from_db(self.full_dbpath), self.ama_queries)
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            self.assertIsNone(codec.load_zdict(cnxn))
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'exporter' module.
+- annotate_repeat
+- iter_fan_listings
+- export_metadata
+- verify_metadata
+"""
+
+from ama_archiver import exporter, indexer
+
+from pathlib import Path
+import re
+import shutil
+import unittest
+
+class AmaExporterTest(unittest.TestCase):
+    """
+    Contains tests to see that 'exporter' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Rebuilds an `ama_index` from the metadata directory checked into the repo.
+
+        metadata_path: The repo's metadata directory.
+        ama_index: One record per line of each '{cc_name}.txt', with repeat annotations removed.
+        full_dbpath: Database containing `ama_index`.
+        """
+        self.metadata_path = Path("metadata")
+        self.ama_index = []
+        for cc_path in sorted(self.metadata_path.glob("*.txt")):
+            if cc_path.name == "filenames.txt":
+                continue
+            for line in cc_path.read_text().splitlines():
+                fan_name = re.sub(r" \(again( again)*\)$", "", line)
+                self.ama_index.append({"cc_name": cc_path.stem, "fan_name": fan_name, "url_id": line})
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_index-export_test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+        indexer.save_ama_index(self.ama_index, self.full_dbpath)
+
+    def tearDown(self):
+        """
+        Removes the test database.
+        """
+        self.full_dbpath.unlink()
+
+    def test_annotate_repeat(self):
+        """
+        Tests that one 'again' is added per repeat.
+        """
+        self.assertEqual(exporter.annotate_repeat("Joe_Zt", 0), "Joe_Zt")
+        self.assertEqual(exporter.annotate_repeat("Joe_Zt", 1), "Joe_Zt (again)")
+        self.assertEqual(exporter.annotate_repeat("Joe_Zt", 3), "Joe_Zt (again again again)")
+
+    def test_iter_fan_listings(self):
+        """
+        Tests that each cc_name is listed once, with its fans in the same order as the checked-in files.
+        """
+        listings = dict(exporter.iter_fan_listings(self.full_dbpath))
+        self.assertEqual(len(listings), 4)
+        expected = Path("metadata", "Adam McArthur.txt").read_text().splitlines()
+        self.assertListEqual(listings["Adam McArthur"], expected)
+
+    def test_export_metadata(self):
+        """
+        Tests that the exported directory matches the checked-in one, file for file.
+        """
+        metadata_path = self.odir_path.joinpath("metadata")
+        shutil.rmtree(metadata_path, ignore_errors=True)
+        exporter.export_metadata(self.full_dbpath, metadata_path)
+        exported = sorted(path.relative_to(metadata_path) for path in metadata_path.rglob("*.txt"))
+        expected = sorted(path.relative_to(self.metadata_path) for path in self.metadata_path.rglob("*.txt"))
+        self.assertListEqual(exported, expected)
+        for relpath in expected:
+            self.assertEqual(metadata_path.joinpath(relpath).read_text(), self.metadata_path.joinpath(relpath).read_text())
+        shutil.rmtree(metadata_path)
+
+    def test_verify_metadata(self):
+        """
+        Tests that the checked-in directory is in sync, and that drift is reported.
+        """
+        self.assertListEqual(exporter.verify_metadata(self.full_dbpath, self.metadata_path), [])
+        metadata_path = self.odir_path.joinpath("metadata")
+        shutil.rmtree(metadata_path, ignore_errors=True)
+        exporter.export_metadata(self.full_dbpath, metadata_path)
+        metadata_path.joinpath("Daron Nefcy.txt").write_text("Joe_Zt\n")
+        diff_lines = exporter.verify_metadata(self.full_dbpath, metadata_path)
+        shutil.rmtree(metadata_path)
+        self.assertIn("+Joe_Zt (again)\n", diff_lines)
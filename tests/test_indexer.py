@@ -8,6 +8,16 @@ Tests that 'indexer' module functions work as intended.
 - identify_duplicates: Identifies (cc_name, fan_name) pairs whose URLs appear more than once in the index.
 - get_urlid: Returns the url ID for a given URL.
 - get_full_url: Returns full URL for the given url_id (i.e. str that completes the url template, and transforms it into a functioning URL)
+- diff_ama_index: Compares two Q&A indices by url_id, and reports added, removed and moved url_ids.
+- refresh_ama_index: Applies only the difference between a new Q&A index and the stored one.
+- save_url_remaps, load_url_remaps: Saves and loads corrections to compendium links.
+- apply_url_remaps: Corrects the url_id of every record that has a remap.
+- remap_ama_index: Applies the `ama_remaps` table to the stored index.
+- plan_ama_queries: Collapses an index into the unique url_ids that have yet to be fetched.
+- bulk_save_ama_index: Streams Q&A records into a database file in one transaction.
+- iter_ama_records: Yields Q&A records with their url_ids, straight from the compendium.
+- normalize_urls: Extracts (thread_id, comment_id) from a whole column of URLs, and reports the malformed ones.
+- normalize_ama_index: Swaps each record's URL for its url_id, and removes records whose URL is malformed.
 """
 
 from ama_archiver import indexer
@@ -136,6 +146,9 @@ class AmaIndexerTest(unittest.TestCase):
         expected = self.url_id
         actual = indexer.get_urlid(url)
         self.assertEqual(expected, actual)
+        with self.assertRaises(ValueError):
+            indexer.get_urlid("https://old.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/")
+        self.assertEqual(indexer.get_urlid(url.upper(), "cll9u5"), expected)
 
     def test_get_url(self):
         """
@@ -213,3 +226,196 @@ class AmaIndexerTest(unittest.TestCase):
         actual.sort(key=original_order)
         self.assertListEqual(actual, expected)
 
+    def test_diff_ama_index(self):
+        """
+        Tests that url_ids are reported as added, removed or moved.
+        """
+        old_index = [
+            {"cc_name": "cc_name1", "fan_name": "fan_name1", "url_id": "1"},
+            {"cc_name": "cc_name1", "fan_name": "fan_name2", "url_id": "2"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name4", "url_id": "3"},
+        ]
+        new_index = [
+            {"cc_name": "cc_name1", "fan_name": "fan_name1", "url_id": "1"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name2", "url_id": "2"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name5", "url_id": "4"},
+        ]
+        expected = {"added": ["4"], "removed": ["3"], "moved": ["2"]}
+        actual = indexer.diff_ama_index(old_index, new_index)
+        self.assertDictEqual(expected, actual)
+
+    def test_refresh_ama_index(self):
+        """
+        Tests that only the difference is applied, that `ama_queries` survives, and that only unscraped url_ids are returned.
+        """
+        full_dbpath = self.odir_path.joinpath("ama_index-refresh_test.db")
+        full_dbpath.unlink(missing_ok=True)
+        old_index = [
+            {"cc_name": "cc_name1", "fan_name": "fan_name1", "url_id": "1"},
+            {"cc_name": "cc_name1", "fan_name": "fan_name2", "url_id": "2"},
+        ]
+        new_index = [
+            {"cc_name": "cc_name1", "fan_name": "fan_name1", "url_id": "1"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name2", "url_id": "2"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name5", "url_id": "4"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name6", "url_id": "5"},
+        ]
+        self.assertEqual(indexer.refresh_ama_index(old_index, full_dbpath), ["1", "2"])
+        with sqlite3.connect(full_dbpath) as cnxn:
+            cnxn.execute("CREATE TABLE ama_queries(url_id TEXT PRIMARY KEY, question_text TEXT NOT NULL, answer_text TEXT NOT NULL);")
+            cnxn.execute("INSERT INTO ama_queries VALUES('5', 'question_text', 'answer_text');")
+        new_urls = indexer.refresh_ama_index(new_index, full_dbpath)
+        actual = indexer.load_ama_index(full_dbpath)
+        with sqlite3.connect(full_dbpath) as cnxn:
+            num_queries = cnxn.execute("SELECT COUNT(*) FROM ama_queries;").fetchone()[0]
+        full_dbpath.unlink()
+        self.assertEqual(new_urls, ["4"])
+        self.assertEqual(num_queries, 1)
+        actual.sort(key=new_index.index)
+        self.assertListEqual(actual, new_index)
+
+    def test_refresh_ama_index_after_remaps(self):
+        """
+        Tests that refreshing into a fresh database that already holds `ama_remaps`, as `__main__` does, saves the index as is.
+        """
+        full_dbpath = self.odir_path.joinpath("ama_index-refresh_remaps_test.db")
+        full_dbpath.unlink(missing_ok=True)
+        new_index = [{"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "evw8g9o"}]
+        indexer.save_url_remaps([("Daron Nefcy", "Joe_Zt", "evw8mcl", "evw8g9o")], full_dbpath)
+        new_urls = indexer.refresh_ama_index(new_index, full_dbpath)
+        actual = indexer.load_ama_index(full_dbpath)
+        full_dbpath.unlink()
+        self.assertEqual(new_urls, ["evw8g9o"])
+        self.assertListEqual(actual, new_index)
+
+    def test_apply_url_remaps(self):
+        """
+        Tests that only the (cc_name, fan_name, url_id) named by a remap is corrected.
+        """
+        ama_index = [
+            {"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "evw8mcl"},
+            {"cc_name": "Daron Nefcy", "fan_name": "ShinySaturn", "url_id": "evw8mcl"},
+        ]
+        url_remaps = [{"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "evw8mcl", "new_url_id": "evw8g9o"}]
+        num_remapped = indexer.apply_url_remaps(ama_index, url_remaps)
+        self.assertEqual(num_remapped, 1)
+        self.assertEqual([ama_record["url_id"] for ama_record in ama_index], ["evw8g9o", "evw8mcl"])
+
+    def test_remap_ama_index(self):
+        """
+        Tests that remaps are saved, loaded, and applied to the stored index.
+        """
+        full_dbpath = self.odir_path.joinpath("ama_index-remap_test.db")
+        full_dbpath.unlink(missing_ok=True)
+        ama_index = [
+            {"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "evw8mcl"},
+            {"cc_name": "Daron Nefcy", "fan_name": "ShinySaturn", "url_id": "evw8mcl"},
+        ]
+        indexer.save_ama_index(ama_index, full_dbpath)
+        self.assertListEqual(indexer.load_url_remaps(full_dbpath), [])
+        indexer.save_url_remaps([("Daron Nefcy", "Joe_Zt", "evw8mcl", "evw8g9o")], full_dbpath)
+        self.assertEqual(len(indexer.load_url_remaps(full_dbpath)), 1)
+        self.assertEqual(indexer.remap_ama_index(full_dbpath), 1)
+        self.assertEqual(indexer.remap_ama_index(full_dbpath), 0)
+        actual = indexer.load_ama_index(full_dbpath)
+        full_dbpath.unlink()
+        self.assertListEqual(indexer.identify_duplicates(actual), [])
+        self.assertIn({"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "evw8g9o"}, actual)
+
+    def test_plan_ama_queries(self):
+        """
+        Tests that records sharing a url_id are fetched once, and that fetched url_ids are skipped.
+        """
+        ama_index = self.ama_index.copy()
+        for record in ama_index:
+            record["url_id"] = record.pop("url")
+        fetch_plan = indexer.plan_ama_queries(ama_index, ["3"])
+        self.assertEqual(list(fetch_plan), ["1", "2", "4"])
+        self.assertEqual([record["fan_name"] for record in fetch_plan["1"]], ["fan_name1", "fan_name3"])
+
+    def test_bulk_save_ama_index(self):
+        """
+        Tests that records streamed from the compendium are saved, indexed, and leave the journal mode as it was.
+        """
+        raw_index = self.raw_index.replace('href="', 'href="https://old.reddit.com/r/x/comments/cll9u5/y/')
+        raw_index = raw_index.replace('">', '/">')
+        full_dbpath = self.odir_path.joinpath("ama_index-bulk_test.db")
+        full_dbpath.unlink(missing_ok=True)
+        ama_records = indexer.iter_ama_records(raw_index, self.start_text + ":")
+        num_inserted = indexer.bulk_save_ama_index(ama_records, full_dbpath)
+        actual = indexer.load_ama_index(full_dbpath)
+        with sqlite3.connect(full_dbpath) as cnxn:
+            journal_mode = cnxn.execute("PRAGMA journal_mode;").fetchone()[0]
+            index_names = [row[0] for row in cnxn.execute("SELECT name FROM sqlite_master WHERE type = 'index';")]
+        full_dbpath.unlink()
+        expected = self.ama_index.copy()
+        for record in expected:
+            record["url_id"] = record.pop("url")
+        self.assertEqual(num_inserted, len(expected))
+        self.assertListEqual(actual, expected)
+        self.assertEqual(journal_mode, "delete")
+        self.assertIn("ama_index_url_id", index_names)
+
+    def test_bulk_save_ama_index_twice(self):
+        """
+        Tests that loading into an existing `ama_index` is skipped, rather than doubling every row, and that remaps
+        are applied as records stream past.
+        """
+        full_dbpath = self.odir_path.joinpath("ama_index-bulk_twice_test.db")
+        full_dbpath.unlink(missing_ok=True)
+        ama_index = [{"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "evw8mcl"}]
+        url_remaps = [{"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "evw8mcl", "new_url_id": "evw8g9o"}]
+        self.assertEqual(indexer.bulk_save_ama_index(indexer.iter_url_remaps(ama_index, url_remaps), full_dbpath), 1)
+        self.assertEqual(indexer.bulk_save_ama_index([{"cc_name": "a", "fan_name": "b", "url_id": "c"}], full_dbpath), 0)
+        actual = indexer.load_ama_index(full_dbpath)
+        full_dbpath.unlink()
+        self.assertListEqual(actual, [{"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "evw8g9o"}])
+
+    def test_normalize_urls(self):
+        """
+        Tests that variant links are normalized, and that malformed links and links into other threads are reported.
+        """
+        urls = [
+            self.url,
+            "https://np.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/star_vs_the_forces_of_evil_ask_me_anything/evw3fne",
+            "old.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/star_vs/evw3fne?context=3#siteTable",
+            "https://www.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/star_vs_the_forces_of_evil_ask_me_anything/",
+            "https://www.reddit.com/r/StarVStheForcesofEvil/comments/clnrdv/link_compendium/evw3fne/",
+            "fan_name1",
+            "https://www.reddit.com/r/StarVStheForcesofEvil/comments/CLL9U5/star_vs/EVW3FNE/",
+        ]
+        url_ids, malformed = indexer.normalize_urls(urls, "cll9u5")
+        self.assertEqual(url_ids, [("cll9u5", self.url_id)] * 3 + [None] * 3 + [("cll9u5", self.url_id)])
+        self.assertEqual([position for position, _ in malformed], [3, 4, 5])
+        url_ids, malformed = indexer.normalize_urls(urls)
+        self.assertEqual(url_ids[4], ("clnrdv", self.url_id))
+
+    def test_off_thread_links(self):
+        """
+        Tests that both build paths, by list and by stream, drop a link into another thread.
+        """
+        off_thread_url = "https://www.reddit.com/r/StarVStheForcesofEvil/comments/clnrdv/link_compendium/evw3fne/"
+        raw_index = self.raw_index.replace('href="', 'href="https://old.reddit.com/r/x/comments/cll9u5/y/')
+        raw_index = raw_index.replace('">', '/">')
+        raw_index = raw_index.replace('https://old.reddit.com/r/x/comments/cll9u5/y/2/', off_thread_url, 1)
+        ama_index = indexer.compile_ama_index(raw_index, self.start_text + ":")
+        malformed_records = indexer.normalize_ama_index(ama_index, "cll9u5")
+        ama_records = list(indexer.iter_ama_records(raw_index, self.start_text + ":", "cll9u5"))
+        self.assertEqual(len(malformed_records), 1)
+        self.assertEqual(ama_records, ama_index)
+        self.assertNotIn("evw3fne", [ama_record["url_id"] for ama_record in ama_records])
+        self.assertEqual(indexer.get_urlid(off_thread_url), "evw3fne")
+        with self.assertRaises(ValueError):
+            indexer.get_urlid(off_thread_url, "cll9u5")
+
+    def test_normalize_ama_index(self):
+        """
+        Tests that URLs are swapped for url_ids, and that records with malformed URLs are removed and returned.
+        """
+        ama_index = [
+            {"cc_name": "cc_name1", "fan_name": "fan_name1", "url": self.url},
+            {"cc_name": "cc_name1", "fan_name": "fan_name2", "url": "2"},
+        ]
+        malformed_records = indexer.normalize_ama_index(ama_index)
+        self.assertEqual(ama_index, [{"cc_name": "cc_name1", "fan_name": "fan_name1", "url_id": self.url_id}])
+        self.assertEqual(malformed_records, [{"cc_name": "cc_name1", "fan_name": "fan_name2", "url_id": None}])
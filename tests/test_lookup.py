@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'lookup' module.
+- lookup_url_id
+- clear_lookup_cache
+"""
+
+import ama_archiver
+from ama_archiver import lookup, indexer, scraper
+
+from pathlib import Path
+import unittest
+
+class AmaLookupTest(unittest.TestCase):
+    """
+    Contains tests to see that 'lookup' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Creates a database with one shared url_id, and one url_id that has not been scraped.
+        """
+        self.ama_index = [
+            {"cc_name": "cc_name1", "fan_name": "fan_name1", "url_id": "1"},
+            {"cc_name": "cc_name1", "fan_name": "fan_name3", "url_id": "1"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name4", "url_id": "3"},
+        ]
+        self.ama_query = {"url_id": "1", "question_text": "question_text", "answer_text": "answer_text"}
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_lookup-test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+        indexer.save_ama_index(self.ama_index, self.full_dbpath)
+        scraper.save_ama_query_to_db(self.ama_query, self.full_dbpath)
+        lookup.clear_lookup_cache()
+
+    def tearDown(self):
+        """
+        Removes the test database, and empties the cache.
+        """
+        self.full_dbpath.unlink()
+        lookup.clear_lookup_cache()
+
+    def test_lookup_url_id(self):
+        """
+        Tests that records and queries are found, and that unscraped or unknown url_ids come back empty.
+        """
+        ama_records, ama_query = ama_archiver.lookup_url_id(self.full_dbpath, "1")
+        self.assertListEqual(ama_records, self.ama_index[:2])
+        self.assertDictEqual(ama_query, self.ama_query)
+        self.assertListEqual(ama_archiver.lookup_ama_records(self.full_dbpath, "3"), self.ama_index[2:])
+        self.assertIsNone(ama_archiver.lookup_ama_query(self.full_dbpath, "3"))
+        self.assertEqual(ama_archiver.lookup_url_id(self.full_dbpath, "404"), ([], None))
+
+    def test_lookup_cache(self):
+        """
+        Tests that repeated lookups hit the cache, that callers cannot corrupt it, and that it can be cleared.
+        """
+        ama_query = lookup.lookup_ama_query(self.full_dbpath, "1")
+        ama_query["answer_text"] = "corrupted"
+        self.assertDictEqual(lookup.lookup_ama_query(str(self.full_dbpath), "1"), self.ama_query)
+        self.assertEqual(lookup._fetch_url_id.cache_info().hits, 1)
+        self.assertIsNone(lookup.lookup_ama_query(self.full_dbpath, "3"))
+        scraper.save_ama_query_to_db(dict(self.ama_query, url_id="3"), self.full_dbpath)
+        self.assertIsNone(lookup.lookup_ama_query(self.full_dbpath, "3"))
+        lookup.clear_lookup_cache()
+        self.assertIsNotNone(lookup.lookup_ama_query(self.full_dbpath, "3"))
+
+    def test_get_url(self):
+        """
+        Tests that the precomputed URL matches the one built from URL_TEMPLATE.
+        """
+        expected = "https://old.reddit.com/r/StarVStheForcesofEvil/comments/cll9u5/star_vs_the_forces_of_evil_ask_me_anything/evw3fne/?context=3"
+        self.assertEqual(ama_archiver.get_url("evw3fne"), expected)
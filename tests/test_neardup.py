@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'neardup' module.
+- shingle
+- estimate_similarity
+- create_ama_minhash
+- update_ama_minhash
+- find_near_duplicates
+"""
+
+from ama_archiver import neardup, scraper, codec
+
+from pathlib import Path
+import sqlite3
+import unittest
+
+class AmaNearDupTest(unittest.TestCase):
+    """
+    Contains tests to see that 'neardup' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Creates a database with `ama_minhash` enabled.
+
+        ama_queries: url_ids '1' and '2' hold a question and its repost; '3' is unrelated; '4' and '5' were deleted.
+        """
+        self.ama_queries = [
+            {"url_id": "1", "question_text": "Hi Adam! What was your favourite song to write for the Blood Moon Ball episode?", "answer_text": "a"},
+            {"url_id": "2", "question_text": "hi adam, what was your favourite song to write for the blood moon ball episode??", "answer_text": "b"},
+            {"url_id": "3", "question_text": "Is Glossaryck older than Mewni itself, or did he arrive later?", "answer_text": "c"},
+            {"url_id": "4", "question_text": "[deleted]", "answer_text": "d"},
+            {"url_id": "5", "question_text": "[deleted]", "answer_text": "e"},
+        ]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_neardup-test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+        scraper.save_ama_queries_to_db(self.ama_queries[:4], self.full_dbpath)
+        neardup.create_ama_minhash(self.full_dbpath)
+
+    def tearDown(self):
+        """
+        Removes the test database.
+        """
+        self.full_dbpath.unlink()
+
+    def find_pairs(self, **kwargs) -> list:
+        """
+        Returns the (url_id, other_url_id) pairs of `find_near_duplicates`.
+        """
+        return [(pair["url_id"], pair["other_url_id"]) for pair in neardup.find_near_duplicates(self.full_dbpath, **kwargs)]
+
+    def test_shingle(self):
+        """
+        Tests that case, punctuation and spacing do not change the shingles.
+        """
+        self.assertEqual(neardup.shingle("Blood  Moon!"), neardup.shingle("blood moon"))
+        self.assertEqual(len(neardup.shingle("abcdef")), 2)
+        self.assertEqual(neardup.shingle("?!"), set())
+
+    def test_estimate_similarity(self):
+        """
+        Tests that similar texts have similar signatures, and unrelated texts do not.
+        """
+        signatures = [neardup.make_signature(neardup.shingle(ama_query["question_text"])) for ama_query in self.ama_queries[:3]]
+        self.assertEqual(neardup.estimate_similarity(signatures[0], signatures[0]), 1.0)
+        self.assertGreater(neardup.estimate_similarity(signatures[0], signatures[1]), 0.8)
+        self.assertLess(neardup.estimate_similarity(signatures[0], signatures[2]), 0.2)
+
+    def test_find_near_duplicates(self):
+        """
+        Tests that reposts are found, and that deleted questions are not paired with each other.
+        """
+        self.assertEqual(self.find_pairs(), [("1", "2")])
+        self.assertEqual(self.find_pairs(url_id="2"), [("2", "1")])
+        self.assertEqual(self.find_pairs(url_id="3"), [])
+
+    def test_update_ama_minhash(self):
+        """
+        Tests that only new and edited questions are signed, and that deletes drop their signatures.
+        """
+        scraper.save_ama_queries_to_db(self.ama_queries[4:], self.full_dbpath)
+        self.assertEqual(neardup.update_ama_minhash(self.full_dbpath), 1)
+        self.assertEqual(neardup.update_ama_minhash(self.full_dbpath), 0)
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("UPDATE ama_queries SET question_text = ? WHERE url_id = '3';", (self.ama_queries[0]["question_text"],))
+        self.assertEqual(neardup.update_ama_minhash(self.full_dbpath), 1)
+        self.assertEqual(self.find_pairs(url_id="3"), [("3", "1"), ("3", "2")])
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("DELETE FROM ama_queries WHERE url_id = '1';")
+        self.assertEqual(self.find_pairs(), [("2", "3")])
+        # compressing in place leaves the signatures alone
+        codec.compress_ama_queries(self.full_dbpath, vacuum=False)
+        self.assertEqual(neardup.update_ama_minhash(self.full_dbpath), 0)
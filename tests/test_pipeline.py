@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'pipeline' module.
+- run_pipeline
+"""
+
+from ama_archiver import pipeline, scraper, rawstore
+
+import requests as r
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import sqlite3
+import unittest
+from unittest.mock import patch
+
+class AmaPipelineTest(unittest.TestCase):
+    """
+    Contains tests to see that 'pipeline' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Contains a page template, and a fresh database path.
+
+        url_ids: url_ids to run through the pipeline.
+        full_dbpath: Database to save records to.
+        """
+        self.url_ids = ["spongebob", "patrick", "squidward", "sandy", "plankton"]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_queries-pipeline_test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+
+    def tearDown(self):
+        """
+        Removes the test database.
+        """
+        self.full_dbpath.unlink(missing_ok=True)
+
+    @staticmethod
+    def make_page(url: str) -> str:
+        """
+        Returns a comment page whose question and answer name the url_id in `url`.
+        """
+        url_id = url.split("/")[-2]
+        return f"""
+            <div class='usertext-body'><p>Skipped.</p></div>
+            <div class='usertext-body'><p>Question for {url_id}</p></div>
+            <div class='usertext-body'><p>Answer from {url_id}</p></div>
+        """
+
+    @patch("ama_archiver.pipeline.fetch_raw_page")
+    def test_run_pipeline(self, mock_fetch):
+        """
+        Tests that every url_id is fetched, parsed and saved, across several write batches.
+        """
+        mock_fetch.side_effect = self.make_page
+        with ThreadPoolExecutor(max_workers=2) as parse_executor:
+            num_saved = asyncio.run(pipeline.run_pipeline(self.url_ids, self.full_dbpath, num_fetchers=2, batch_size=2, parse_executor=parse_executor))
+        self.assertEqual(num_saved, len(self.url_ids))
+        actual = scraper.load_ama_queries_from_db(self.full_dbpath)
+        expected = [
+            {"url_id": url_id, "question_text": f"Question for {url_id}", "answer_text": f"Answer from {url_id}"}
+            for url_id in self.url_ids
+        ]
+        actual.sort(key=expected.index)
+        self.assertListEqual(actual, expected)
+        ama_details = scraper.load_ama_details_from_db(self.full_dbpath)
+        self.assertEqual(sorted(record["url_id"] for record in ama_details), sorted(self.url_ids))
+        self.assertTrue(all(record["answer_body_html"] == "<p>Answer from %s</p>" % record["url_id"] for record in ama_details))
+
+    @patch("ama_archiver.pipeline.fetch_raw_page")
+    def test_run_pipeline_keeps_raw_pages(self, mock_fetch):
+        """
+        Tests that the raw page of every saved record is appended to the pack file.
+        """
+        mock_fetch.side_effect = self.make_page
+        pack_path = self.odir_path.joinpath("raw_pages-pipeline_test.pack")
+        with ThreadPoolExecutor(max_workers=2) as parse_executor:
+            asyncio.run(pipeline.run_pipeline(self.url_ids, self.full_dbpath, batch_size=2, parse_executor=parse_executor, pack_path=pack_path))
+        pack_index = rawstore.load_pack_index(pack_path)
+        raw_page = rawstore.read_raw_page("sandy", pack_path, pack_index)
+        pack_path.unlink()
+        rawstore._get_index_path(pack_path).unlink()
+        self.assertEqual(set(pack_index), set(self.url_ids))
+        self.assertIn("Answer from sandy", raw_page)
+
+    @patch("ama_archiver.pipeline.fetch_raw_page")
+    def test_run_pipeline_stops_on_connection_error(self, mock_fetch):
+        """
+        Tests that a refused connection stops fetching, but that pages already fetched are still saved.
+        """
+        pages = [self.make_page(pipeline.get_url("spongebob")), r.exceptions.ConnectionError()]
+        mock_fetch.side_effect = pages
+        with ThreadPoolExecutor(max_workers=1) as parse_executor:
+            num_saved = asyncio.run(pipeline.run_pipeline(self.url_ids, self.full_dbpath, num_fetchers=1, parse_executor=parse_executor))
+        self.assertEqual(num_saved, 1)
+        self.assertEqual(mock_fetch.call_count, 2)
+
+    @patch("ama_archiver.pipeline.fetch_raw_page")
+    def test_run_pipeline_saves_batches_on_fetch_error(self, mock_fetch):
+        """
+        Tests that a fetch error mid-run, whether from requests or not, still saves the records fetched before it,
+        though they fill less than one batch.
+        """
+        for error in (r.exceptions.HTTPError("503 Server Error"), RuntimeError("unexpected")):
+            self.full_dbpath.unlink(missing_ok=True)
+            pages = [self.make_page(pipeline.get_url(url_id)) for url_id in self.url_ids[:3]] + [error]
+            mock_fetch.side_effect = pages
+            with ThreadPoolExecutor(max_workers=1) as parse_executor:
+                run = pipeline.run_pipeline(self.url_ids, self.full_dbpath, num_fetchers=1, batch_size=10, parse_executor=parse_executor)
+                if isinstance(error, r.exceptions.RequestException):
+                    self.assertEqual(asyncio.run(run), 3)
+                else:
+                    with self.assertRaises(RuntimeError):
+                        asyncio.run(run)
+            saved_urls = sorted(ama_query["url_id"] for ama_query in scraper.load_ama_queries_from_db(self.full_dbpath))
+            self.assertEqual(saved_urls, sorted(self.url_ids[:3]))
+
+    @patch("ama_archiver.pipeline.save_ama_queries_to_db")
+    @patch("ama_archiver.pipeline.fetch_raw_page")
+    def test_run_pipeline_raises_on_write_error(self, mock_fetch, mock_save):
+        """
+        Tests that a failed save, e.g. a locked database, stops every stage and is raised, even with both queues full.
+        """
+        mock_fetch.side_effect = self.make_page
+        mock_save.side_effect = sqlite3.OperationalError("database is locked")
+        url_ids = ["e%04d" % urlno for urlno in range(4 * pipeline.PIPELINE_QUEUE_SIZE)]
+        with ThreadPoolExecutor(max_workers=2) as parse_executor:
+            run = pipeline.run_pipeline(url_ids, self.full_dbpath, num_fetchers=2, batch_size=2, parse_executor=parse_executor)
+            with self.assertRaises(sqlite3.OperationalError):
+                # a hang fails the test instead of stalling it
+                asyncio.run(asyncio.wait_for(run, timeout=30))
+        self.assertLess(mock_fetch.call_count, len(url_ids))
+
+    @patch("ama_archiver.pipeline._parse_page")
+    @patch("ama_archiver.pipeline.fetch_raw_page")
+    def test_run_pipeline_skips_unparsable_pages(self, mock_fetch, mock_parse):
+        """
+        Tests that a page that fails to parse is skipped, and the other pages are saved.
+        """
+        mock_fetch.side_effect = self.make_page
+        def parse_page(raw_page: str) -> tuple:
+            if "patrick" in raw_page:
+                raise AttributeError("'NoneType' object has no attribute 'text'")
+            ama_query = {}
+            ama_details = {}
+            scraper.parse_ama_query(raw_page, ama_query, ama_details)
+            return ama_query, ama_details
+        mock_parse.side_effect = parse_page
+        with ThreadPoolExecutor(max_workers=1) as parse_executor:
+            num_saved = asyncio.run(pipeline.run_pipeline(self.url_ids, self.full_dbpath, parse_executor=parse_executor))
+        self.assertEqual(num_saved, len(self.url_ids) - 1)
+
+    @patch("ama_archiver.pipeline.fetch_raw_page")
+    def test_run_pipeline_with_process_pool(self, mock_fetch):
+        """
+        Tests that pages are parsed in the default process pool.
+        """
+        mock_fetch.side_effect = self.make_page
+        num_saved = asyncio.run(pipeline.run_pipeline(self.url_ids[:2], self.full_dbpath))
+        self.assertEqual(num_saved, 2)
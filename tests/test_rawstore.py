@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'rawstore' module.
+- append_raw_pages
+- load_pack_index
+- read_raw_page
+- iter_raw_pages
+"""
+
+from ama_archiver import rawstore
+
+from pathlib import Path
+import unittest
+
+class AmaRawstoreTest(unittest.TestCase):
+    """
+    Contains tests to see that 'rawstore' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Contains sample pages, and a fresh pack file path.
+
+        raw_pages: (url_id, raw_page) pairs to store.
+        pack_path: Pack file to store them in.
+        """
+        self.raw_pages = [
+            ("spongebob", "<html><p>I'm ready!</p></html>" * 20),
+            ("patrick", "<html><p>Is mayonnaise an instrument?</p></html>"),
+            ("squidward", "<html><p>♫ clarinet ♫</p></html>"),
+        ]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.pack_path = self.odir_path.joinpath("raw_pages-test.pack")
+        self.pack_path.unlink(missing_ok=True)
+        rawstore._get_index_path(self.pack_path).unlink(missing_ok=True)
+
+    def tearDown(self):
+        """
+        Removes the pack file and its index.
+        """
+        self.pack_path.unlink(missing_ok=True)
+        rawstore._get_index_path(self.pack_path).unlink(missing_ok=True)
+
+    def test_append_raw_pages(self):
+        """
+        Tests that pages are compressed, and that every frame is indexed back to back.
+        """
+        rawstore.append_raw_pages(self.raw_pages[:2], self.pack_path)
+        rawstore.append_raw_pages(self.raw_pages[2:], self.pack_path)
+        pack_index = rawstore.load_pack_index(self.pack_path)
+        self.assertEqual(list(pack_index), [url_id for url_id, _ in self.raw_pages])
+        end = 0
+        for offset, length in pack_index.values():
+            self.assertEqual(offset, end)
+            end = offset + length
+        self.assertEqual(self.pack_path.stat().st_size, end)
+        self.assertLess(end, sum(len(raw_page) for _, raw_page in self.raw_pages))
+
+    def test_read_raw_page(self):
+        """
+        Tests that any page can be read back at random, and that the latest frame for a url_id wins.
+        """
+        rawstore.append_raw_pages(self.raw_pages, self.pack_path)
+        rawstore.append_raw_pages([("patrick", "<html>Updated</html>")], self.pack_path)
+        self.assertEqual(rawstore.read_raw_page("squidward", self.pack_path), self.raw_pages[2][1])
+        self.assertEqual(rawstore.read_raw_page("patrick", self.pack_path), "<html>Updated</html>")
+
+    def test_iter_raw_pages(self):
+        """
+        Tests that pages stream back in write order, optionally filtered by url_id.
+        """
+        self.assertEqual(list(rawstore.iter_raw_pages(self.pack_path)), [])
+        rawstore.append_raw_pages(self.raw_pages, self.pack_path)
+        self.assertEqual(list(rawstore.iter_raw_pages(self.pack_path)), self.raw_pages)
+        actual = list(rawstore.iter_raw_pages(self.pack_path, ["squidward", "plankton", "spongebob"]))
+        self.assertEqual(actual, [self.raw_pages[0], self.raw_pages[2]])
+
+    def test_iter_raw_pages_empty_pack(self):
+        """
+        Tests that an empty pack file, e.g. truncated before its frames were written, yields no pages.
+        """
+        self.pack_path.touch()
+        self.assertEqual(list(rawstore.iter_raw_pages(self.pack_path)), [])
+        rawstore.append_raw_pages(self.raw_pages, self.pack_path)
+        self.pack_path.write_bytes(b"")
+        self.assertEqual(list(rawstore.iter_raw_pages(self.pack_path)), [])
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'recheck' module.
+- hash_ama_query
+- init_ama_checks
+- select_stale_urls
+- record_ama_check
+"""
+
+from ama_archiver import recheck, scraper
+
+from pathlib import Path
+import sqlite3
+import unittest
+
+class AmaRecheckTest(unittest.TestCase):
+    """
+    Contains tests to see that 'recheck' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Creates a database with two scraped records.
+
+        ama_queries: Records as originally scraped.
+        full_dbpath: Database containing `ama_queries`.
+        """
+        self.ama_queries = [
+            {"url_id": "spongebob", "question_text": "Is mayonnaise an instrument?", "answer_text": "No, Patrick."},
+            {"url_id": "squidward", "question_text": "Clarinet?", "answer_text": "Yes."},
+        ]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_checks-test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+        scraper.save_ama_queries_to_db(self.ama_queries, self.full_dbpath)
+        recheck.init_ama_checks(self.full_dbpath)
+
+    def tearDown(self):
+        """
+        Removes the test database.
+        """
+        self.full_dbpath.unlink()
+
+    def test_hash_ama_query(self):
+        """
+        Tests that the hash depends on both texts, and not on the url_id.
+        """
+        ama_query = self.ama_queries[0]
+        same_content = dict(ama_query, url_id="plankton")
+        edited = dict(ama_query, answer_text="No, Patrick. (edit: typo)")
+        self.assertEqual(recheck.hash_ama_query(ama_query), recheck.hash_ama_query(same_content))
+        self.assertNotEqual(recheck.hash_ama_query(ama_query), recheck.hash_ama_query(edited))
+
+    def test_select_stale_urls(self):
+        """
+        Tests that only records older than `max_age` are selected, previously edited ones first.
+        """
+        recheck.record_ama_check(self.ama_queries[0], self.full_dbpath, fetched_at=100)
+        edited = dict(self.ama_queries[1], answer_text="Yes. And the clarinet.")
+        recheck.record_ama_check(edited, self.full_dbpath, fetched_at=200)
+        self.assertEqual(recheck.select_stale_urls(self.full_dbpath, 50, 10, now=300), ["squidward", "spongebob"])
+        self.assertEqual(recheck.select_stale_urls(self.full_dbpath, 150, 10, now=300), ["spongebob"])
+        self.assertEqual(recheck.select_stale_urls(self.full_dbpath, 50, 1, now=300), ["squidward"])
+
+    def test_record_ama_check(self):
+        """
+        Tests that a revision is written only when the content changes, and that `ama_queries` holds the latest text.
+        """
+        self.assertFalse(recheck.record_ama_check(self.ama_queries[0], self.full_dbpath, fetched_at=100))
+        edited = dict(self.ama_queries[0], answer_text="No, Patrick. (edit: typo)")
+        self.assertTrue(recheck.record_ama_check(edited, self.full_dbpath, fetched_at=200))
+        self.assertFalse(recheck.record_ama_check(edited, self.full_dbpath, fetched_at=300))
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            revisions = cnxn.execute("SELECT url_id, answer_text, fetched_at FROM ama_revisions;").fetchall()
+        self.assertEqual(revisions, [("spongebob", "No, Patrick.", 100)])
+        actual = scraper.load_ama_queries_from_db(self.full_dbpath)
+        self.assertIn(edited, actual)
+        with self.assertRaises(ValueError):
+            recheck.record_ama_check(dict(edited, url_id="plankton"), self.full_dbpath)
+
+    def test_record_ama_check_deleted(self):
+        """
+        Tests that a question deleted on Reddit does not overwrite the archived one, while an edit to its answer is still recorded.
+        """
+        deleted = dict(self.ama_queries[0], question_text="[deleted]")
+        self.assertFalse(recheck.record_ama_check(deleted, self.full_dbpath, fetched_at=100))
+        self.assertIn(self.ama_queries[0], scraper.load_ama_queries_from_db(self.full_dbpath))
+        self.assertEqual(recheck.select_stale_urls(self.full_dbpath, 50, 10, now=120), ["squidward"])
+        edited = dict(deleted, answer_text="No, Patrick. (edit: typo)")
+        self.assertTrue(recheck.record_ama_check(edited, self.full_dbpath, fetched_at=200))
+        self.assertIn(dict(edited, question_text=self.ama_queries[0]["question_text"]), scraper.load_ama_queries_from_db(self.full_dbpath))
@@ -3,6 +3,11 @@
 Contains tests for the functions defined in the 'scraper' module.
 - fetch_ama_query
 - fetch_ama_queries
+- parse_ama_query
+- fetch_ama_queries_json
+- save_ama_queries_to_db
+- get_comment_details
+- save_ama_details_to_db
 """
 
 from ama_archiver import scraper
@@ -66,6 +71,66 @@ class AmaScraperTest(unittest.TestCase):
         expected = self.ama_query
         self.assertDictEqual(actual, expected)
 
+    def test_parse_ama_query(self):
+        """
+        Tests that the 2nd and 3rd comment bodies are parsed as question and answer.
+        """
+        raw_page = f"""
+            <div class='usertext-body'><p>Skipped.</p></div>
+            <div class='usertext-body'><p>{self.question_text}</p></div>
+            <div class='usertext-body'><p>{self.answer_text}</p></div>
+        """
+        actual = {}
+        scraper.parse_ama_query(raw_page, actual)
+        expected = {"question_text": self.question_text, "answer_text": self.answer_text}
+        self.assertDictEqual(actual, expected)
+
+    @patch("requests.get")
+    def test_fetch_ama_queries_json(self, mock_rget):
+        """
+        Tests that answers and their parent questions are fetched in batches, and mapped onto ama_query records.
+        """
+        answer = {
+            "id": self.url_id,
+            "parent_id": "t1_patrick",
+            "body_html": f"&lt;div class=&quot;md&quot;&gt;&lt;p&gt;{self.answer_text}&lt;/p&gt;&lt;/div&gt;",
+        }
+        question = {
+            "id": "patrick",
+            "parent_id": "t3_cll9u5",
+            "body_html": f"&lt;div class=&quot;md&quot;&gt;&lt;p&gt;{self.question_text}&lt;/p&gt;&lt;/div&gt;",
+        }
+        answer_json = {"data": {"children": [{"kind": "t1", "data": answer}]}}
+        question_json = {"data": {"children": [{"kind": "t1", "data": question}]}}
+        mock_rget.return_value.json.side_effect = [answer_json, question_json]
+        ama_details = []
+        actual = scraper.fetch_ama_queries_json([self.url_id, "deleted"], ama_details)
+        expected = [self.ama_query]
+        self.assertListEqual(actual, expected)
+        self.assertEqual([record["url_id"] for record in ama_details], [self.url_id])
+        self.assertEqual(ama_details[0]["answer_body_html"], f"<p>{self.answer_text}</p>")
+        self.assertEqual(mock_rget.call_count, 2)
+        first_params = mock_rget.call_args_list[0].kwargs["params"]
+        self.assertEqual(first_params, {"id": f"t1_{self.url_id},t1_deleted"})
+
+    def test_save_ama_queries_to_db(self):
+        """
+        Tests that a batch of queries is saved, and that saved queries match loaded queries.
+        """
+        generic_query = {
+            "url_id": "url_id",
+            "question_text": "question_text",
+            "answer_text": "answer_text",
+            }
+        expected = [self.ama_query, generic_query]
+        full_dbpath = self.odir_path.joinpath("ama_queries-batch_test.db")
+        full_dbpath.unlink(missing_ok=True)
+        scraper.save_ama_queries_to_db(expected, full_dbpath)
+        actual = scraper.load_ama_queries_from_db(full_dbpath)
+        full_dbpath.unlink()
+        actual.sort(key=expected.index)
+        self.assertListEqual(expected, actual)
+
     def test_save_ama_query_to_db(self):
         """
         Tests that save-operation is successful, and that saved query matches loaded query.
@@ -120,3 +185,74 @@ class AmaScraperTest(unittest.TestCase):
         actual.sort(key=original_order)
         self.assertListEqual(expected, actual)
 
+    def test_parse_ama_query_details(self):
+        """
+        Tests that the details of both comments are parsed from the same page, with markup kept.
+        """
+        def make_comment(author: str, score: int, timestamp: str, body: str) -> str:
+            return f"""
+                <div class="thing comment" data-author="{author}" data-fullname="t1_x">
+                    <div class="entry">
+                        <p class="tagline">
+                            <a class="author">{author}</a>
+                            <span class="score unvoted" title="{score}">{score} points</span>
+                            <time class="live-timestamp" datetime="{timestamp}">1 year ago</time>
+                        </p>
+                        <form><div class="usertext-body"><div class="md">{body}
+                        </div></div></form>
+                    </div>
+                </div>
+            """
+        raw_page = "<div class='usertext-body'><p>Skipped.</p></div>" \
+            + make_comment("patrick", 12, "2019-08-03T17:30:00+00:00", f"<p>{self.question_text}</p>") \
+            + make_comment("DaronNefcy", -3, "2019-08-03T18:00:00+00:00", f"<blockquote><p>Quoted</p></blockquote><p><a href=\"https://example.com\">{self.answer_text}</a></p>")
+        ama_query = {}
+        ama_details = {}
+        scraper.parse_ama_query(raw_page, ama_query, ama_details)
+        # the flattened text runs the quote into the answer; the details keep them apart
+        self.assertEqual(ama_query["answer_text"], "Quoted" + self.answer_text)
+        self.assertEqual(ama_details["question_author"], "patrick")
+        self.assertEqual(ama_details["question_score"], 12)
+        self.assertEqual(ama_details["question_created_utc"], 1564853400.0)
+        self.assertEqual(ama_details["question_body_html"], f"<p>{self.question_text}</p>")
+        self.assertEqual(ama_details["answer_score"], -3)
+        self.assertEqual(
+            ama_details["answer_body_html"],
+            f"<blockquote><p>Quoted</p></blockquote><p><a href=\"https://example.com\">{self.answer_text}</a></p>",
+            )
+        self.assertIsNone(ama_details["answer_body_markdown"])
+
+    def test_get_comment_details(self):
+        """
+        Tests that JSON comments yield the same normalized HTML as HTML pages, plus their Markdown source.
+        """
+        thing = {
+            "author": "DaronNefcy",
+            "score": 42,
+            "created_utc": 1564855200,
+            "body": f"> Quoted\n\n[{self.answer_text}](https://example.com)",
+            "body_html": "&lt;div class=&quot;md&quot;&gt;&lt;p&gt;&lt;a href=&quot;https://example.com&quot;&gt;Ask&lt;/a&gt;&lt;/p&gt;\n&lt;/div&gt;",
+        }
+        expected = {
+            "author": "DaronNefcy",
+            "score": 42,
+            "created_utc": 1564855200.0,
+            "body_html": "<p><a href=\"https://example.com\">Ask</a></p>",
+            "body_markdown": thing["body"],
+        }
+        self.assertDictEqual(scraper.get_comment_details(thing), expected)
+
+    def test_save_ama_details_to_db(self):
+        """
+        Tests that details are saved and loaded, and that a later save replaces them.
+        """
+        details = {field: None for field in scraper.DETAIL_FIELDS}
+        ama_details = scraper.make_ama_details(self.url_id, dict(details, author="patrick"), dict(details, score=1))
+        full_dbpath = self.odir_path.joinpath("ama_details-save_test.db")
+        full_dbpath.unlink(missing_ok=True)
+        scraper.save_ama_details_to_db([ama_details], full_dbpath)
+        self.assertEqual(scraper.load_ama_details_from_db(full_dbpath), [ama_details])
+        updated_details = dict(ama_details, answer_score=2)
+        scraper.save_ama_details_to_db([updated_details], full_dbpath)
+        self.assertEqual(scraper.load_ama_details_from_db(full_dbpath), [updated_details])
+        full_dbpath.unlink()
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'search' module.
+- create_ama_search
+- search_ama_queries
+- create_ama_names
+- search_ama_names
+- search_ama_records
+"""
+
+from ama_archiver import search, scraper, indexer
+
+from pathlib import Path
+import sqlite3
+import unittest
+
+class AmaSearchTest(unittest.TestCase):
+    """
+    Contains tests to see that 'search' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Creates a database with `ama_search` enabled over two records.
+        """
+        self.ama_queries = [
+            {"url_id": "spongebob", "question_text": "What is the Blood Moon?", "answer_text": "A rare celestial event."},
+            {"url_id": "patrick", "question_text": "Where is Glossaryck from?", "answer_text": "Nobody knows, not even the Blood Moon."},
+        ]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_search-test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+        scraper.save_ama_queries_to_db(self.ama_queries[:1], self.full_dbpath)
+        search.create_ama_search(self.full_dbpath)
+
+    def tearDown(self):
+        """
+        Removes the test database.
+        """
+        self.full_dbpath.unlink()
+
+    def search(self, query: str) -> list:
+        """
+        Returns the url_ids matching `query`.
+        """
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            return [record["url_id"] for record in search.search_ama_queries(cnxn, query, 10)]
+
+    def test_search_ama_queries(self):
+        """
+        Tests that existing and newly inserted records are found, best match first.
+        """
+        scraper.save_ama_queries_to_db(self.ama_queries[1:], self.full_dbpath)
+        self.assertEqual(self.search("glossaryck"), ["patrick"])
+        self.assertEqual(self.search('"blood moon"'), ["spongebob", "patrick"])
+
+    def test_search_triggers(self):
+        """
+        Tests that updates and deletes in `ama_queries` are reflected in `ama_search`.
+        """
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("UPDATE ama_queries SET answer_text = 'Ask Glossaryck.' WHERE url_id = 'spongebob';")
+        self.assertEqual(self.search("glossaryck"), ["spongebob"])
+        self.assertEqual(self.search("celestial"), [])
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("DELETE FROM ama_queries WHERE url_id = 'spongebob';")
+        self.assertEqual(self.search("glossaryck"), [])
+
+    def search_names(self, name: str, **kwargs) -> list:
+        """
+        Returns the (name, kind, num_records) matching `name`.
+        """
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            return [(record["name"], record["kind"], record["num_records"]) for record in search.search_ama_names(cnxn, name, 10, **kwargs)]
+
+    def test_search_ama_names(self):
+        """
+        Tests that names are matched by shared trigrams, exact matches first, and short names by substring.
+        """
+        ama_index = [
+            {"cc_name": "Adam McArthur", "fan_name": "CoralineSparkss", "url_id": "1"},
+            {"cc_name": "Adam McArthur", "fan_name": "CoralineSparkss", "url_id": "2"},
+            {"cc_name": "Daron Nefcy", "fan_name": "Coraline", "url_id": "3"},
+            {"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "4"},
+        ]
+        indexer.bulk_save_ama_index(ama_index, self.full_dbpath)
+        search.create_ama_names(self.full_dbpath)
+        self.assertEqual(self.search_names("coraline sparks")[0], ("CoralineSparkss", "fan", 2))
+        self.assertEqual(self.search_names("CORALINE")[0], ("Coraline", "fan", 1))
+        self.assertEqual(self.search_names("nefcy"), [("Daron Nefcy", "cc", 2)])
+        self.assertEqual(self.search_names("nefcy", kind="fan"), [])
+        self.assertEqual(self.search_names("zt"), [("Joe_Zt", "fan", 1)])
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            ama_records = search.search_ama_records(cnxn, "coralinesparks", 1)
+        self.assertEqual([ama_record["url_id"] for ama_record in ama_records], ["1", "2"])
+
+    def test_search_ama_names_triggers(self):
+        """
+        Tests that inserts, deletes and updates in `ama_index` are reflected in `ama_names`.
+        """
+        indexer.bulk_save_ama_index([{"cc_name": "Daron Nefcy", "fan_name": "Joe_Zt", "url_id": "1"}], self.full_dbpath)
+        search.create_ama_names(self.full_dbpath)
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("INSERT INTO ama_index VALUES('Adam McArthur', 'Joe_Zt', '2');")
+        self.assertEqual(self.search_names("joe_zt"), [("Joe_Zt", "fan", 2)])
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("UPDATE ama_index SET fan_name = 'ShinySaturn' WHERE url_id = '2';")
+            cnxn.execute("DELETE FROM ama_index WHERE url_id = '1';")
+        self.assertEqual(self.search_names("joe_zt"), [])
+        self.assertEqual(self.search_names("shinysaturn"), [("ShinySaturn", "fan", 1)])
+        self.assertEqual(self.search_names("mcarthur"), [("Adam McArthur", "cc", 1)])
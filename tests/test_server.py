@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'server' module.
+- make_server
+"""
+
+from ama_archiver import server, indexer, scraper, search
+
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import urlopen
+import json
+import sqlite3
+import threading
+import unittest
+
+class AmaServerTest(unittest.TestCase):
+    """
+    Contains tests to see that 'server' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Serves a small database on a free port.
+        """
+        self.ama_index = [
+            {"cc_name": "cc name1", "fan_name": "fan_name1", "url_id": "1"},
+            {"cc_name": "cc name1", "fan_name": "fan_name2", "url_id": "2"},
+            {"cc_name": "cc name1", "fan_name": "fan_name3", "url_id": "1"},
+            {"cc_name": "cc name2", "fan_name": "fan_name4", "url_id": "3"},
+        ]
+        self.ama_queries = [
+            {"url_id": "1", "question_text": "What is the Blood Moon?", "answer_text": "A rare celestial event."},
+            {"url_id": "2", "question_text": "Where is Glossaryck from?", "answer_text": "Nobody knows."},
+        ]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_server-test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+        indexer.save_ama_index(self.ama_index, self.full_dbpath)
+        scraper.save_ama_queries_to_db(self.ama_queries, self.full_dbpath)
+        search.create_ama_search(self.full_dbpath)
+        search.create_ama_names(self.full_dbpath)
+        self.server = server.make_server(self.full_dbpath, port=0, pool_size=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = "http://%s:%d" % self.server.server_address
+
+    def tearDown(self):
+        """
+        Stops the server, and removes the test database.
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        while not self.server.pool.empty():
+            self.server.pool.get_nowait().close()
+        self.full_dbpath.unlink()
+
+    def get(self, path: str) -> dict:
+        """
+        Returns the JSON body of a GET of `path`.
+        """
+        with urlopen(self.base_url + path) as response:
+            return json.loads(response.read())
+
+    def test_creators(self):
+        """
+        Tests that every cc_name is listed with its record count.
+        """
+        expected = [{"cc_name": "cc name1", "num_records": 3}, {"cc_name": "cc name2", "num_records": 1}]
+        self.assertListEqual(self.get("/creators")["creators"], expected)
+
+    def test_creator_queries_pagination(self):
+        """
+        Tests that following `next` pages through every record exactly once.
+        """
+        path = "/creators/%s/queries?limit=2" % quote("cc name1")
+        first_page = self.get(path)
+        self.assertEqual([record["fan_name"] for record in first_page["queries"]], ["fan_name1", "fan_name2"])
+        second_page = self.get(path + "&after=%d" % first_page["next"])
+        self.assertEqual([record["fan_name"] for record in second_page["queries"]], ["fan_name3"])
+        self.assertIsNone(second_page["next"])
+        self.assertEqual(second_page["queries"][0]["answer_text"], "A rare celestial event.")
+
+    def test_query_by_urlid(self):
+        """
+        Tests that a url_id returns its Q&A and every record that references it, and that unknown url_ids 404.
+        """
+        body = self.get("/queries/1")
+        self.assertEqual(body["query"], self.ama_queries[0])
+        self.assertEqual(len(body["records"]), 2)
+        self.assertIsNone(body["details"])
+        with self.assertRaises(HTTPError) as http_err:
+            self.get("/queries/404")
+        self.assertEqual(http_err.exception.code, 404)
+
+    def test_unscraped_database(self):
+        """
+        Tests that a database with no `ama_queries` yet is served, and that other database errors are answered with a JSON 500.
+        """
+        full_dbpath = self.odir_path.joinpath("ama_server-unscraped_test.db")
+        full_dbpath.unlink(missing_ok=True)
+        indexer.save_ama_index(self.ama_index, full_dbpath)
+        unscraped_server = server.make_server(full_dbpath, port=0, pool_size=1)
+        threading.Thread(target=unscraped_server.serve_forever, daemon=True).start()
+        base_url = "http://%s:%d" % unscraped_server.server_address
+        try:
+            with urlopen(base_url + "/queries/1") as response:
+                body = json.loads(response.read())
+            self.assertIsNone(body["query"])
+            self.assertEqual(len(body["records"]), 2)
+            with urlopen(base_url + "/creators/%s/queries" % quote("cc name1")) as response:
+                body = json.loads(response.read())
+            self.assertEqual([record["question_text"] for record in body["queries"]], [None] * 3)
+            with sqlite3.connect(full_dbpath) as cnxn:
+                cnxn.execute("ALTER TABLE ama_index RENAME TO old_index;")
+            with self.assertRaises(HTTPError) as http_err:
+                urlopen(base_url + "/creators")
+            self.assertEqual(http_err.exception.code, 500)
+            self.assertIn("no such table", json.loads(http_err.exception.read())["error"])
+        finally:
+            unscraped_server.shutdown()
+            unscraped_server.server_close()
+            while not unscraped_server.pool.empty():
+                unscraped_server.pool.get_nowait().close()
+            full_dbpath.unlink()
+
+    def test_search(self):
+        """
+        Tests that full-text search finds records by their text.
+        """
+        body = self.get("/search?q=glossaryck")
+        self.assertEqual([record["url_id"] for record in body["queries"]], ["2"])
+
+    def test_response_cache(self):
+        """
+        Tests that repeated requests are answered from the cache.
+        """
+        self.get("/creators")
+        self.get("/creators")
+        self.assertEqual(self.server.get_response.cache_info().hits, 1)
+
+    def test_names(self):
+        """
+        Tests that names are found by fuzzy match, and that /fans returns the records of the best match.
+        """
+        body = self.get("/names?q=%s&kind=cc" % quote("CC NAME2"))
+        self.assertEqual([record["name"] for record in body["names"]], ["cc name2", "cc name1"])
+        body = self.get("/fans?q=fan_nam1&limit=1")
+        self.assertEqual([record["url_id"] for record in body["records"]], ["1"])
+        with self.assertRaises(HTTPError) as http_err:
+            self.get("/names")
+        self.assertEqual(http_err.exception.code, 400)
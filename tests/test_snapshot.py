@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'snapshot' module.
+- fetch_thread_snapshot
+- save_snapshot
+- load_snapshot
+- resolve_ama_queries
+"""
+
+from ama_archiver import snapshot
+
+from pathlib import Path
+import unittest
+from unittest.mock import patch
+
+class AmaSnapshotTest(unittest.TestCase):
+    """
+    Contains tests to see that 'snapshot' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Contains a small comment tree, with one reply hidden behind a "load more comments" stub.
+
+        question: Top-level comment asking a question.
+        answer: Reply to `question`; its id is the url_id.
+        hidden_answer: Reply to `question` that is only returned by MORECHILDREN_URL.
+        thread_json: JSON returned for the thread itself.
+        more_json: JSON returned by MORECHILDREN_URL.
+        """
+        self.question = {"id": "patrick", "parent_id": "t3_cll9u5", "body": "Is mayonnaise an instrument?"}
+        self.answer = {"id": "spongebob", "parent_id": "t1_patrick", "body": "No, Patrick."}
+        self.hidden_answer = {"id": "squidward", "parent_id": "t1_patrick", "body": "Horseradish is not one either."}
+        more = {"kind": "more", "data": {"id": "squidward", "parent_id": "t1_patrick", "children": ["squidward"]}}
+        answer_data = dict(self.answer, replies="")
+        question_data = dict(self.question, replies={"data": {"children": [{"kind": "t1", "data": answer_data}, more]}})
+        self.thread_json = [
+            {"data": {"children": [{"kind": "t3", "data": {"id": "cll9u5"}}]}},
+            {"data": {"children": [{"kind": "t1", "data": question_data}]}},
+        ]
+        self.more_json = {"json": {"data": {"things": [{"kind": "t1", "data": self.hidden_answer}]}}}
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+
+    @patch("requests.get")
+    def test_fetch_thread_snapshot(self, mock_rget):
+        """
+        Tests that nested replies and "load more comments" stubs are all collected into one dict.
+        """
+        mock_rget.return_value.json.side_effect = [self.thread_json, self.more_json]
+        comments = snapshot.fetch_thread_snapshot()
+        self.assertEqual(set(comments), {"patrick", "spongebob", "squidward"})
+        self.assertEqual(comments["squidward"]["body"], self.hidden_answer["body"])
+        self.assertEqual(mock_rget.call_count, 2)
+
+    def test_save_and_load_snapshot(self):
+        """
+        Tests that a saved snapshot is loaded as it was.
+        """
+        comments = {"patrick": self.question, "spongebob": self.answer}
+        full_path = self.odir_path.joinpath("snapshot-save_test.json")
+        snapshot.save_snapshot(comments, full_path)
+        actual = snapshot.load_snapshot(full_path)
+        full_path.unlink()
+        self.assertDictEqual(actual, comments)
+
+    def test_resolve_ama_queries(self):
+        """
+        Tests that each url_id is paired with its parent's text, and that missing url_ids are skipped.
+        """
+        comments = {"patrick": self.question, "spongebob": self.answer}
+        expected = [
+            {"url_id": "spongebob", "question_text": self.question["body"], "answer_text": self.answer["body"]},
+        ]
+        actual = snapshot.resolve_ama_queries(comments, ["spongebob", "plankton"])
+        self.assertListEqual(actual, expected)
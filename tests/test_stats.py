@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+"""
+Contains tests for the functions defined in the 'stats' module.
+- create_ama_stats
+- load_ama_stats
+"""
+
+from ama_archiver import stats, indexer, scraper, recheck
+
+from pathlib import Path
+import sqlite3
+import unittest
+
+class AmaStatsTest(unittest.TestCase):
+    """
+    Contains tests to see that 'stats' module works as intended.
+    """
+
+    def setUp(self):
+        """
+        Creates a database with `ama_stats` enabled.
+
+        ama_index: Records to index; url_id '1' is shared by two fans.
+        ama_queries: Records to scrape; url_id '3' has an empty answer, and url_id '4' is missing.
+        """
+        self.ama_index = [
+            {"cc_name": "cc_name1", "fan_name": "fan_name1", "url_id": "1"},
+            {"cc_name": "cc_name1", "fan_name": "fan_name2", "url_id": "2"},
+            {"cc_name": "cc_name1", "fan_name": "fan_name3", "url_id": "1"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name4", "url_id": "3"},
+            {"cc_name": "cc_name2", "fan_name": "fan_name5", "url_id": "4"},
+        ]
+        self.ama_queries = [
+            {"url_id": "1", "question_text": "abcd", "answer_text": "abcdefgh"},
+            {"url_id": "2", "question_text": "ab", "answer_text": "ab"},
+            {"url_id": "3", "question_text": "abcdef", "answer_text": ""},
+        ]
+        self.odir_path = Path("tests", "mock-output")
+        self.odir_path.mkdir(exist_ok=True)
+        self.full_dbpath = self.odir_path.joinpath("ama_stats-test.db")
+        self.full_dbpath.unlink(missing_ok=True)
+
+    def tearDown(self):
+        """
+        Removes the test database.
+        """
+        self.full_dbpath.unlink()
+
+    def load_rebuilt_stats(self) -> list:
+        """
+        Returns `ama_stats` as it would be if recomputed from scratch.
+        """
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            stats.rebuild_ama_stats(cnxn)
+        return stats.load_ama_stats(self.full_dbpath)
+
+    def test_create_ama_stats(self):
+        """
+        Tests that `ama_stats` is filled from existing tables, with derived fields.
+        """
+        indexer.save_ama_index(self.ama_index, self.full_dbpath)
+        scraper.save_ama_queries_to_db(self.ama_queries, self.full_dbpath)
+        stats.create_ama_stats(self.full_dbpath)
+        expected = {
+            "cc_name": "cc_name1",
+            "num_questions": 3,
+            "num_answered": 3,
+            "num_empty_answers": 0,
+            "total_question_length": 10,
+            "total_answer_length": 18,
+            "num_duplicates": 2,
+            "num_missing_answers": 0,
+            "avg_question_length": 10 / 3,
+            "avg_answer_length": 6.0,
+        }
+        self.assertListEqual(stats.load_ama_stats(self.full_dbpath, "cc_name1"), [expected])
+        cc_stats = stats.load_ama_stats(self.full_dbpath, "cc_name2")[0]
+        self.assertEqual(cc_stats["num_missing_answers"], 2)
+        self.assertEqual(cc_stats["num_duplicates"], 0)
+
+    def test_ama_stats_triggers(self):
+        """
+        Tests that inserts, updates and deletes keep `ama_stats` equal to a full recomputation.
+        """
+        stats.create_ama_stats(self.full_dbpath)
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.executemany("INSERT INTO ama_index VALUES(:cc_name, :fan_name, :url_id);", self.ama_index[:3])
+        scraper.save_ama_queries_to_db(self.ama_queries, self.full_dbpath)
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.executemany("INSERT INTO ama_index VALUES(:cc_name, :fan_name, :url_id);", self.ama_index[3:])
+            cnxn.execute("INSERT INTO ama_index VALUES('cc_name2', 'fan_name6', '2');")
+        incremental = stats.load_ama_stats(self.full_dbpath)
+        self.assertListEqual(incremental, self.load_rebuilt_stats())
+        recheck.init_ama_checks(self.full_dbpath)
+        recheck.record_ama_check({"url_id": "1", "question_text": "a", "answer_text": ""}, self.full_dbpath)
+        indexer.refresh_ama_index(self.ama_index[1:], self.full_dbpath)
+        with sqlite3.connect(self.full_dbpath) as cnxn:
+            cnxn.execute("DELETE FROM ama_queries WHERE url_id = '2';")
+        incremental = stats.load_ama_stats(self.full_dbpath)
+        self.assertListEqual(incremental, self.load_rebuilt_stats())
+
+    def test_ama_stats_index_update(self):
+        """
+        Tests that updating the url_id or cc_name of `ama_index` rows in place keeps `ama_stats` equal to a full recomputation.
+        """
+        indexer.save_ama_index(self.ama_index, self.full_dbpath)
+        scraper.save_ama_queries_to_db(self.ama_queries, self.full_dbpath)
+        stats.create_ama_stats(self.full_dbpath)
+        updates = (
+            # onto a url_id with an empty answer, and off a shared one
+            "UPDATE ama_index SET url_id = '3' WHERE fan_name = 'fan_name3';",
+            # onto a missing url_id
+            "UPDATE ama_index SET url_id = '4' WHERE fan_name = 'fan_name2';",
+            # to another creator, keeping the shared url_id
+            "UPDATE ama_index SET cc_name = 'cc_name2' WHERE fan_name = 'fan_name1';",
+            # to a new creator, and onto a shared url_id at once
+            "UPDATE ama_index SET cc_name = 'cc_name3', url_id = '1' WHERE fan_name = 'fan_name5';",
+            # to the same values
+            "UPDATE ama_index SET url_id = url_id, cc_name = cc_name;",
+            )
+        for update in updates:
+            with sqlite3.connect(self.full_dbpath) as cnxn:
+                cnxn.execute(update)
+            incremental = stats.load_ama_stats(self.full_dbpath)
+            self.assertListEqual([cc_stats for cc_stats in incremental if cc_stats["num_questions"]], self.load_rebuilt_stats(), update)